@@ -18,11 +18,19 @@
     'depends': [
         'base',
         'web',
+        'bus',
     ],
     'data': [
+        'security/ir.model.access.csv',
+        'data/webapp_config_data.xml',
         'views/webapp_views.xml',
+        'views/telegram_templates.xml',
+        'views/user_cabinet_templates.xml',
+        'views/role_specific_templates.xml',
+        'views/additional_templates.xml',
     ],
     'demo': [],
+    'post_load': 'post_load',
     'installable': True,
     'application': True,
     'auto_install': False,
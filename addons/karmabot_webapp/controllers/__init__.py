@@ -1,3 +1,6 @@
 # -*- coding: utf-8 -*-
 
 from . import main
+from . import qr_controller
+from . import telegram_controller
+from . import webapp_controller
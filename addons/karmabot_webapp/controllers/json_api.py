@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+from odoo.http import request
+import functools
+
+from ..tools.json_response import dumps, encode_body, loads
+
+
+def json_response(result, rpc_id=None, envelope=False, status=200):
+    """Ответ JSON API; клиенты JSON-RPC получают конверт, REST-клиенты - сам результат"""
+    if envelope:
+        result = {'jsonrpc': '2.0', 'id': rpc_id, 'result': result}
+    body, encoding = encode_body(dumps(result), request.httprequest.headers.get('Accept-Encoding'))
+    headers = [
+        ('Content-Type', 'application/json'),
+        ('Content-Length', str(len(body))),
+        ('Vary', 'Accept-Encoding'),
+    ]
+    if encoding:
+        headers.append(('Content-Encoding', encoding))
+    return request.make_response(body, headers=headers, status=status)
+
+
+def json_api(func):
+    """Маршрут JSON API поверх type='http': принимает JSON-RPC и простой JSON.
+
+    Метод получает параметры запроса первым аргументом и возвращает словарь.
+    """
+    @functools.wraps(func)
+    def wrapper(self, **kw):
+        # Кросс-доменная форма не может отправить application/json без CORS-проверки,
+        # поэтому маршруты с сессионной авторизацией обходятся без CSRF-токена
+        if request.httprequest.mimetype != 'application/json':
+            return json_response({'error': 'Expected application/json'}, status=415)
+        try:
+            body = loads(request.httprequest.get_data() or b'{}')
+        except ValueError:
+            return json_response({'error': 'Invalid JSON'}, status=400)
+        envelope = isinstance(body, dict) and body.get('jsonrpc') == '2.0'
+        params = body.get('params') if envelope else body
+        result = func(self, params if isinstance(params, dict) else {}, **kw)
+        return json_response(result, body.get('id') if envelope else None, envelope)
+    return wrapper
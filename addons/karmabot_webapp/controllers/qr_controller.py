@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+from odoo import http
+from odoo.http import request
+import base64
+
+from ..models.qr_code import QR_FORMATS
+
+# Изображения адресуются по содержимому и никогда не меняются
+QR_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class QRController(http.Controller):
+    
+    @http.route('/karmabot/qr/<string:image_format>/<string:checksum>', type='http', auth='public', methods=['GET'])
+    def qr_image(self, image_format, checksum, **kw):
+        """Отдать готовое QR-изображение карты"""
+        mimetype = QR_FORMATS.get(image_format)
+        if not mimetype:
+            return request.not_found()
+        
+        headers = [
+            ('Cache-Control', QR_CACHE_CONTROL),
+            ('ETag', f'"{checksum}"'),
+        ]
+        
+        # ETag совпадает с адресом, поэтому проверка не требует обращения к базе
+        if f'"{checksum}"' in request.httprequest.headers.get('If-None-Match', ''):
+            return request.make_response(b'', headers=headers, status=304)
+        
+        qr = request.env['karmabot.qr.code'].sudo().search([
+            ('checksum', '=', checksum),
+            ('image_format', '=', image_format)
+        ], limit=1)
+        
+        if not qr or not qr.content:
+            return request.not_found()
+        
+        content = base64.b64decode(qr.content)
+        headers += [
+            ('Content-Type', mimetype),
+            ('Content-Length', str(len(content))),
+        ]
+        return request.make_response(content, headers=headers)
@@ -12,33 +12,27 @@ class TelegramController(http.Controller):
         })
     
     @http.route('/telegram/auth', type='http', auth='public', methods=['POST'], website=False)
-    def telegram_auth(self, telegram_id=None, username=None, **kw):
-        """Аутентификация Telegram пользователя"""
-        
-        if not telegram_id:
-            return request.redirect('/telegram/login')
-        
-        # Найти или создать пользователя
-        user = request.env['res.users'].sudo().search([
-            ('login', '=', f'telegram_{telegram_id}')
-        ], limit=1)
+    def telegram_auth(self, init_data=None, **kw):
+        """Аутентификация Telegram пользователя по подписанным initData"""
         
+        # Подпись проверяется HMAC с закэшированным ключом, без res.users и хэширования паролей
+        user = request.env['karmabot.user'].sudo().authenticate_telegram(init_data)
         if not user:
-            # Создать нового пользователя
-            user = request.env['res.users'].sudo().create({
-                'name': username or f'Telegram User {telegram_id}',
-                'login': f'telegram_{telegram_id}',
-                'email': f'telegram_{telegram_id}@example.com',
-                'password': telegram_id,  # Простой пароль для демо
-            })
+            return request.redirect('/telegram/login')
         
-        # Вход в систему
-        request.session.authenticate(request.session.db, user.login, telegram_id)
+        # Привязать сессию к пользователю KarmaBot
+        request.session['karmabot_user_id'] = user.id
+        request.session.should_rotate = True
         return request.redirect('/telegram/cabinet')
     
-    @http.route('/telegram/cabinet', type='http', auth='user', website=False)
+    @http.route('/telegram/cabinet', type='http', auth='public', website=False)
     def telegram_cabinet(self, **kw):
         """Личный кабинет"""
+        user_id = request.session.get('karmabot_user_id')
+        user = request.env['karmabot.user'].sudo().browse(user_id).exists() if user_id else None
+        if not user:
+            return request.redirect('/telegram/login')
+        
         return request.render('karmabot_webapp.telegram_cabinet_simple', {
-            'user': request.env.user,
-        })
\ No newline at end of file
+            'user': user,
+        })
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 
 from odoo import http, fields, _
-from odoo.http import request
+from odoo.http import request, Response, content_disposition
+from odoo.exceptions import ValidationError
 import logging
 import json
+from datetime import timedelta
+from psycopg2.errors import UniqueViolation
+
+from .json_api import json_api
+from ..tools.json_response import project
+from ..tools.export_formats import EXPORT_FORMATS
 
 _logger = logging.getLogger(__name__)
 
@@ -23,9 +30,15 @@ class KarmaBotWebAppController(http.Controller):
                 
                 if user:
                     # Пользователь найден - показать личный кабинет
+                    # Каналы шины для обновлений баланса и уведомлений без опроса сервера.
+                    # Подписанные имена каналов выдаются только владельцу сессии
+                    push_channels = None
+                    if user == self._get_session_user():
+                        push_channels = json.dumps(request.env['karmabot.notification.service'].sudo().get_channels(user))
                     return request.render('karmabot_webapp.user_cabinet', {
                         'user': user,
-                        'is_registered': True
+                        'is_registered': True,
+                        'push_channels': push_channels
                     })
                 else:
                     # Пользователь не найден - показать форму регистрации
@@ -96,12 +109,11 @@ class KarmaBotWebAppController(http.Controller):
                 'error': 'An error occurred. Please try again.'
             })
     
-    @http.route('/webapp/api/cabinet-url', type='json', auth='public', methods=['POST'])
-    def get_cabinet_url(self, **kw):
+    @http.route('/webapp/api/cabinet-url', type='http', auth='public', methods=['POST'], csrf=False)
+    @json_api
+    def get_cabinet_url(self, data, **kw):
         """Get cabinet URL based on user role"""
         try:
-            data = request.jsonrequest
-            
             if 'sso_token' not in data:
                 return {'error': 'SSO token required'}
             
@@ -145,12 +157,11 @@ class KarmaBotWebAppController(http.Controller):
             _logger.error(f"Error in get_cabinet_url: {e}")
             return {'error': 'An error occurred while generating cabinet URL'}
     
-    @http.route('/webapp/api/user-info', type='json', auth='public', methods=['POST'])
-    def get_user_info(self, **kw):
+    @http.route('/webapp/api/user-info', type='http', auth='public', methods=['POST'], csrf=False)
+    @json_api
+    def get_user_info(self, data, **kw):
         """Get user information for WebApp"""
         try:
-            data = request.jsonrequest
-            
             if 'sso_token' not in data:
                 return {'error': 'SSO token required'}
             
@@ -180,7 +191,7 @@ class KarmaBotWebAppController(http.Controller):
             
             return {
                 'success': True,
-                'user_info': {
+                'user_info': project({
                     'id': user.id,
                     'telegram_id': user.telegram_id,
                     'name': user.name,
@@ -195,19 +206,18 @@ class KarmaBotWebAppController(http.Controller):
                     'total_referrals': user.total_referrals,
                     'is_active': user.is_active,
                     'is_verified': user.is_verified,
-                }
+                }, data.get('fields'))
             }
             
         except Exception as e:
             _logger.error(f"Error in get_user_info: {e}")
             return {'error': 'An error occurred while fetching user info'}
     
-    @http.route('/webapp/api/heartbeat', type='json', auth='public', methods=['POST'])
-    def heartbeat(self, **kw):
+    @http.route('/webapp/api/heartbeat', type='http', auth='public', methods=['POST'], csrf=False)
+    @json_api
+    def heartbeat(self, data, **kw):
         """Update session activity"""
         try:
-            data = request.jsonrequest
-            
             if 'sso_token' not in data:
                 return {'error': 'SSO token required'}
             
@@ -235,7 +245,7 @@ class KarmaBotWebAppController(http.Controller):
             if active_session:
                 active_session.update_activity()
             
-            return {'success': True, 'timestamp': fields.Datetime.now().isoformat()}
+            return {'success': True, 'timestamp': fields.Datetime.now()}
             
         except Exception as e:
             _logger.error(f"Error in heartbeat: {e}")
@@ -266,69 +276,97 @@ class KarmaBotWebAppController(http.Controller):
             _logger.error(f"Error validating SSO token: {e}")
             return None
     
-    @http.route('/karmabot/webapp/register', type='json', auth='public', methods=['POST'])
-    def register_user(self, **kw):
+    @http.route('/karmabot/webapp/register', type='http', auth='public', methods=['POST'], csrf=False)
+    @json_api
+    def register_user(self, data, **kw):
         """Регистрация нового пользователя"""
         try:
-            data = request.jsonrequest
-            
             # Проверить обязательные поля
             if not data.get('telegram_id') or not data.get('full_name'):
                 return {'success': False, 'error': 'Не заполнены обязательные поля'}
             
-            # Проверить, не зарегистрирован ли уже пользователь
-            existing_user = request.env['karmabot.user'].sudo().search([
-                ('telegram_id', '=', str(data['telegram_id']))
-            ], limit=1)
-            
-            if existing_user:
-                return {'success': False, 'error': 'Пользователь уже зарегистрирован'}
-            
-            # Создать нового пользователя
-            user_vals = {
-                'telegram_id': str(data['telegram_id']),
-                'display_name': data['full_name'],
-                'telegram_username': data.get('username', ''),
-                'phone': data.get('phone', ''),
-                'email': data.get('email', ''),
-                'city': data.get('city', ''),
-                'role': 'user',
-                'total_points': 0,
-                'available_points': 0,
-                'pending_points': 0,
-                'is_active': True,
-                'is_verified': False,
-                'registration_date': fields.Datetime.now(),
-                'last_activity': fields.Datetime.now()
-            }
-            
-            new_user = request.env['karmabot.user'].sudo().create(user_vals)
-            
-            # Создать партнера в Odoo
-            partner_vals = {
-                'name': data['full_name'],
-                'phone': data.get('phone', ''),
-                'email': data.get('email', ''),
-                'customer_rank': 1,
-                'is_company': False,
-                'active': True
-            }
-            
-            partner = request.env['res.partner'].sudo().create(partner_vals)
-            
-            # Связать пользователя с партнером
-            new_user.write({'partner_id': partner.id})
-            
-            return {
-                'success': True,
-                'message': 'Регистрация успешно завершена',
-                'user_id': new_user.id
-            }
+            # Повтор запроса с тем же ключом вернет сохраненный ответ
+            idempotency_key = self._get_idempotency_key(data)
+            if idempotency_key:
+                return request.env['karmabot.idempotency.key'].sudo().execute(
+                    f"register:{data['telegram_id']}", idempotency_key, data, lambda: self._register_user(data))
+            return self._register_user(data)
             
         except Exception as e:
             _logger.error(f"Error in register_user: {e}")
             return {'success': False, 'error': 'Произошла ошибка при регистрации'}
     
+    def _get_idempotency_key(self, data):
+        """Ключ идемпотентности из заголовка Idempotency-Key или тела запроса"""
+        return request.httprequest.headers.get('Idempotency-Key') or data.pop('idempotency_key', None)
+    
+    def _register_user(self, data):
+        """Создать пользователя, партнера Odoo и реферальную связь"""
+        # Проверить, не зарегистрирован ли уже пользователь
+        existing_user = request.env['karmabot.user'].sudo().search([
+            ('telegram_id', '=', str(data['telegram_id']))
+        ], limit=1)
+        
+        if existing_user:
+            return {'success': False, 'error': 'Пользователь уже зарегистрирован'}
+        
+        # Создать нового пользователя
+        user_vals = {
+            'telegram_id': str(data['telegram_id']),
+            'display_name': data['full_name'],
+            'telegram_username': data.get('username', ''),
+            'phone': data.get('phone', ''),
+            'email': data.get('email', ''),
+            'city': data.get('city', ''),
+            'role': 'user',
+            'total_points': 0,
+            'available_points': 0,
+            'pending_points': 0,
+            'is_active': True,
+            'is_verified': False,
+            'registration_date': fields.Datetime.now(),
+            'last_activity': fields.Datetime.now()
+        }
+        
+        # Параллельная регистрация того же telegram_id упрется в уникальный индекс
+        try:
+            with request.env.cr.savepoint():
+                new_user = request.env['karmabot.user'].sudo().create(user_vals)
+        except UniqueViolation:
+            return {'success': False, 'error': 'Пользователь уже зарегистрирован'}
+        
+        # Создать партнера в Odoo
+        partner_vals = {
+            'name': data['full_name'],
+            'phone': data.get('phone', ''),
+            'email': data.get('email', ''),
+            'customer_rank': 1,
+            'is_company': False,
+            'active': True
+        }
+        
+        partner = request.env['res.partner'].sudo().create(partner_vals)
+        
+        # Связать пользователя с партнером
+        new_user.write({'partner_id': partner.id})
+        
+        # Привязать к пригласившему пользователю
+        if data.get('referrer_id'):
+            referrer = request.env['karmabot.user'].sudo().search([
+                ('telegram_id', '=', str(data['referrer_id']))
+            ], limit=1)
+            if referrer:
+                request.env['karmabot.referral'].sudo().create({
+                    'referrer_id': referrer.id,
+                    'referred_id': new_user.id
+                })
+        
+        return {
+            'success': True,
+            'message': 'Регистрация успешно завершена',
+            'user_id': new_user.id
+        }
+    
     @http.route('/karmabot/webapp/cards', type='http', auth='public')
     def user_cards(self, user_id=None, **kw):
         """Страница карт пользователя"""
@@ -357,6 +395,67 @@ class KarmaBotWebAppController(http.Controller):
             _logger.error(f"Error in user_cards: {e}")
             return request.render('karmabot_webapp.user_cabinet', {'error': 'Ошибка загрузки карт'})
     
+    @http.route('/karmabot/webapp/cards/search', type='http', auth='public')
+    def cards_search(self, q=None, offset=0, **kw):
+        """Поиск заведений-партнеров"""
+        try:
+            if not request.env['karmabot.setting'].is_enabled('search'):
+                return request.render('karmabot_webapp.user_cabinet', {'error': 'Поиск отключен'})
+            
+            results = request.env['karmabot.search.service'].sudo().search_cards(q, offset=int(offset or 0))
+            
+            return request.render('karmabot_webapp.cards_search', {
+                'query': q or '',
+                'cards': results['results'],
+                'has_more': results['has_more'],
+                'next_offset': results['offset'] + len(results['results'])
+            })
+            
+        except Exception as e:
+            _logger.error(f"Error in cards_search: {e}")
+            return request.render('karmabot_webapp.user_cabinet', {'error': 'Ошибка поиска'})
+    
+    @http.route('/karmabot/webapp/search/autocomplete', type='http', auth='public', methods=['POST'], csrf=False)
+    @json_api
+    def search_autocomplete(self, data, **kw):
+        """Подсказки для строки поиска"""
+        try:
+            if not request.env['karmabot.setting'].is_enabled('search'):
+                return {'success': False, 'error': 'Поиск отключен'}
+            
+            # Подсказки по пользователям доступны только админам, вошедшим через Telegram
+            include_users = bool(self._get_session_user(['admin', 'super_admin']))
+            
+            suggestions = request.env['karmabot.search.service'].sudo().autocomplete(
+                data.get('q'), include_users=include_users)
+            return {'success': True, 'suggestions': suggestions}
+            
+        except Exception as e:
+            _logger.error(f"Error in search_autocomplete: {e}")
+            return {'success': False, 'error': 'Ошибка поиска'}
+    
+    @http.route('/karmabot/webapp/cards/nearby', type='http', auth='public', methods=['POST'], csrf=False)
+    @json_api
+    def cards_nearby(self, data, **kw):
+        """Заведения-партнеры рядом с пользователем"""
+        try:
+            if not request.env['karmabot.setting'].is_enabled('nearby'):
+                return {'success': False, 'error': 'Поиск рядом отключен'}
+            
+            if data.get('latitude') is None or data.get('longitude') is None:
+                return {'success': False, 'error': 'Не указаны координаты'}
+            
+            cards = request.env['karmabot.partner.card'].sudo().find_nearby(
+                data['latitude'], data['longitude'],
+                radius_km=data.get('radius_km') or 5,
+                limit=min(int(data.get('limit') or 20), 100)
+            )
+            return {'success': True, 'cards': cards}
+            
+        except Exception as e:
+            _logger.error(f"Error in cards_nearby: {e}")
+            return {'success': False, 'error': 'Ошибка поиска'}
+    
     @http.route('/karmabot/webapp/history', type='http', auth='public', )
     def user_history(self, user_id=None, **kw):
         """Страница истории операций"""
@@ -371,10 +470,8 @@ class KarmaBotWebAppController(http.Controller):
             if not user:
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Пользователь не найден'})
             
-            # Получить транзакции пользователя
-            transactions = request.env['karmabot.loyalty.transaction'].sudo().search([
-                ('user_id', '=', user.id)
-            ], order='create_date desc', limit=20)
+            # Получить последние транзакции пользователя
+            transactions = request.env['karmabot.loyalty.transaction'].sudo().get_user_transactions(user.id)
             
             return request.render('karmabot_webapp.user_history', {
                 'user': user,
@@ -471,15 +568,17 @@ class KarmaBotWebAppController(http.Controller):
             if not user:
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Пользователь не найден'})
             
-            # Получить статистику
-            stats = {
+            # Помесячные итоги, партнеры и серии - из готового снимка одной строкой
+            with request.env['karmabot.replica.service'].read_env() as env:
+                stats = env['karmabot.user.stats'].sudo().get_stats(user.id)
+            stats.update({
                 'total_points': user.total_points,
                 'available_points': user.available_points,
                 'total_scans': user.total_scans,
                 'total_referrals': user.total_referrals,
                 'registration_date': user.registration_date,
                 'last_activity': user.last_activity
-            }
+            })
             
             return request.render('karmabot_webapp.user_statistics', {
                 'user': user,
@@ -521,6 +620,9 @@ class KarmaBotWebAppController(http.Controller):
             if not user_id:
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Не указан ID пользователя'})
             
+            if not request.env['karmabot.setting'].is_enabled('referrals'):
+                return request.render('karmabot_webapp.user_cabinet', {'error': 'Реферальная программа отключена'})
+            
             user = request.env['karmabot.user'].sudo().search([
                 ('telegram_id', '=', str(user_id))
             ], limit=1)
@@ -528,14 +630,72 @@ class KarmaBotWebAppController(http.Controller):
             if not user:
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Пользователь не найден'})
             
+            # Получить прямых рефералов и количество по уровням
+            Referral = request.env['karmabot.referral'].sudo()
+            referrals = Referral.search([
+                ('referrer_id', '=', user.id)
+            ], limit=50)
+            downline_counts = Referral.get_downline_counts(user.id)
+            
             return request.render('karmabot_webapp.user_referrals', {
-                'user': user
+                'user': user,
+                'referrals': referrals,
+                'downline_counts': downline_counts
             })
             
         except Exception as e:
             _logger.error(f"Error in user_referrals: {e}")
             return request.render('karmabot_webapp.user_cabinet', {'error': 'Ошибка загрузки рефералов'})
     
+    @http.route('/karmabot/webapp/scan', type='http', auth='public', methods=['POST'], csrf=False)
+    @json_api
+    def scan_card(self, data, **kw):
+        """Начисление баллов по подписанному QR-скану"""
+        try:
+            if not data.get('telegram_id') or not data.get('token'):
+                return {'success': False, 'error': 'Не заполнены обязательные поля'}
+            
+            # Повтор с тем же ключом вернет исходный ответ, а не ошибку повторного скана
+            idempotency_key = self._get_idempotency_key(data)
+            if idempotency_key:
+                return request.env['karmabot.idempotency.key'].sudo().execute(
+                    f"scan:{data['telegram_id']}", idempotency_key, data, lambda: self._scan_card(data))
+            return self._scan_card(data)
+            
+        except Exception as e:
+            _logger.error(f"Error in scan_card: {e}")
+            return {'success': False, 'error': 'Ошибка обработки скана'}
+    
+    def _scan_card(self, data):
+        """Проверить токен скана и начислить баллы"""
+        # Проверка подписи и повтора выполняется до обращения к базе
+        ScanService = request.env['karmabot.scan.service'].sudo()
+        payload, error = ScanService.verify_token(data['token'])
+        if error:
+            return {'success': False, 'error': error}
+        
+        user = request.env['karmabot.user'].sudo().search([
+            ('telegram_id', '=', str(data['telegram_id']))
+        ], limit=1)
+        
+        if not user:
+            return {'success': False, 'error': 'Пользователь не найден'}
+        
+        return ScanService.credit_scan(payload, user)
+    
+    def _get_session_user(self, roles=None):
+        """Пользователь, привязанный к сессии при входе через /telegram/auth.
+
+        Привилегированные действия авторизуются только по сессии: telegram_id из
+        тела или параметров запроса может подставить кто угодно.
+        """
+        User = request.env['karmabot.user'].sudo()
+        user_id = request.session.get('karmabot_user_id')
+        user = User.browse(user_id).exists() if user_id else User
+        if roles and user.role not in roles:
+            return User
+        return user
+    
     # === КОНТРОЛЛЕРЫ ДЛЯ ПАРТНЕРОВ (PARTNER) ===
     
     @http.route('/karmabot/webapp/partner/cards', type='http', auth='public', )
@@ -580,8 +740,13 @@ class KarmaBotWebAppController(http.Controller):
             if not user or user.role != 'partner':
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Доступ запрещен'})
             
+            # Статистика из дневных агрегатов
+            with request.env['karmabot.replica.service'].read_env() as env:
+                summary = env['karmabot.partner.daily.stat'].sudo().get_partner_summary(user.partner_id.id)
+            
             return request.render('karmabot_webapp.partner_analytics', {
-                'user': user
+                'user': user,
+                'summary': summary
             })
             
         except Exception as e:
@@ -602,8 +767,15 @@ class KarmaBotWebAppController(http.Controller):
             if not user or user.role != 'partner':
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Доступ запрещен'})
             
+            # Активные карточки с готовыми QR-изображениями
+            cards = request.env['karmabot.partner.card'].sudo().search([
+                ('partner_id', '=', user.partner_id.id),
+                ('status', '=', 'active')
+            ])
+            
             return request.render('karmabot_webapp.partner_qr', {
-                'user': user
+                'user': user,
+                'cards': cards
             })
             
         except Exception as e:
@@ -624,8 +796,16 @@ class KarmaBotWebAppController(http.Controller):
             if not user or user.role != 'partner':
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Доступ запрещен'})
             
+            # Клиенты и счетчики из агрегатов
+            with request.env['karmabot.replica.service'].read_env() as env:
+                summary = env['karmabot.partner.daily.stat'].sudo().get_partner_summary(user.partner_id.id)
+            clients = request.env['karmabot.partner.client'].sudo().get_clients(user.partner_id.id)
+            
             return request.render('karmabot_webapp.partner_clients', {
-                'user': user
+                'user': user,
+                'client_counts': summary['clients'],
+                'clients': clients,
+                'month_scans': summary['total_scans']
             })
             
         except Exception as e:
@@ -648,20 +828,45 @@ class KarmaBotWebAppController(http.Controller):
             if not user or user.role not in ['admin', 'super_admin']:
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Доступ запрещен'})
             
-            # Получить карточки на модерацию
-            pending_cards = request.env['karmabot.partner.card'].sudo().search([
-                ('status', '=', 'pending')
-            ])
+            # Захватить пакет карточек из очереди модерации
+            PartnerCard = request.env['karmabot.partner.card'].sudo()
+            pending_cards = PartnerCard.claim_moderation_batch(user.id)
+            pending_count = PartnerCard.search_count([('status', '=', 'pending')])
             
             return request.render('karmabot_webapp.admin_moderation', {
                 'user': user,
-                'pending_cards': pending_cards
+                'pending_cards': pending_cards,
+                'pending_count': pending_count
             })
             
         except Exception as e:
             _logger.error(f"Error in admin_moderation: {e}")
             return request.render('karmabot_webapp.user_cabinet', {'error': 'Ошибка загрузки модерации'})
     
+    @http.route('/karmabot/webapp/admin/moderation/decide', type='http', auth='public', methods=['POST'], csrf=False)
+    @json_api
+    def admin_moderation_decide(self, data, **kw):
+        """Массовое одобрение или отклонение карточек"""
+        try:
+            user = self._get_session_user(['admin', 'super_admin'])
+            if not user:
+                return {'success': False, 'error': 'Доступ запрещен'}
+            
+            if not data.get('card_ids') or data.get('action') not in ('approve', 'reject'):
+                return {'success': False, 'error': 'Не заполнены обязательные поля'}
+            
+            cards = request.env['karmabot.partner.card'].sudo().moderate_cards(
+                [int(card_id) for card_id in data['card_ids']],
+                user.id,
+                approve=data['action'] == 'approve'
+            )
+            
+            return {'success': True, 'card_ids': cards.ids}
+            
+        except Exception as e:
+            _logger.error(f"Error in admin_moderation_decide: {e}")
+            return {'success': False, 'error': 'Ошибка модерации'}
+    
     @http.route('/karmabot/webapp/admin/users', type='http', auth='public', )
     def admin_users(self, user_id=None, **kw):
         """Страница управления пользователями админа"""
@@ -676,18 +881,59 @@ class KarmaBotWebAppController(http.Controller):
             if not user or user.role not in ['admin', 'super_admin']:
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Доступ запрещен'})
             
-            # Получить всех пользователей
-            all_users = request.env['karmabot.user'].sudo().search([])
+            # Поиск пользователей вместо загрузки всего списка
+            found = request.env['karmabot.search.service'].sudo().search_users(
+                kw.get('q'), offset=int(kw.get('offset') or 0))
             
             return request.render('karmabot_webapp.admin_users', {
                 'user': user,
-                'all_users': all_users
+                'total_users': request.env['karmabot.user'].sudo().search_count([]),
+                'query': kw.get('q') or '',
+                'found_users': found['results'],
+                'has_more': found['has_more'],
+                'next_offset': found['offset'] + len(found['results']),
+                'export_formats': list(EXPORT_FORMATS)
             })
             
         except Exception as e:
             _logger.error(f"Error in admin_users: {e}")
             return request.render('karmabot_webapp.user_cabinet', {'error': 'Ошибка загрузки пользователей'})
     
+    @http.route('/karmabot/webapp/admin/export', type='http', auth='public', methods=['GET'])
+    def admin_export(self, dataset='users', export_format='csv', **kw):
+        """Потоковая выгрузка пользователей, карт или транзакций с фильтрами.
+
+        Выгрузка отдает персональные данные, поэтому админ определяется только по
+        сессии; user_id в параметрах - это фильтр транзакций, а не автор выгрузки.
+        """
+        try:
+            user = self._get_session_user(['admin', 'super_admin'])
+            if not user:
+                return request.render('karmabot_webapp.user_cabinet', {'error': 'Доступ запрещен'})
+            
+            if export_format not in EXPORT_FORMATS:
+                return request.render('karmabot_webapp.user_cabinet', {'error': 'Неизвестный формат выгрузки'})
+            
+            mimetype, extension, writer = EXPORT_FORMATS[export_format]
+            Export = request.env['karmabot.export.service'].sudo()
+            header, batches = Export.export_rows(dataset, kw)
+            # В журнал попадают только фильтры, которые применил запрос
+            request.env['karmabot.audit.event'].sudo().log_event(
+                'data_export', user_id=user.id,
+                message=f"{dataset}.{extension} {Export.get_applied_filters(dataset, kw)}")
+            
+            # Тело отдается по частям по мере чтения пачек из базы
+            filename = f"karmabot_{dataset}_{fields.Date.today()}.{extension}"
+            return Response(writer(header, batches), headers=[
+                ('Content-Type', mimetype),
+                ('Content-Disposition', content_disposition(filename)),
+                ('Cache-Control', 'no-store'),
+            ], direct_passthrough=True)
+            
+        except Exception as e:
+            _logger.error(f"Error in admin_export: {e}")
+            return request.render('karmabot_webapp.user_cabinet', {'error': 'Ошибка выгрузки'})
+    
     @http.route('/karmabot/webapp/admin/analytics', type='http', auth='public', )
     def admin_analytics(self, user_id=None, **kw):
         """Страница аналитики админа"""
@@ -702,8 +948,23 @@ class KarmaBotWebAppController(http.Controller):
             if not user or user.role not in ['admin', 'super_admin']:
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Доступ запрещен'})
             
+            with request.env['karmabot.replica.service'].read_env() as env:
+                # Приближенные DAU/WAU/MAU из скетчей активности
+                Sketch = env['karmabot.activity.sketch'].sudo()
+                activity = Sketch.get_activity_metrics()
+                top_cities = Sketch.get_breakdown('city', window='month', limit=10)
+                
+                # Статистика сессий за 30 дней, посчитанная в SQL
+                Session = env['karmabot.webapp_session'].sudo()
+                session_stats = Session.get_session_stats()
+                session_types = Session.get_session_type_stats()
+            
             return request.render('karmabot_webapp.admin_analytics', {
-                'user': user
+                'user': user,
+                'activity': activity,
+                'top_cities': top_cities,
+                'session_stats': session_stats,
+                'session_types': session_types
             })
             
         except Exception as e:
@@ -732,6 +993,25 @@ class KarmaBotWebAppController(http.Controller):
             _logger.error(f"Error in admin_notifications: {e}")
             return request.render('karmabot_webapp.user_cabinet', {'error': 'Ошибка загрузки уведомлений'})
     
+    @http.route('/karmabot/webapp/admin/notifications/send', type='http', auth='public', methods=['POST'], csrf=False)
+    @json_api
+    def admin_notifications_send(self, data, **kw):
+        """Отправка push-уведомления пользователям роли или всем"""
+        try:
+            if not self._get_session_user(['admin', 'super_admin']):
+                return {'success': False, 'error': 'Доступ запрещен'}
+            
+            if not data.get('message'):
+                return {'success': False, 'error': 'Не заполнены обязательные поля'}
+            
+            sent = request.env['karmabot.notification.service'].sudo().notify(
+                data.get('title') or 'KarmaBot', data['message'], role=data.get('role'))
+            return {'success': True, 'channels': sent}
+            
+        except Exception as e:
+            _logger.error(f"Error in admin_notifications_send: {e}")
+            return {'success': False, 'error': 'Ошибка отправки уведомления'}
+    
     # === КОНТРОЛЛЕРЫ ДЛЯ СУПЕР-АДМИНОВ (SUPER_ADMIN) ===
     
     @http.route('/karmabot/webapp/superadmin/settings', type='http', auth='public', )
@@ -748,8 +1028,10 @@ class KarmaBotWebAppController(http.Controller):
             if not user or user.role != 'super_admin':
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Доступ запрещен'})
             
+            Setting = request.env['karmabot.setting'].sudo()
             return request.render('karmabot_webapp.superadmin_settings', {
-                'user': user
+                'user': user,
+                'settings': [setting for setting in Setting.get_settings() if setting['category'] != 'modules']
             })
             
         except Exception as e:
@@ -771,13 +1053,36 @@ class KarmaBotWebAppController(http.Controller):
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Доступ запрещен'})
             
             return request.render('karmabot_webapp.superadmin_modules', {
-                'user': user
+                'user': user,
+                'features': request.env['karmabot.setting'].sudo().get_settings(category='modules')
             })
             
         except Exception as e:
             _logger.error(f"Error in superadmin_modules: {e}")
             return request.render('karmabot_webapp.user_cabinet', {'error': 'Ошибка загрузки модулей'})
     
+    @http.route('/karmabot/webapp/superadmin/settings/save', type='http', auth='public', methods=['POST'], csrf=False)
+    @json_api
+    def superadmin_settings_save(self, data, **kw):
+        """Сохранение системных настроек и переключателей модулей"""
+        try:
+            if not self._get_session_user(['super_admin']):
+                return {'success': False, 'error': 'Доступ запрещен'}
+            
+            if not isinstance(data.get('values'), dict):
+                return {'success': False, 'error': 'Не переданы значения'}
+            
+            # Значения сохраняются все вместе или не сохраняются вовсе
+            with request.env.cr.savepoint():
+                request.env['karmabot.setting'].sudo().set_values(data['values'])
+            return {'success': True}
+            
+        except ValidationError as e:
+            return {'success': False, 'error': str(e)}
+        except Exception as e:
+            _logger.error(f"Error in superadmin_settings_save: {e}")
+            return {'success': False, 'error': 'Ошибка сохранения настроек'}
+    
     @http.route('/karmabot/webapp/superadmin/admins', type='http', auth='public', )
     def superadmin_admins(self, user_id=None, **kw):
         """Страница управления админами супер-админа"""
@@ -820,8 +1125,25 @@ class KarmaBotWebAppController(http.Controller):
             if not user or user.role != 'super_admin':
                 return request.render('karmabot_webapp.user_cabinet', {'error': 'Доступ запрещен'})
             
+            # Журнал аудита с постраничной навигацией
+            audit = request.env['karmabot.audit.event'].sudo().get_events(
+                before_id=int(kw['before_id']) if kw.get('before_id') else None,
+                event_type=kw.get('event_type')
+            )
+            
+            # Активные сессии и пики одновременных сессий за сутки
+            Session = request.env['karmabot.webapp_session'].sudo()
+            now = fields.Datetime.now()
+            concurrency = Session.get_concurrency_peaks(now - timedelta(days=1), now)
+            
             return request.render('karmabot_webapp.superadmin_security', {
-                'user': user
+                'user': user,
+                'audit_events': audit['events'],
+                'next_before_id': audit['next_before_id'],
+                'active_sessions': Session.get_session_rows(limit=20),
+                'active_session_counts': Session.get_active_session_counts(),
+                'concurrency_peaks': concurrency,
+                'concurrency_peak': max((row['peak'] for row in concurrency), default=0)
             })
             
         except Exception as e:
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+import odoo
+from odoo import api, SUPERUSER_ID
+from odoo.service import server
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+
+def warmup_databases():
+    """Прогреть все базы из db_name, в которых установлен модуль"""
+    for dbname in filter(None, (config['db_name'] or '').split(',')):
+        try:
+            registry = odoo.modules.registry.Registry(dbname)
+            if 'karmabot.warmup.service' not in registry:
+                continue
+            with registry.cursor() as cr:
+                api.Environment(cr, SUPERUSER_ID, {})['karmabot.warmup.service'].warmup()
+        except Exception as e:
+            _logger.warning(f"KarmaBot warm-up of {dbname} failed: {e}")
+
+
+def post_load():
+    """Подключить прогрев к старту HTTP-воркеров.
+
+    В режиме prefork каждый воркер прогревается до того, как начнет принимать
+    запросы: пока он занят, запросы обслуживают остальные. В многопоточном
+    режиме прогрев идет в фоновом потоке после запуска сервера.
+    """
+    worker_start = server.WorkerHTTP.start
+
+    def start_worker(self):
+        worker_start(self)
+        warmup_databases()
+
+    server.WorkerHTTP.start = start_worker
+
+    threaded_start = server.ThreadedServer.start
+
+    def start_threaded(self, stop=False):
+        result = threaded_start(self, stop=stop)
+        if not stop:
+            threading.Thread(target=warmup_databases, name='karmabot.warmup', daemon=True).start()
+        return result
+
+    server.ThreadedServer.start = start_threaded
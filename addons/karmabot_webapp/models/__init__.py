@@ -1,3 +1,23 @@
 # -*- coding: utf-8 -*-
 
-# Models will be imported here when needed
+from . import karmabot_user
+from . import webapp_session
+from . import sso_token
+from . import referral
+from . import partner_stats
+from . import qr_code
+from . import scan
+from . import ir_http
+from . import audit_event
+from . import activity_sketch
+from . import search
+from . import partner_geo
+from . import idempotency
+from . import loyalty_transaction_partition
+from . import points_lifecycle
+from . import user_stats
+from . import settings
+from . import warmup
+from . import notification
+from . import export
+from . import replica
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from ..tools.hyperloglog import HLL_ERROR, HLL_REGISTERS, hash_position, merge_registers, estimate
+from datetime import timedelta
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+ACTIVITY_WINDOWS = {
+    'day': 1,
+    'week': 7,
+    'month': 30,
+}
+ACTIVITY_METRICS_TTL = 60
+
+# Регистры текущего дня, известные воркеру: позволяют не ходить в базу,
+# если активность пользователя не меняет скетч (так бывает почти всегда)
+_day_registers = {}
+_day_registers_lock = threading.Lock()
+
+# Кэш рассчитанных метрик для админки
+_metrics_cache = {}
+
+
+class KarmaBotActivitySketch(models.Model):
+    _name = 'karmabot.activity.sketch'
+    _description = 'KarmaBot Daily Activity Sketch'
+    _order = 'day desc'
+    _log_access = False
+
+    day = fields.Date(string='Day', required=True, readonly=True)
+    dimension = fields.Selection([
+        ('all', 'All Users'),
+        ('role', 'Role'),
+        ('city', 'City'),
+    ], string='Dimension', required=True, readonly=True)
+    dimension_value = fields.Char(string='Value', readonly=True)
+
+    _sql_constraints = [
+        ('day_dimension_unique', 'unique(day, dimension, dimension_value)',
+         'Only one sketch per day and dimension value'),
+    ]
+
+    def init(self):
+        # Регистры HyperLogLog храним как сырой bytea: поле Binary хранит base64
+        # и не позволяет обновлять отдельный регистр в SQL
+        self.env.cr.execute(f"""
+            ALTER TABLE karmabot_activity_sketch
+            ADD COLUMN IF NOT EXISTS registers bytea NOT NULL DEFAULT decode(repeat('00', {HLL_REGISTERS}), 'hex')
+        """)
+
+    # === Запись активности ===
+
+    def _dimension_keys(self, user):
+        keys = [('all', '')]
+        if user.role:
+            keys.append(('role', user.role))
+        city = (user.city or '').strip().lower()
+        if city:
+            keys.append(('city', city))
+        return keys
+
+    def _get_day_registers(self, day):
+        dbname = self.env.cr.dbname
+        cached = _day_registers.get(dbname)
+        if cached is None or cached['day'] != day:
+            with _day_registers_lock:
+                cached = _day_registers[dbname] = {'day': day, 'registers': {}}
+        return cached['registers']
+
+    def _load_registers(self, day, dimension, value):
+        self.env.cr.execute("""
+            SELECT registers FROM karmabot_activity_sketch
+            WHERE day = %s AND dimension = %s AND dimension_value = %s
+        """, (day, dimension, value))
+        row = self.env.cr.fetchone()
+        return bytearray(row[0]) if row else bytearray(HLL_REGISTERS)
+
+    @api.model
+    def record_activity(self, users):
+        """Учесть активность пользователей в скетчах текущего дня"""
+        day = fields.Date.today()
+        known = self._get_day_registers(day)
+        raised = []
+        for user in users:
+            index, rank = hash_position(user.id)
+            for key in self._dimension_keys(user):
+                registers = known.get(key)
+                if registers is None:
+                    registers = known[key] = self._load_registers(day, *key)
+                if rank > registers[index]:
+                    raised.append((key, index, rank))
+
+        for (dimension, value), index, rank in raised:
+            self.env.cr.execute(f"""
+                INSERT INTO karmabot_activity_sketch (day, dimension, dimension_value, registers)
+                VALUES (%(day)s, %(dimension)s, %(value)s,
+                        set_byte(decode(repeat('00', {HLL_REGISTERS}), 'hex'), %(index)s, %(rank)s))
+                ON CONFLICT (day, dimension, dimension_value) DO UPDATE
+                SET registers = set_byte(karmabot_activity_sketch.registers, %(index)s, %(rank)s)
+                WHERE get_byte(karmabot_activity_sketch.registers, %(index)s) < %(rank)s
+            """, {'day': day, 'dimension': dimension, 'value': value, 'index': index, 'rank': rank})
+
+        if raised:
+            @self.env.cr.postcommit.add
+            def _update_known_registers():
+                for key, index, rank in raised:
+                    registers = known.get(key)
+                    if registers is not None and rank > registers[index]:
+                        registers[index] = rank
+
+    # === Метрики ===
+
+    def _load_sketches(self, dimension, date_from, date_to, value=None):
+        query = """
+            SELECT day, dimension_value, registers FROM karmabot_activity_sketch
+            WHERE dimension = %s AND day >= %s AND day <= %s
+        """
+        params = [dimension, date_from, date_to]
+        if value is not None:
+            query += " AND dimension_value = %s"
+            params.append(value)
+        self.env.cr.execute(query, params)
+        return [(day, dimension_value, bytes(registers)) for day, dimension_value, registers in self.env.cr.fetchall()]
+
+    @api.model
+    def get_active_users(self, window='day', day=None, dimension='all', value=''):
+        """Приближенное число уникальных активных пользователей за окно"""
+        day = day or fields.Date.today()
+        date_from = day - timedelta(days=ACTIVITY_WINDOWS[window] - 1)
+        sketches = self._load_sketches(dimension, date_from, day, value=value)
+        return estimate(merge_registers(*(registers for _day, _value, registers in sketches)))
+
+    @api.model
+    def get_breakdown(self, dimension, window='day', day=None, limit=20):
+        """Активные пользователи в разрезе ролей или городов"""
+        day = day or fields.Date.today()
+        date_from = day - timedelta(days=ACTIVITY_WINDOWS[window] - 1)
+        grouped = {}
+        for _day, value, registers in self._load_sketches(dimension, date_from, day):
+            grouped.setdefault(value, []).append(registers)
+        rows = [{'value': value, 'users': estimate(merge_registers(*sketches))} for value, sketches in grouped.items()]
+        rows.sort(key=lambda row: row['users'], reverse=True)
+        return rows[:limit]
+
+    @api.model
+    def get_activity_metrics(self, day=None):
+        """DAU/WAU/MAU всего и по ролям с погрешностью оценки"""
+        day = day or fields.Date.today()
+        dbname = self.env.cr.dbname
+        cached = _metrics_cache.get(dbname)
+        if cached and cached[0] == day and cached[1] > time.monotonic():
+            return cached[2]
+
+        date_from = day - timedelta(days=ACTIVITY_WINDOWS['month'] - 1)
+        series = {}
+        for dimension in ('all', 'role'):
+            for sketch_day, value, registers in self._load_sketches(dimension, date_from, day):
+                series.setdefault((dimension, value), []).append((sketch_day, registers))
+
+        def window_counts(sketches):
+            counts = {}
+            for window, days in ACTIVITY_WINDOWS.items():
+                window_from = day - timedelta(days=days - 1)
+                counts[window] = estimate(merge_registers(
+                    *(registers for sketch_day, registers in sketches if sketch_day >= window_from)))
+            return counts
+
+        metrics = window_counts(series.get(('all', ''), []))
+        metrics['roles'] = {
+            value: window_counts(sketches)
+            for (dimension, value), sketches in series.items() if dimension == 'role'
+        }
+        metrics['error'] = HLL_ERROR
+
+        _metrics_cache[dbname] = (day, time.monotonic() + ACTIVITY_METRICS_TTL, metrics)
+        return metrics
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo import sql_db
+import atexit
+import collections
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+AUDIT_BUFFER_CAPACITY = 20000
+AUDIT_FLUSH_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 2.0
+
+AUDIT_EVENT_TYPES = [
+    ('points_add', 'Points Added'),
+    ('points_spend', 'Points Spent'),
+    ('session_create', 'Session Created'),
+    ('session_end', 'Session Ended'),
+    ('scan_blocked', 'Scan Blocked'),
+    ('data_export', 'Data Exported'),
+]
+
+
+class AuditBuffer:
+    """Кольцевой буфер событий аудита с фоновой пакетной записью в базу.
+
+    События попадают в буфер только после коммита транзакции, поэтому откаченные
+    операции в журнал не пишутся. При переполнении теряются самые старые события.
+    """
+
+    def __init__(self, dbname, capacity=AUDIT_BUFFER_CAPACITY):
+        self.dbname = dbname
+        self._events = collections.deque(maxlen=capacity)
+        self._dropped = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def extend(self, events):
+        with self._condition:
+            overflow = len(self._events) + len(events) - self._events.maxlen
+            if overflow > 0:
+                self._dropped += overflow
+            self._events.extend(events)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"karmabot.audit.{self.dbname}", daemon=True)
+                self._thread.start()
+            if len(self._events) >= AUDIT_FLUSH_SIZE:
+                self._condition.notify()
+
+    def _take(self):
+        with self._condition:
+            batch = list(self._events)
+            self._events.clear()
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            _logger.warning(f"Audit buffer overflow, dropped {dropped} events")
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait(timeout=AUDIT_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """Записать накопленные события одним запросом"""
+        batch = self._take()
+        if not batch:
+            return
+        columns = list(zip(*batch))
+        try:
+            with sql_db.db_connect(self.dbname).cursor() as cr:
+                cr.execute("""
+                    INSERT INTO karmabot_audit_event (event_time, event_type, user_id, res_id, points, message)
+                    SELECT * FROM unnest(%s::timestamp[], %s::varchar[], %s::int[], %s::int[], %s::int[], %s::varchar[])
+                """, [list(column) for column in columns])
+        except Exception as e:
+            _logger.error(f"Cannot flush {len(batch)} audit events: {e}")
+
+
+_audit_buffers = {}
+_audit_buffers_lock = threading.Lock()
+
+
+def _get_audit_buffer(dbname):
+    buffer = _audit_buffers.get(dbname)
+    if buffer is None:
+        with _audit_buffers_lock:
+            buffer = _audit_buffers.setdefault(dbname, AuditBuffer(dbname))
+    return buffer
+
+
+@atexit.register
+def _flush_audit_buffers():
+    for buffer in list(_audit_buffers.values()):
+        buffer.flush()
+
+
+class KarmaBotAuditEvent(models.Model):
+    _name = 'karmabot.audit.event'
+    _description = 'KarmaBot Audit Event'
+    _order = 'id desc'
+    _log_access = False
+
+    event_time = fields.Datetime(string='Time', required=True, readonly=True)
+    event_type = fields.Selection(AUDIT_EVENT_TYPES, string='Event Type', required=True, readonly=True)
+    user_id = fields.Many2one('karmabot.user', string='User', readonly=True, ondelete='set null')
+    res_id = fields.Integer(string='Related Record', readonly=True)
+    points = fields.Integer(string='Points', readonly=True)
+    message = fields.Char(string='Message', readonly=True)
+
+    def init(self):
+        # Индексы под постраничный просмотр по пользователю и типу события
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_audit_event_user_id_idx
+            ON karmabot_audit_event (user_id, id DESC)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_audit_event_type_id_idx
+            ON karmabot_audit_event (event_type, id DESC)
+        """)
+
+    @api.model
+    def log_event(self, event_type, user_id=None, res_id=None, points=None, message=None):
+        """Добавить событие в буфер; запись произойдет после коммита транзакции"""
+        cr = self.env.cr
+        events = cr.postcommit.data.get('karmabot.audit.events')
+        if events is None:
+            events = cr.postcommit.data['karmabot.audit.events'] = []
+            dbname = cr.dbname
+
+            @cr.postcommit.add
+            def _push_events():
+                _get_audit_buffer(dbname).extend(events)
+                events.clear()
+
+        events.append((fields.Datetime.now(), event_type, user_id, res_id, points, message and message[:255]))
+
+    @api.model
+    def flush_buffer(self):
+        """Принудительно записать буфер текущей базы"""
+        _get_audit_buffer(self.env.cr.dbname).flush()
+
+    @api.model
+    def get_events(self, limit=50, before_id=None, event_type=None, user_id=None):
+        """Получить страницу событий, начиная с самых новых"""
+        domain = []
+        if before_id:
+            domain.append(('id', '<', before_id))
+        if event_type:
+            domain.append(('event_type', '=', event_type))
+        if user_id:
+            domain.append(('user_id', '=', user_id))
+        events = self.search_read(domain, ['event_time', 'event_type', 'user_id', 'res_id', 'points', 'message'],
+                                  limit=limit)
+        return {
+            'events': events,
+            'next_before_id': events[-1]['id'] if len(events) == limit else None,
+        }
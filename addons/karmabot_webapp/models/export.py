@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+import logging
+
+_logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 5000
+
+
+def _to_bool(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+# Набор данных -> таблица, выгружаемые колонки, колонка периода и допустимые фильтры
+EXPORT_DATASETS = {
+    'users': {
+        'table': 'karmabot_user',
+        'columns': ['id', 'telegram_id', 'name', 'telegram_username', 'phone', 'email', 'city', 'role',
+                    'is_active', 'is_verified', 'total_points', 'available_points', 'pending_points',
+                    'total_scans', 'total_referrals', 'registration_date', 'last_activity'],
+        'date_column': 'registration_date',
+        'filters': {'role': str, 'city': str, 'is_active': _to_bool},
+    },
+    'cards': {
+        'table': 'karmabot_partner_card',
+        'columns': ['id', 'name', 'card_number', 'partner_id', 'status', 'latitude', 'longitude',
+                    'create_date', 'activation_date'],
+        'date_column': 'create_date',
+        'filters': {'status': str, 'partner_id': int},
+    },
+    'transactions': {
+        'table': 'karmabot_loyalty_transaction',
+        'columns': ['id', 'user_id', 'transaction_type', 'points', 'status', 'partner_id', 'card_id',
+                    'reason', 'transaction_date'],
+        'date_column': 'transaction_date',
+        'filters': {'transaction_type': str, 'status': str, 'user_id': int, 'partner_id': int, 'card_id': int},
+    },
+}
+
+
+class KarmaBotExportService(models.AbstractModel):
+    _name = 'karmabot.export.service'
+    _description = 'KarmaBot Data Export'
+
+    def _build_query(self, dataset, filters):
+        """Собрать запрос выгрузки; значения фильтров передаются параметрами"""
+        definition = EXPORT_DATASETS.get(dataset)
+        if not definition:
+            raise ValidationError(_('Unknown export dataset %s') % dataset)
+
+        conditions, params = [], []
+        for name, cast in definition['filters'].items():
+            if filters.get(name) not in (None, ''):
+                conditions.append(f"{name} = %s")
+                params.append(cast(filters[name]))
+        # Границы периода на колонке партиционирования отсекают лишние партиции транзакций
+        if filters.get('date_from'):
+            conditions.append(f"{definition['date_column']} >= %s")
+            params.append(fields.Datetime.to_datetime(filters['date_from']))
+        if filters.get('date_to'):
+            conditions.append(f"{definition['date_column']} < %s")
+            params.append(fields.Datetime.to_datetime(filters['date_to']))
+
+        query = f"SELECT {', '.join(definition['columns'])} FROM {definition['table']}"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        return definition['columns'], f"{query} ORDER BY id", params
+
+    @api.model
+    def get_applied_filters(self, dataset, filters):
+        """Допустимые и заполненные фильтры выгрузки; остальные параметры запрос игнорирует"""
+        names = list(EXPORT_DATASETS[dataset]['filters']) + ['date_from', 'date_to']
+        return {name: filters[name] for name in names if filters.get(name) not in (None, '')}
+
+    @api.model
+    def export_rows(self, dataset, filters=None, batch_size=EXPORT_BATCH_SIZE):
+        """Заголовок и ленивый итератор пачек строк выгрузки.
+
+        Строки читаются серверным курсором PostgreSQL пачками по batch_size в
+        отдельной read-only транзакции, которая открывается при первом чтении.
+        Поэтому итератор можно отдавать в HTTP-ответ: транзакция запроса к этому
+        моменту уже завершена, а в памяти держится не больше одной пачки.
+        """
+        self.env.flush_all()
+        header, query, params = self._build_query(dataset, filters or {})
+        registry = self.env.registry
+
+        def batches():
+            exported = 0
+            with registry.cursor() as cr:
+                cr.execute("SET TRANSACTION READ ONLY")
+                cr.execute(f"DECLARE karmabot_export NO SCROLL CURSOR FOR {query}", params)
+                while True:
+                    cr.execute("FETCH FORWARD %s FROM karmabot_export", (batch_size,))
+                    rows = cr.fetchall()
+                    if not rows:
+                        break
+                    exported += len(rows)
+                    yield rows
+            _logger.info(f"Exported {exported} rows of {dataset}")
+
+        return header, batches()
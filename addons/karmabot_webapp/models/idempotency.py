@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from datetime import timezone
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = 24 * 3600
+IDEMPOTENCY_CACHE_SIZE = 10000
+
+
+class IdempotencyCache:
+    """Ответы по ключам идемпотентности в памяти воркера с LRU-вытеснением"""
+
+    def __init__(self, max_keys=IDEMPOTENCY_CACHE_SIZE):
+        self.max_keys = max_keys
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, request_hash, response, expires_at):
+        with self._lock:
+            self._entries[key] = (request_hash, response, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+
+_idempotency_caches = {}
+
+
+def _get_cache(dbname):
+    cache = _idempotency_caches.get(dbname)
+    if cache is None:
+        cache = _idempotency_caches.setdefault(dbname, IdempotencyCache())
+    return cache
+
+
+class KarmaBotIdempotencyKey(models.Model):
+    _name = 'karmabot.idempotency.key'
+    _description = 'KarmaBot Idempotency Key'
+    _log_access = False
+
+    key = fields.Char(string='Key', required=True, readonly=True)
+    request_hash = fields.Char(string='Request Digest', required=True, readonly=True)
+    response = fields.Text(string='Response', readonly=True)
+    expires_at = fields.Datetime(string='Expires At', required=True, readonly=True, index=True)
+
+    _sql_constraints = [
+        ('key_unique', 'unique(key)', 'Idempotency key must be unique'),
+    ]
+
+    def _request_hash(self, payload):
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    @api.model
+    def execute(self, scope, client_key, payload, func, ttl=IDEMPOTENCY_TTL):
+        """Выполнить func один раз на ключ клиента; повтор вернет сохраненный ответ.
+
+        Ключ вставляется в той же транзакции, что и сама операция: параллельный
+        повтор ждет ее коммита на уникальном индексе и затем читает ответ.
+        Неуспешные ответы не сохраняются, чтобы клиент мог повторить запрос.
+        """
+        key = f"{scope}:{client_key}"[:255]
+        request_hash = self._request_hash(payload)
+        cache = _get_cache(self.env.cr.dbname)
+
+        cached = cache.get(key)
+        if cached:
+            return self._replay(cached[0], cached[1], request_hash)
+
+        # Истекший ключ, который еще не удалило задание очистки, занимается заново
+        now = fields.Datetime.now()
+        expires_at = fields.Datetime.add(now, seconds=ttl)
+        self.env.cr.execute("""
+            INSERT INTO karmabot_idempotency_key (key, request_hash, expires_at)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (key) DO UPDATE
+                SET request_hash = EXCLUDED.request_hash, response = NULL, expires_at = EXCLUDED.expires_at
+                WHERE karmabot_idempotency_key.expires_at < %s
+            RETURNING id
+        """, (key, request_hash, expires_at, now))
+        row = self.env.cr.fetchone()
+
+        if not row:
+            self.env.cr.execute("""
+                SELECT request_hash, response, expires_at FROM karmabot_idempotency_key WHERE key = %s
+            """, (key,))
+            stored = self.env.cr.fetchone()
+            if not stored or stored[1] is None:
+                return {'success': False, 'error': 'Запрос уже выполняется'}
+            response = json.loads(stored[1])
+            cache.put(key, stored[0], response, stored[2].replace(tzinfo=timezone.utc).timestamp())
+            return self._replay(stored[0], response, request_hash)
+
+        try:
+            with self.env.cr.savepoint():
+                response = func()
+        except Exception:
+            self.env.cr.execute("DELETE FROM karmabot_idempotency_key WHERE id = %s", (row[0],))
+            raise
+
+        if isinstance(response, dict) and response.get('success'):
+            self.env.cr.execute("""
+                UPDATE karmabot_idempotency_key SET response = %s WHERE id = %s
+            """, (json.dumps(response, default=str), row[0]))
+            self.env.cr.postcommit.add(
+                lambda: cache.put(key, request_hash, response, time.time() + ttl))
+        else:
+            self.env.cr.execute("DELETE FROM karmabot_idempotency_key WHERE id = %s", (row[0],))
+        return response
+
+    def _replay(self, stored_hash, response, request_hash):
+        if stored_hash != request_hash:
+            return {'success': False, 'error': 'Ключ идемпотентности уже использован для другого запроса'}
+        return dict(response, replayed=True)
+
+    @api.model
+    def _cron_cleanup_expired(self):
+        """Удалить ключи с истекшим сроком хранения"""
+        self.env.cr.execute("""
+            DELETE FROM karmabot_idempotency_key WHERE expires_at < (NOW() AT TIME ZONE 'UTC')
+        """)
+        if self.env.cr.rowcount:
+            _logger.info(f"Removed {self.env.cr.rowcount} expired idempotency keys")
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models
+from odoo.http import request
+from odoo.tools import config
+from werkzeug.exceptions import TooManyRequests
+import json
+
+from ..tools.rate_limit import IP_LIMIT_FACTOR, make_limiter, match_route_limit, parse_route_limits
+
+# Разобранные лимиты по значению настройки rate_limits. Она дополняет лимиты из
+# конфигурации сервера и читается из снимка настроек, без обращения к базе.
+_route_limits = {}
+_limiter = make_limiter(config.get('karmabot_rate_limit_redis'), int(config.get('karmabot_rate_limit_max_keys', 100000)))
+
+
+class IrHttp(models.AbstractModel):
+    _inherit = 'ir.http'
+
+    @classmethod
+    def _get_karmabot_telegram_id(cls):
+        """Извлечь telegram_id клиента из параметров запроса без обращения к базе"""
+        httprequest = request.httprequest
+        telegram_id = httprequest.args.get('user_id') or httprequest.args.get('telegram_id')
+        if telegram_id or httprequest.mimetype != 'application/json':
+            return telegram_id or httprequest.form.get('telegram_id')
+        try:
+            data = json.loads(httprequest.get_data(as_text=True) or '{}')
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        params = data.get('params') if isinstance(data.get('params'), dict) else data
+        if params.get('telegram_id'):
+            return str(params['telegram_id'])
+        # Формат SSO токена: telegram_id:timestamp:signature
+        sso_token = params.get('sso_token')
+        return sso_token.split(':', 1)[0] if isinstance(sso_token, str) and ':' in sso_token else None
+
+    @classmethod
+    def _get_karmabot_route_limits(cls):
+        """Лимиты маршрутов; настройка берется из снимка реестра, запрос к базе
+        выполняется только после сброса кэша при изменении настроек"""
+        overrides = request.env['karmabot.setting'].get('rate_limits')
+        route_limits = _route_limits.get(overrides)
+        if route_limits is None:
+            value = ','.join(filter(None, [config.get('karmabot_rate_limits'), overrides]))
+            route_limits = _route_limits[overrides] = parse_route_limits(value)
+        return route_limits
+
+    @classmethod
+    def _check_karmabot_rate_limit(cls):
+        prefix, limit = match_route_limit(cls._get_karmabot_route_limits(), request.httprequest.path)
+        if not limit:
+            return
+        rate, burst = limit
+        
+        remote_addr = request.httprequest.remote_addr
+        if not _limiter.allow(f"ip:{prefix}:{remote_addr}", rate * IP_LIMIT_FACTOR, burst * IP_LIMIT_FACTOR):
+            raise TooManyRequests()
+        
+        telegram_id = cls._get_karmabot_telegram_id()
+        if telegram_id and not _limiter.allow(f"tg:{prefix}:{telegram_id}", rate, burst):
+            raise TooManyRequests()
+
+    @classmethod
+    def _authenticate(cls, endpoint):
+        # Проверка лимитов до аутентификации; кроме закэшированного снимка настроек
+        # база не используется
+        cls._check_karmabot_rate_limit()
+        return super()._authenticate(endpoint)
@@ -1,11 +1,26 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError
 import logging
 
+from ..tools.telegram_auth import derive_secret_key, verify_init_data
+
 _logger = logging.getLogger(__name__)
 
+TELEGRAM_BOT_TOKEN_PARAM = 'karmabot_webapp.telegram_bot_token'
+
+LEVEL_NAMES = ('Newcomer', 'Bronze', 'Silver', 'Gold', 'Platinum', 'Diamond')
+
+
+def compute_level(points, thresholds):
+    """Уровень по баллам; thresholds - нижние границы уровней начиная со второго"""
+    thresholds = thresholds[:len(LEVEL_NAMES) - 1]
+    for index, threshold in enumerate(thresholds):
+        if points < threshold:
+            return {'level': index + 1, 'name': LEVEL_NAMES[index], 'points_to_next': threshold - points}
+    return {'level': len(thresholds) + 1, 'name': LEVEL_NAMES[len(thresholds)], 'points_to_next': 0}
+
 
 class KarmaBotUser(models.Model):
     _name = 'karmabot.user'
@@ -45,10 +60,19 @@ class KarmaBotUser(models.Model):
     
     # Связи
     partner_id = fields.Many2one('res.partner', string='Odoo Partner')
+    referral_ids = fields.One2many('karmabot.referral', 'referrer_id', string='Referrals')
     
     # Вычисляемые поля
     name = fields.Char(string='Name', compute='_compute_name', store=True)
     
+    _sql_constraints = [
+        ('telegram_id_unique', 'unique(telegram_id)', 'Telegram ID must be unique'),
+    ]
+    
+    def init(self):
+        # Триграммные индексы для поиска пользователей
+        self.env['karmabot.search.service']._create_search_indexes(self._table)
+    
     @api.depends('display_name')
     def _compute_name(self):
         for record in self:
@@ -66,18 +90,45 @@ class KarmaBotUser(models.Model):
             if record.email and '@' not in record.email:
                 raise ValidationError(_('Invalid email format'))
     
+    @api.model
+    @tools.ormcache()
+    def _get_telegram_secret_key(self):
+        """Секретный ключ проверки initData, вычисляется один раз на реестр"""
+        bot_token = self.env['ir.config_parameter'].sudo().get_param(TELEGRAM_BOT_TOKEN_PARAM)
+        return derive_secret_key(bot_token) if bot_token else None
+    
+    @api.model
+    def authenticate_telegram(self, init_data):
+        """Проверить initData Telegram WebApp и вернуть пользователя KarmaBot"""
+        telegram_user = verify_init_data(init_data, self._get_telegram_secret_key())
+        if not telegram_user:
+            return self.browse()
+        
+        telegram_id = str(telegram_user['id'])
+        user = self.search([('telegram_id', '=', telegram_id)], limit=1)
+        if not user:
+            full_name = ' '.join(filter(None, [telegram_user.get('first_name'), telegram_user.get('last_name')]))
+            user = self.create({
+                'telegram_id': telegram_id,
+                'display_name': full_name or f"Telegram User {telegram_id}",
+                'telegram_username': telegram_user.get('username'),
+            })
+        return user
+    
     def update_activity(self):
         """Обновить время последней активности"""
         self.last_activity = fields.Datetime.now()
+        self.env['karmabot.activity.sketch'].sudo().record_activity(self)
     
     def add_points(self, points, reason=''):
         """Добавить баллы пользователю"""
         self.total_points += points
         self.available_points += points
         self.update_activity()
+        self.env['karmabot.notification.service'].notify_balance(self)
         
-        # Логирование
-        _logger.info(f"Added {points} points to user {self.telegram_id}. Reason: {reason}")
+        # Аудит
+        self.env['karmabot.audit.event'].log_event('points_add', user_id=self.id, points=points, message=reason)
     
     def spend_points(self, points, reason=''):
         """Потратить баллы пользователя"""
@@ -86,25 +137,14 @@ class KarmaBotUser(models.Model):
         
         self.available_points -= points
         self.update_activity()
+        self.env['karmabot.notification.service'].notify_balance(self)
         
-        # Логирование
-        _logger.info(f"Spent {points} points from user {self.telegram_id}. Reason: {reason}")
+        # Аудит
+        self.env['karmabot.audit.event'].log_event('points_spend', user_id=self.id, points=points, message=reason)
     
     def get_level_info(self):
         """Получить информацию об уровне пользователя"""
-        # Простая система уровней
-        if self.total_points < 100:
-            return {'level': 1, 'name': 'Newcomer', 'points_to_next': 100 - self.total_points}
-        elif self.total_points < 300:
-            return {'level': 2, 'name': 'Bronze', 'points_to_next': 300 - self.total_points}
-        elif self.total_points < 600:
-            return {'level': 3, 'name': 'Silver', 'points_to_next': 600 - self.total_points}
-        elif self.total_points < 1000:
-            return {'level': 4, 'name': 'Gold', 'points_to_next': 1000 - self.total_points}
-        elif self.total_points < 1500:
-            return {'level': 5, 'name': 'Platinum', 'points_to_next': 1500 - self.total_points}
-        else:
-            return {'level': 6, 'name': 'Diamond', 'points_to_next': 0}
+        return compute_level(self.total_points, self.env['karmabot.setting'].get('level_thresholds'))
 
 
 class KarmaBotLoyaltyProgram(models.Model):
@@ -116,18 +156,7 @@ class KarmaBotLoyaltyProgram(models.Model):
     
     def calculate_user_level(self, points):
         """Вычислить уровень пользователя на основе баллов"""
-        if points < 100:
-            return {'level': 1, 'name': 'Newcomer', 'points_to_next': 100 - points}
-        elif points < 300:
-            return {'level': 2, 'name': 'Bronze', 'points_to_next': 300 - points}
-        elif points < 600:
-            return {'level': 3, 'name': 'Silver', 'points_to_next': 600 - points}
-        elif points < 1000:
-            return {'level': 4, 'name': 'Gold', 'points_to_next': 1000 - points}
-        elif points < 1500:
-            return {'level': 5, 'name': 'Platinum', 'points_to_next': 1500 - points}
-        else:
-            return {'level': 6, 'name': 'Diamond', 'points_to_next': 0}
+        return compute_level(points, self.env['karmabot.setting'].get('level_thresholds'))
 
 
 class KarmaBotPartnerCard(models.Model):
@@ -147,15 +176,142 @@ class KarmaBotPartnerCard(models.Model):
     # QR код и ссылка
     qr_code = fields.Char(string='QR Code')
     webapp_url = fields.Char(string='WebApp URL')
+    qr_image_png_id = fields.Many2one('karmabot.qr.code', string='QR Image (PNG)', readonly=True)
+    qr_image_svg_id = fields.Many2one('karmabot.qr.code', string='QR Image (SVG)', readonly=True)
     
     # Даты
     create_date = fields.Datetime(string='Created', default=fields.Datetime.now)
     activation_date = fields.Datetime(string='Activated')
     
+    # Очередь модерации
+    claimed_by_id = fields.Many2one('karmabot.user', string='Claimed By', readonly=True)
+    claim_expires_at = fields.Datetime(string='Claim Expires At', readonly=True)
+    
+    def init(self):
+        # Индекс под упорядоченную выборку очереди модерации
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_partner_card_status_create_date_idx
+            ON karmabot_partner_card (status, create_date, id)
+        """)
+        # Триграммные индексы для поиска заведений
+        self.env['karmabot.search.service']._create_search_indexes(self._table)
+    
+    def write(self, vals):
+        res = super().write(vals)
+        if 'webapp_url' in vals:
+            self.filtered(lambda card: card.status == 'active')._generate_qr_images()
+        return res
+    
     def activate_card(self):
         """Активировать карту"""
-        self.status = 'active'
-        self.activation_date = fields.Datetime.now()
+        self.write({
+            'status': 'active',
+            'activation_date': fields.Datetime.now()
+        })
+        self._generate_qr_images()
+        self.env['karmabot.notification.service'].notify_cards_activated(self)
+    
+    def _generate_qr_images(self):
+        """Сгенерировать QR-изображения для карт пакетно"""
+        cards = self.filtered('webapp_url')
+        if not cards:
+            return
+        
+        QRCode = self.env['karmabot.qr.code'].sudo()
+        payloads = cards.mapped('webapp_url')
+        png_images = QRCode.get_or_create_many(payloads, 'png')
+        svg_images = QRCode.get_or_create_many(payloads, 'svg')
+        
+        for card in cards:
+            png, svg = png_images[card.webapp_url], svg_images[card.webapp_url]
+            if card.qr_image_png_id != png or card.qr_image_svg_id != svg:
+                card.write({'qr_image_png_id': png.id, 'qr_image_svg_id': svg.id})
+    
+    @api.model
+    def claim_moderation_batch(self, moderator_id, limit=20, claim_minutes=15):
+        """Захватить пакет карт на модерацию, не пересекаясь с другими модераторами"""
+        self.flush_model()
+        self.env.cr.execute("""
+            UPDATE karmabot_partner_card card
+            SET claimed_by_id = %(moderator)s,
+                claim_expires_at = (NOW() AT TIME ZONE 'UTC') + %(claim_minutes)s * INTERVAL '1 minute'
+            WHERE card.id IN (
+                SELECT id FROM karmabot_partner_card
+                WHERE status = 'pending'
+                  AND (claimed_by_id IS NULL
+                       OR claimed_by_id = %(moderator)s
+                       OR claim_expires_at < (NOW() AT TIME ZONE 'UTC'))
+                ORDER BY create_date, id
+                LIMIT %(limit)s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING card.id
+        """, {'moderator': moderator_id, 'claim_minutes': claim_minutes, 'limit': limit})
+        card_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.invalidate_model(['claimed_by_id', 'claim_expires_at'])
+        return self.search([('id', 'in', card_ids)], order='create_date, id')
+    
+    @api.model
+    def moderate_cards(self, card_ids, moderator_id, approve=True):
+        """Одобрить или отклонить захваченные модератором карты одним запросом"""
+        if not card_ids:
+            return self.browse()
+        self.flush_model()
+        self.env.cr.execute("""
+            UPDATE karmabot_partner_card
+            SET status = %(status)s,
+                activation_date = CASE WHEN %(approve)s THEN (NOW() AT TIME ZONE 'UTC') ELSE activation_date END,
+                claimed_by_id = NULL,
+                claim_expires_at = NULL,
+                write_uid = %(uid)s,
+                write_date = (NOW() AT TIME ZONE 'UTC')
+            WHERE id = ANY(%(card_ids)s)
+              AND status = 'pending'
+              AND claimed_by_id = %(moderator)s
+            RETURNING id
+        """, {
+            'status': 'active' if approve else 'rejected',
+            'approve': approve,
+            'uid': self.env.uid,
+            'card_ids': list(card_ids),
+            'moderator': moderator_id,
+        })
+        cards = self.browse([row[0] for row in self.env.cr.fetchall()])
+        self.invalidate_model(['status', 'activation_date', 'claimed_by_id', 'claim_expires_at',
+                               'write_uid', 'write_date'])
+        
+        if approve:
+            cards._generate_qr_images()
+            self.env['karmabot.notification.service'].notify_cards_activated(cards)
+        _logger.info(f"Moderator {moderator_id} {'approved' if approve else 'rejected'} {len(cards)} cards")
+        return cards
+    
+    @api.model
+    def release_moderation_claims(self, moderator_id):
+        """Вернуть незавершенные карты модератора в очередь"""
+        self.flush_model()
+        self.env.cr.execute("""
+            UPDATE karmabot_partner_card
+            SET claimed_by_id = NULL, claim_expires_at = NULL
+            WHERE claimed_by_id = %s AND status = 'pending'
+        """, (moderator_id,))
+        self.invalidate_model(['claimed_by_id', 'claim_expires_at'])
+    
+    def get_scan_token(self, ttl=300):
+        """Получить подписанный токен скана для карты"""
+        self.ensure_one()
+        return self.env['karmabot.scan.service'].issue_token(self, ttl=ttl)
+    
+    @api.model
+    def _cron_pregenerate_qr_images(self, batch_size=500):
+        """Догенерировать QR-изображения для активных карт"""
+        cards = self.search([
+            ('status', '=', 'active'),
+            ('webapp_url', '!=', False),
+            '|', ('qr_image_png_id', '=', False), ('qr_image_svg_id', '=', False)
+        ], limit=batch_size)
+        cards._generate_qr_images()
+        return len(cards)
 
 
 class KarmaBotLoyaltyTransaction(models.Model):
@@ -167,7 +323,8 @@ class KarmaBotLoyaltyTransaction(models.Model):
         ('earn', 'Earn Points'),
         ('spend', 'Spend Points'),
         ('bonus', 'Bonus Points'),
-        ('penalty', 'Penalty Points')
+        ('penalty', 'Penalty Points'),
+        ('expire', 'Expired Points')
     ], string='Transaction Type', required=True)
     
     points = fields.Integer(string='Points', required=True)
@@ -179,7 +336,7 @@ class KarmaBotLoyaltyTransaction(models.Model):
     card_id = fields.Many2one('karmabot.partner.card', string='Card')
     
     # Даты
-    transaction_date = fields.Datetime(string='Transaction Date', default=fields.Datetime.now)
+    transaction_date = fields.Datetime(string='Transaction Date', required=True, default=fields.Datetime.now)
     
     # Статус
     status = fields.Selection([
@@ -187,55 +344,7 @@ class KarmaBotLoyaltyTransaction(models.Model):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled')
     ], string='Status', default='completed')
-
-
-class KarmaBotWebAppSession(models.Model):
-    _name = 'karmabot.webapp_session'
-    _description = 'KarmaBot WebApp Session'
-    
-    user_id = fields.Many2one('karmabot.user', string='User', required=True)
-    session_type = fields.Selection([
-        ('user_cabinet', 'User Cabinet'),
-        ('partner_cabinet', 'Partner Cabinet'),
-        ('admin_cabinet', 'Admin Cabinet'),
-        ('super_admin_cabinet', 'Super Admin Cabinet')
-    ], string='Session Type', required=True)
-    
-    # Информация о сессии
-    ip_address = fields.Char(string='IP Address')
-    user_agent = fields.Char(string='User Agent')
-    is_active = fields.Boolean(string='Active', default=True)
-    
-    # Даты
-    start_time = fields.Datetime(string='Start Time', default=fields.Datetime.now)
-    last_activity = fields.Datetime(string='Last Activity', default=fields.Datetime.now)
-    end_time = fields.Datetime(string='End Time')
     
-    @api.model
-    def create_session(self, user_id, session_type, ip_address=None, user_agent=None):
-        """Создать новую сессию WebApp"""
-        # Деактивировать предыдущие сессии пользователя
-        self.search([('user_id', '=', user_id), ('is_active', '=', True)]).write({
-            'is_active': False,
-            'end_time': fields.Datetime.now()
-        })
-        
-        # Создать новую сессию
-        session = self.create({
-            'user_id': user_id,
-            'session_type': session_type,
-            'ip_address': ip_address,
-            'user_agent': user_agent,
-            'is_active': True
-        })
-        
-        return session
-    
-    def update_activity(self):
-        """Обновить активность сессии"""
-        self.last_activity = fields.Datetime.now()
-    
-    def end_session(self):
-        """Завершить сессию"""
-        self.is_active = False
-        self.end_time = fields.Datetime.now()
+    # Nonce подписанного QR-скана
+    scan_nonce = fields.Char(string='Scan Nonce', readonly=True)
+
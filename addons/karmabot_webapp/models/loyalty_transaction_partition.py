@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.tools import config, sql
+from datetime import date
+from dateutil.relativedelta import relativedelta
+import gzip
+import logging
+import os
+import re
+
+_logger = logging.getLogger(__name__)
+
+TRANSACTION_TABLE = 'karmabot_loyalty_transaction'
+DEFAULT_PARTITION = f'{TRANSACTION_TABLE}_default'
+PARTITION_NAME_RE = re.compile(rf'^{TRANSACTION_TABLE}_y(\d{{4}})m(\d{{2}})$')
+
+MONTHS_AHEAD_PARAM = 'karmabot_webapp.transaction_partition_months_ahead'
+RETENTION_MONTHS_PARAM = 'karmabot_webapp.transaction_retention_months'
+ARCHIVE_MODE_PARAM = 'karmabot_webapp.transaction_archive_mode'
+
+
+class KarmaBotLoyaltyTransaction(models.Model):
+    _inherit = 'karmabot.loyalty.transaction'
+
+    def _get_table_kind(self):
+        self.env.cr.execute("""
+            SELECT relkind FROM pg_class
+            WHERE relname = %s AND relnamespace = current_schema::regnamespace
+        """, (TRANSACTION_TABLE,))
+        row = self.env.cr.fetchone()
+        return row and row[0]
+
+    def _auto_init(self):
+        """Обновить схему партиционированной таблицы.
+
+        ORM считает таблицами только relkind r, v и m (tools.sql.existing_tables),
+        поэтому для партиционированной таблицы стандартный _auto_init попытался бы
+        создать ее заново. Здесь повторяется только нужная существующей таблице
+        часть: удаление ограничений снятых полей, новые колонки и SQL-ограничения.
+        """
+        if self._get_table_kind() != 'p':
+            return super()._auto_init()
+
+        cr = self.env.cr
+        update_custom_fields = self._context.get('update_custom_fields', False)
+        self._check_removed_columns(log=False)
+        columns = sql.table_columns(cr, self._table)
+        fields_to_compute = []
+        for field in sorted(self._fields.values(), key=lambda f: f.column_order):
+            if not field.store or (field.manual and not update_custom_fields):
+                continue
+            if field.update_db(self, columns) and field.compute:
+                fields_to_compute.append(field)
+        if fields_to_compute:
+            cr.execute(f"SELECT id FROM {TRANSACTION_TABLE}")
+            records = self.browse(row[0] for row in cr.fetchall())
+            for field in fields_to_compute:
+                self.env.add_to_compute(field, records)
+        self._add_sql_constraints()
+
+    def init(self):
+        super().init()
+        table_kind = self._get_table_kind()
+        if table_kind and table_kind != 'p':
+            self._convert_to_partitioned()
+        # Индекс под историю пользователя; создается во всех партициях
+        self.env.cr.execute(f"""
+            CREATE INDEX IF NOT EXISTS {TRANSACTION_TABLE}_user_date_idx
+            ON {TRANSACTION_TABLE} (user_id, transaction_date DESC)
+        """)
+
+    # === Партиционирование ===
+
+    def _partition_name(self, month):
+        return f"{TRANSACTION_TABLE}_y{month.year}m{month.month:02d}"
+
+    def _convert_to_partitioned(self):
+        """Перевести таблицу транзакций на помесячное декларативное партиционирование"""
+        cr = self.env.cr
+        legacy = f"{TRANSACTION_TABLE}_legacy"
+        _logger.info(f"Converting {TRANSACTION_TABLE} to a partitioned table")
+
+        cr.execute(f"""
+            UPDATE {TRANSACTION_TABLE}
+            SET transaction_date = COALESCE(create_date, NOW() AT TIME ZONE 'UTC')
+            WHERE transaction_date IS NULL
+        """)
+        # LIKE не переносит индексы и внешние ключи: их определения сохраняются до
+        # переименования и повторяются на новой таблице. Уникальные индексы на
+        # партиционированной таблице обязаны включать ключ партиционирования,
+        # поэтому переносятся только неуникальные, а первичный ключ создается заново.
+        cr.execute("""
+            SELECT pg_get_indexdef(indexrelid) FROM pg_index
+            WHERE indrelid = %s::regclass AND NOT indisunique
+        """, (TRANSACTION_TABLE,))
+        index_definitions = [row[0] for row in cr.fetchall()]
+        cr.execute("""
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+        """, (TRANSACTION_TABLE,))
+        foreign_keys = cr.fetchall()
+
+        cr.execute(f"ALTER TABLE {TRANSACTION_TABLE} RENAME TO {legacy}")
+        cr.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {TRANSACTION_TABLE}_pkey TO {legacy}_pkey")
+        cr.execute(f"""
+            CREATE TABLE {TRANSACTION_TABLE} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (transaction_date)
+        """)
+        cr.execute(f"ALTER TABLE {TRANSACTION_TABLE} ALTER COLUMN transaction_date SET NOT NULL")
+        cr.execute(f"ALTER TABLE {TRANSACTION_TABLE} ADD PRIMARY KEY (id, transaction_date)")
+        cr.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TRANSACTION_TABLE} DEFAULT")
+
+        # Партиции создаются до переноса данных, чтобы партиция по умолчанию осталась пустой
+        cr.execute(f"SELECT MIN(transaction_date)::date FROM {legacy}")
+        first_date = cr.fetchone()[0] or fields.Date.today()
+        self._ensure_partitions(first_date.replace(day=1))
+
+        cr.execute(f"INSERT INTO {TRANSACTION_TABLE} SELECT * FROM {legacy}")
+        cr.execute(f"ALTER SEQUENCE {TRANSACTION_TABLE}_id_seq OWNED BY {TRANSACTION_TABLE}.id")
+        cr.execute(f"DROP TABLE {legacy}")
+
+        # Индексы создаются после переноса данных; имена освободились вместе со старой таблицей
+        for definition in index_definitions:
+            cr.execute(definition)
+        for name, definition in foreign_keys:
+            cr.execute(f'ALTER TABLE {TRANSACTION_TABLE} ADD CONSTRAINT "{name}" {definition}')
+
+    def _ensure_partitions(self, first_month=None):
+        """Создать партиции от указанного месяца до заданного горизонта вперед"""
+        months_ahead = int(self.env['ir.config_parameter'].sudo().get_param(MONTHS_AHEAD_PARAM, 3))
+        month = first_month or fields.Date.today().replace(day=1)
+        last_month = fields.Date.today().replace(day=1) + relativedelta(months=months_ahead)
+        created = 0
+        while month <= last_month:
+            created += self._create_partition(month)
+            month += relativedelta(months=1)
+        return created
+
+    def _create_partition(self, month):
+        """Создать партицию месяца, перенеся в нее строки из партиции по умолчанию"""
+        cr = self.env.cr
+        name = self._partition_name(month)
+        cr.execute("SELECT to_regclass(%s)", (name,))
+        if cr.fetchone()[0]:
+            return 0
+
+        bounds = (month, month + relativedelta(months=1))
+        cr.execute(f"""
+            CREATE TABLE {name} (LIKE {TRANSACTION_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        """)
+        cr.execute(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE transaction_date >= %s AND transaction_date < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """, bounds)
+        cr.execute(f"""
+            ALTER TABLE {TRANSACTION_TABLE} ATTACH PARTITION {name}
+            FOR VALUES FROM (%s) TO (%s)
+        """, bounds)
+        _logger.info(f"Created partition {name}")
+        return 1
+
+    def _get_partitions(self):
+        """Получить помесячные партиции в виде списка (месяц, имя таблицы)"""
+        self.env.cr.execute("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+        """, (TRANSACTION_TABLE,))
+        partitions = []
+        for (name,) in self.env.cr.fetchall():
+            match = PARTITION_NAME_RE.match(name)
+            if match:
+                partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+        return sorted(partitions)
+
+    def _archive_partition(self, name, mode):
+        """Отсоединить партицию и сохранить ее как архивную таблицу или CSV"""
+        cr = self.env.cr
+        cr.execute(f"ALTER TABLE {TRANSACTION_TABLE} DETACH PARTITION {name}")
+        archive_name = name.replace(TRANSACTION_TABLE, f'{TRANSACTION_TABLE}_archive', 1)
+
+        if mode == 'csv':
+            archive_dir = os.path.join(config['data_dir'], 'karmabot_archive', cr.dbname)
+            os.makedirs(archive_dir, exist_ok=True)
+            path = os.path.join(archive_dir, f'{archive_name}.csv.gz')
+            with gzip.open(path, 'wb') as archive:
+                cr.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", archive)
+            cr.execute(f"DROP TABLE {name}")
+            _logger.info(f"Archived partition {name} to {path}")
+        else:
+            cr.execute(f"ALTER TABLE {name} RENAME TO {archive_name}")
+            _logger.info(f"Archived partition {name} to table {archive_name}")
+
+    @api.model
+    def _cron_manage_partitions(self):
+        """Создать будущие партиции и архивировать устаревшие"""
+        created = self._ensure_partitions()
+
+        params = self.env['ir.config_parameter'].sudo()
+        retention_months = int(params.get_param(RETENTION_MONTHS_PARAM, 0))
+        archived = 0
+        if retention_months > 0:
+            mode = params.get_param(ARCHIVE_MODE_PARAM, 'table')
+            cutoff = fields.Date.today().replace(day=1) - relativedelta(months=retention_months)
+            for month, name in self._get_partitions():
+                if month < cutoff:
+                    self._archive_partition(name, mode)
+                    archived += 1
+
+        return {'created': created, 'archived': archived}
+
+    # === Запросы с отсечением партиций ===
+
+    @api.model
+    def get_user_transactions(self, user_id, date_from=None, date_to=None, limit=20, offset=0):
+        """Получить транзакции пользователя, новые первыми.
+
+        Без границ дат читаются все партиции по индексу (user_id, transaction_date);
+        переданные границы позволяют планировщику отсечь лишние партиции.
+        """
+        domain = [('user_id', '=', user_id)]
+        if date_from:
+            domain.append(('transaction_date', '>=', date_from))
+        if date_to:
+            domain.append(('transaction_date', '<', date_to))
+        return self.search(domain, order='transaction_date desc', limit=limit, offset=offset)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api, tools, _
+import hashlib
+import hmac
+import logging
+
+_logger = logging.getLogger(__name__)
+
+ROLES = ('user', 'partner', 'admin', 'super_admin')
+
+
+class KarmaBotNotificationService(models.AbstractModel):
+    """Push-уведомления WebApp через шину Odoo.
+
+    Каналы - строки с подписью от секрета базы: подписаться на канал может
+    только тот, кому сервер выдал его имя при отрисовке кабинета.
+    """
+    _name = 'karmabot.notification.service'
+    _description = 'KarmaBot Push Notification Service'
+
+    @tools.ormcache()
+    def _get_channel_key(self):
+        secret = self.env['ir.config_parameter'].sudo().get_param('database.secret')
+        return hmac.new(secret.encode(), b'karmabot-bus', hashlib.sha256).digest()
+
+    def _channel(self, kind, value):
+        signature = hmac.new(self._get_channel_key(), f"{kind}:{value}".encode(), hashlib.sha256).hexdigest()
+        return f"karmabot_{kind}_{value}_{signature[:32]}"
+
+    @api.model
+    def get_channels(self, user):
+        """Каналы, на которые подписывается кабинет пользователя"""
+        return [self._channel('user', user.id), self._channel('role', user.role), self._channel('all', 0)]
+
+    def _send(self, notifications):
+        if notifications:
+            self.env['bus.bus'].sudo()._sendmany(notifications)
+
+    @api.model
+    def notify_balance(self, users):
+        """Отправить пользователям текущий баланс; уходит после коммита транзакции"""
+        self._send([(self._channel('user', user.id), 'karmabot/balance', {
+            'total_points': user.total_points,
+            'available_points': user.available_points,
+            'pending_points': user.pending_points,
+        }) for user in users])
+
+    @api.model
+    def notify_cards_activated(self, cards):
+        """Сообщить владельцам карт об их активации"""
+        owners = self.env['karmabot.user'].sudo().search([('partner_id', 'in', cards.partner_id.ids)])
+        self._send([(self._channel('user', owner.id), 'karmabot/card_activated', {
+            'cards': [{'id': card.id, 'name': card.name} for card in cards if card.partner_id == owner.partner_id],
+        }) for owner in owners])
+
+    @api.model
+    def notify(self, title, message, users=None, role=None):
+        """Уведомление от администратора: пользователям, роли или всем сразу"""
+        payload = {'title': title, 'message': message}
+        if users:
+            channels = [self._channel('user', user.id) for user in users]
+        elif role in ROLES:
+            channels = [self._channel('role', role)]
+        else:
+            channels = [self._channel('all', 0)]
+        self._send([(channel, 'karmabot/notification', payload) for channel in channels])
+        return len(channels)
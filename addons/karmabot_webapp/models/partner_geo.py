@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+from ..tools.geo import GEO_MAX_RADIUS_KM, GeoSnapshot, geo_cell, cells_in_radius, refine_nearby
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+GEO_SNAPSHOT_TTL = 60
+
+# Снимки активных карт с координатами по базам данных, свои в каждом воркере
+_geo_snapshots = {}
+
+
+class KarmaBotPartnerCard(models.Model):
+    _inherit = 'karmabot.partner.card'
+
+    latitude = fields.Float(string='Latitude', digits=(10, 7))
+    longitude = fields.Float(string='Longitude', digits=(10, 7))
+    geo_cell = fields.Integer(string='Geo Cell', compute='_compute_geo_cell', store=True, index=True)
+
+    @api.depends('latitude', 'longitude')
+    def _compute_geo_cell(self):
+        for card in self:
+            has_location = card.latitude or card.longitude
+            card.geo_cell = geo_cell(card.latitude, card.longitude) if has_location else False
+
+    @api.constrains('latitude', 'longitude')
+    def _check_coordinates(self):
+        for card in self:
+            if not -90 <= card.latitude <= 90 or not -180 <= card.longitude <= 180:
+                raise ValidationError(_('Invalid coordinates'))
+
+    def write(self, vals):
+        res = super().write(vals)
+        if {'latitude', 'longitude', 'status', 'name'} & set(vals):
+            _geo_snapshots.pop(self.env.cr.dbname, None)
+        return res
+
+    # === Поиск ближайших ===
+
+    def _get_geo_snapshot(self):
+        """Снимок активных карт; перестраивается не чаще раза в GEO_SNAPSHOT_TTL секунд"""
+        dbname = self.env.cr.dbname
+        cached = _geo_snapshots.get(dbname)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        self.env.cr.execute("""
+            SELECT id, name, latitude, longitude
+            FROM karmabot_partner_card
+            WHERE status = 'active' AND geo_cell IS NOT NULL
+        """)
+        snapshot = GeoSnapshot(self.env.cr.fetchall())
+        _geo_snapshots[dbname] = (time.monotonic() + GEO_SNAPSHOT_TTL, snapshot)
+        return snapshot
+
+    @api.model
+    def find_nearby(self, latitude, longitude, radius_km=5, limit=20, use_snapshot=True):
+        """Активные карты в радиусе radius_km, по возрастанию расстояния"""
+        latitude, longitude = float(latitude), float(longitude)
+        radius_km = min(float(radius_km), GEO_MAX_RADIUS_KM)
+        if use_snapshot:
+            found = self._get_geo_snapshot().nearby(latitude, longitude, radius_km, limit)
+        else:
+            self.flush_model(['latitude', 'longitude', 'geo_cell', 'status'])
+            self.env.cr.execute("""
+                SELECT id, name, latitude, longitude
+                FROM karmabot_partner_card
+                WHERE geo_cell = ANY(%s) AND status = 'active'
+            """, (cells_in_radius(latitude, longitude, radius_km),))
+            found = refine_nearby(self.env.cr.fetchall(), latitude, longitude, radius_km, limit)
+
+        return [{
+            'id': row[0],
+            'name': row[1],
+            'latitude': row[2],
+            'longitude': row[3],
+            'distance_km': round(distance, 2),
+        } for distance, row in found]
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from datetime import timedelta
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+ROLLUP_WATERMARK_PARAM = 'karmabot_webapp.partner_rollup_last_id'
+ROLLUP_GAPS_PARAM = 'karmabot_webapp.partner_rollup_gaps'
+
+
+class KarmaBotPartnerDailyStat(models.Model):
+    _name = 'karmabot.partner.daily.stat'
+    _description = 'KarmaBot Partner Daily Statistics'
+    _order = 'day desc'
+    _log_access = False
+
+    # Ключ агрегата
+    partner_id = fields.Many2one('res.partner', string='Partner', required=True, ondelete='cascade')
+    day = fields.Date(string='Day', required=True)
+    transaction_type = fields.Selection([
+        ('earn', 'Earn Points'),
+        ('spend', 'Spend Points'),
+        ('bonus', 'Bonus Points'),
+        ('penalty', 'Penalty Points')
+    ], string='Transaction Type', required=True)
+
+    # Агрегаты
+    points_sum = fields.Integer(string='Points', default=0)
+    txn_count = fields.Integer(string='Transactions', default=0)
+    user_count = fields.Integer(string='Distinct Users', default=0)
+
+    _sql_constraints = [
+        ('partner_day_type_unique', 'unique(partner_id, day, transaction_type)',
+         'Only one rollup row per partner, day and transaction type'),
+    ]
+
+    @api.model
+    def _cron_update_rollup(self, batch_size=50000, max_batches=20):
+        """Обработать новые транзакции начиная с последней отметки.
+
+        Id выделяются до коммита, поэтому строки транзакций, которые еще не
+        завершились, выглядят как пропуски в последовательности id. Пропуски
+        запоминаются вместе с горизонтом - номером транзакции после всех, кто
+        мог их занять, - и перечитываются, пока все такие транзакции не завершатся.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        last_id = int(params.get_param(ROLLUP_WATERMARK_PARAM, 0))
+        gaps = json.loads(params.get_param(ROLLUP_GAPS_PARAM) or '[]')
+        processed = 0
+
+        if gaps:
+            processed, gaps = self._rollup_gaps(gaps)
+
+        new_gaps = []
+        for _batch in range(max_batches):
+            self.env.cr.execute("""
+                WITH batch AS (
+                    SELECT id FROM karmabot_loyalty_transaction
+                    WHERE id > %(last_id)s
+                    ORDER BY id
+                    LIMIT %(batch_size)s
+                ), steps AS (
+                    SELECT id, LAG(id, 1, %(last_id)s) OVER (ORDER BY id) AS prev_id FROM batch
+                )
+                SELECT MAX(id), COUNT(*), ARRAY_AGG(ARRAY[prev_id + 1, id - 1]) FILTER (WHERE id > prev_id + 1)
+                FROM steps
+            """, {'last_id': last_id, 'batch_size': batch_size})
+            upto_id, count, batch_gaps = self.env.cr.fetchone()
+            if not count:
+                break
+
+            self._rollup_range(last_id, upto_id)
+            self.env['karmabot.partner.client']._rollup_range(last_id, upto_id)
+
+            new_gaps.extend(batch_gaps or [])
+            last_id = upto_id
+            processed += count
+
+        if new_gaps:
+            # Собственный номер транзакции больше номеров всех, кто успел занять id пропусков
+            self.env.cr.execute("SELECT txid_current()")
+            horizon = self.env.cr.fetchone()[0]
+            gaps.extend([low, high, horizon] for low, high in new_gaps)
+
+        params.set_param(ROLLUP_WATERMARK_PARAM, last_id)
+        params.set_param(ROLLUP_GAPS_PARAM, json.dumps(gaps))
+        if processed:
+            self.invalidate_model()
+            self.env['karmabot.partner.client'].invalidate_model()
+            _logger.info(f"Partner rollup processed {processed} transactions up to id {last_id}, "
+                         f"{len(gaps)} id gaps pending")
+        return processed
+
+    def _rollup_gaps(self, gaps):
+        """Учесть строки, появившиеся в запомненных пропусках id; вернуть (строк, оставшиеся пропуски)"""
+        cr = self.env.cr
+        # Все транзакции с номером ниже xmin снимка завершены, и их строки видны этому запросу
+        cr.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        finished_below = cr.fetchone()[0]
+        cr.execute("""
+            SELECT t.id, t.mature_date IS NULL
+            FROM karmabot_loyalty_transaction t
+            JOIN unnest(%s::int[], %s::int[]) AS gap(low, high) ON t.id BETWEEN gap.low AND gap.high
+            ORDER BY t.id
+        """, ([low for low, _high, _horizon in gaps], [high for _low, high, _horizon in gaps]))
+        rows = cr.fetchall()
+        found = [row_id for row_id, _immediate in rows]
+        # Начисления с созреванием учитываются при созревании
+        immediate = [row_id for row_id, is_immediate in rows if is_immediate]
+        if immediate:
+            self._rollup_ids(immediate)
+            self.env['karmabot.partner.client']._rollup_ids(immediate)
+
+        remaining = []
+        for low, high, horizon in gaps:
+            if horizon <= finished_below:
+                # Оставшиеся id принадлежали отмененным транзакциям
+                continue
+            for row_id in found:
+                if low <= row_id <= high:
+                    if row_id > low:
+                        remaining.append([low, row_id - 1, horizon])
+                    low = row_id + 1
+            if low <= high:
+                remaining.append([low, high, horizon])
+        return len(found), remaining
+
+    def _rollup_range(self, from_id, to_id):
+        """Добавить транзакции из диапазона id в дневные агрегаты; созревающие добавит созревание"""
+        self._rollup_transactions("id > %(from_id)s AND id <= %(to_id)s AND mature_date IS NULL",
+                                  {'from_id': from_id, 'to_id': to_id})
+
+    def _rollup_ids(self, ids):
+        """Добавить транзакции с указанными id в дневные агрегаты"""
+        self._rollup_transactions("id = ANY(%(ids)s)", {'ids': list(ids)})
+
+    def _rollup_transactions(self, condition, params):
+        self.env.cr.execute(f"""
+            WITH txn AS (
+                SELECT partner_id, (transaction_date AT TIME ZONE 'UTC')::date AS day,
+                       transaction_type, user_id, points
+                FROM karmabot_loyalty_transaction
+                WHERE {condition}
+                  AND partner_id IS NOT NULL AND status = 'completed'
+            ), new_pairs AS (
+                INSERT INTO karmabot_partner_daily_user (partner_id, day, transaction_type, user_id)
+                SELECT DISTINCT partner_id, day, transaction_type, user_id FROM txn
+                ON CONFLICT DO NOTHING
+                RETURNING partner_id, day, transaction_type
+            ), new_users AS (
+                SELECT partner_id, day, transaction_type, COUNT(*) AS user_count
+                FROM new_pairs
+                GROUP BY partner_id, day, transaction_type
+            ), sums AS (
+                SELECT partner_id, day, transaction_type, SUM(points) AS points_sum, COUNT(*) AS txn_count
+                FROM txn
+                GROUP BY partner_id, day, transaction_type
+            )
+            INSERT INTO karmabot_partner_daily_stat
+                (partner_id, day, transaction_type, points_sum, txn_count, user_count)
+            SELECT s.partner_id, s.day, s.transaction_type, s.points_sum, s.txn_count, COALESCE(n.user_count, 0)
+            FROM sums s
+            LEFT JOIN new_users n USING (partner_id, day, transaction_type)
+            ON CONFLICT (partner_id, day, transaction_type) DO UPDATE SET
+                points_sum = karmabot_partner_daily_stat.points_sum + EXCLUDED.points_sum,
+                txn_count = karmabot_partner_daily_stat.txn_count + EXCLUDED.txn_count,
+                user_count = karmabot_partner_daily_stat.user_count + EXCLUDED.user_count
+        """, params)
+
+    @api.model
+    def get_partner_summary(self, partner_id, days=30):
+        """Получить сводку по партнеру за последние дни"""
+        date_from = fields.Date.today() - timedelta(days=days)
+        self.env.cr.execute("""
+            SELECT transaction_type, SUM(points_sum), SUM(txn_count)
+            FROM karmabot_partner_daily_stat
+            WHERE partner_id = %s AND day >= %s
+            GROUP BY transaction_type
+        """, (partner_id, date_from))
+        by_type = {ttype: {'points': points, 'count': count}
+                   for ttype, points, count in self.env.cr.fetchall()}
+        earn = by_type.get('earn', {'points': 0, 'count': 0})
+        return {
+            'by_type': by_type,
+            'total_scans': earn['count'],
+            'points_paid': earn['points'],
+            'clients': self.env['karmabot.partner.client'].get_client_counts(partner_id, days=days),
+        }
+
+    @api.model
+    def get_daily_series(self, partner_id, days=30, transaction_type='earn'):
+        """Получить дневной ряд по партнеру для графиков"""
+        date_from = fields.Date.today() - timedelta(days=days)
+        self.env.cr.execute("""
+            SELECT day, points_sum, txn_count, user_count
+            FROM karmabot_partner_daily_stat
+            WHERE partner_id = %s AND transaction_type = %s AND day >= %s
+            ORDER BY day
+        """, (partner_id, transaction_type, date_from))
+        return [{'day': day, 'points': points, 'count': count, 'users': users}
+                for day, points, count, users in self.env.cr.fetchall()]
+
+
+class KarmaBotPartnerDailyUser(models.Model):
+    _name = 'karmabot.partner.daily.user'
+    _description = 'KarmaBot Partner Daily User'
+    _log_access = False
+
+    # Набор пар для подсчета уникальных пользователей за день
+    partner_id = fields.Many2one('res.partner', string='Partner', required=True, ondelete='cascade')
+    day = fields.Date(string='Day', required=True)
+    transaction_type = fields.Char(string='Transaction Type', required=True)
+    user_id = fields.Many2one('karmabot.user', string='User', required=True, ondelete='cascade')
+
+    _sql_constraints = [
+        ('partner_day_type_user_unique', 'unique(partner_id, day, transaction_type, user_id)',
+         'Daily user pair must be unique'),
+    ]
+
+
+class KarmaBotPartnerClient(models.Model):
+    _name = 'karmabot.partner.client'
+    _description = 'KarmaBot Partner Client'
+    _order = 'last_date desc'
+    _log_access = False
+
+    partner_id = fields.Many2one('res.partner', string='Partner', required=True, ondelete='cascade')
+    user_id = fields.Many2one('karmabot.user', string='User', required=True, ondelete='cascade')
+
+    first_date = fields.Datetime(string='First Visit')
+    last_date = fields.Datetime(string='Last Visit')
+    txn_count = fields.Integer(string='Transactions', default=0)
+    points_sum = fields.Integer(string='Points', default=0)
+
+    _sql_constraints = [
+        ('partner_user_unique', 'unique(partner_id, user_id)', 'Partner client must be unique'),
+    ]
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_partner_client_partner_last_idx
+            ON karmabot_partner_client (partner_id, last_date DESC)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_partner_client_partner_first_idx
+            ON karmabot_partner_client (partner_id, first_date)
+        """)
+
+    def _rollup_range(self, from_id, to_id):
+        """Обновить клиентов партнеров по транзакциям из диапазона id; созревающие учтет созревание"""
+        self._rollup_transactions("id > %(from_id)s AND id <= %(to_id)s AND mature_date IS NULL",
+                                  {'from_id': from_id, 'to_id': to_id})
+
+    def _rollup_ids(self, ids):
+        """Обновить клиентов партнеров по транзакциям с указанными id"""
+        self._rollup_transactions("id = ANY(%(ids)s)", {'ids': list(ids)})
+
+    def _rollup_transactions(self, condition, params):
+        self.env.cr.execute(f"""
+            INSERT INTO karmabot_partner_client
+                (partner_id, user_id, first_date, last_date, txn_count, points_sum)
+            SELECT partner_id, user_id, MIN(transaction_date), MAX(transaction_date), COUNT(*), SUM(points)
+            FROM karmabot_loyalty_transaction
+            WHERE {condition}
+              AND partner_id IS NOT NULL AND status = 'completed'
+            GROUP BY partner_id, user_id
+            ON CONFLICT (partner_id, user_id) DO UPDATE SET
+                first_date = LEAST(karmabot_partner_client.first_date, EXCLUDED.first_date),
+                last_date = GREATEST(karmabot_partner_client.last_date, EXCLUDED.last_date),
+                txn_count = karmabot_partner_client.txn_count + EXCLUDED.txn_count,
+                points_sum = karmabot_partner_client.points_sum + EXCLUDED.points_sum
+        """, params)
+
+    @api.model
+    def get_client_counts(self, partner_id, days=30):
+        """Получить количество всех, новых и активных клиентов партнера"""
+        since = fields.Datetime.now() - timedelta(days=days)
+        self.env.cr.execute("""
+            SELECT COUNT(*),
+                   COUNT(*) FILTER (WHERE first_date >= %(since)s),
+                   COUNT(*) FILTER (WHERE last_date >= %(since)s)
+            FROM karmabot_partner_client
+            WHERE partner_id = %(partner_id)s
+        """, {'partner_id': partner_id, 'since': since})
+        total, new, active = self.env.cr.fetchone()
+        return {'total': total, 'new': new, 'active': active}
+
+    @api.model
+    def get_clients(self, partner_id, limit=50, offset=0):
+        """Получить страницу клиентов партнера"""
+        return self.search([('partner_id', '=', partner_id)], limit=limit, offset=offset)
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from datetime import timedelta
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+EXPIRY_CHECKPOINT_PARAM = 'karmabot_webapp.points_expiry_checkpoint'
+
+
+class KarmaBotLoyaltyTransaction(models.Model):
+    _inherit = 'karmabot.loyalty.transaction'
+
+    # Учет партий начислений по FIFO
+    mature_date = fields.Datetime(string='Matures On', readonly=True)
+    remaining_points = fields.Integer(string='Remaining Points', readonly=True,
+                                      help='Unspent points of an earn/bonus lot; empty means not settled yet')
+
+    def init(self):
+        super().init()
+        # Партии, ожидающие перевода из pending
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_loyalty_transaction_maturation_idx
+            ON karmabot_loyalty_transaction (mature_date)
+            WHERE status = 'pending'
+        """)
+        # Открытые партии пользователя в порядке FIFO
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_loyalty_transaction_open_lot_idx
+            ON karmabot_loyalty_transaction (user_id, transaction_date, id)
+            WHERE transaction_type IN ('earn', 'bonus') AND status = 'completed'
+              AND (remaining_points IS NULL OR remaining_points > 0)
+        """)
+
+    # === Созревание ===
+
+    @api.model
+    def get_maturation_days(self):
+        return self.env['karmabot.setting'].get('points_maturation_days')
+
+    def _mature_chunk(self, now, chunk_size):
+        """Перевести созревшие партии в available; вернуть (партий, баллов, пользователей).
+
+        Созревшие начисления партнеров попадают в агрегаты статистики здесь же:
+        пока они ожидали, ночная свертка их пропускала.
+        """
+        self.env.cr.execute("""
+            WITH matured AS (
+                UPDATE karmabot_loyalty_transaction t
+                SET status = 'completed'
+                WHERE t.id IN (
+                    SELECT id FROM karmabot_loyalty_transaction
+                    WHERE status = 'pending' AND mature_date <= %(now)s
+                      AND transaction_type IN ('earn', 'bonus')
+                    ORDER BY mature_date
+                    LIMIT %(chunk_size)s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING t.id, t.user_id, t.partner_id, t.points
+            ), per_user AS (
+                SELECT user_id, COUNT(*) AS lots, SUM(points) AS points
+                FROM matured
+                GROUP BY user_id
+            ), updated AS (
+                UPDATE karmabot_user u
+                SET pending_points = GREATEST(u.pending_points - p.points, 0),
+                    available_points = u.available_points + p.points,
+                    total_points = u.total_points + p.points
+                FROM per_user p
+                WHERE u.id = p.user_id
+                RETURNING u.id
+            )
+            SELECT COALESCE(SUM(lots), 0), COALESCE(SUM(points), 0),
+                   (SELECT ARRAY_AGG(id) FROM updated),
+                   (SELECT ARRAY_AGG(id) FROM matured WHERE partner_id IS NOT NULL)
+            FROM per_user
+        """, {'now': now, 'chunk_size': chunk_size})
+        lots, points, user_ids, partner_txn_ids = self.env.cr.fetchone()
+        if partner_txn_ids:
+            self.env['karmabot.partner.daily.stat']._rollup_ids(partner_txn_ids)
+            self.env['karmabot.partner.client']._rollup_ids(partner_txn_ids)
+        users = self.env['karmabot.user'].browse(user_ids or [])
+        if users:
+            users.invalidate_recordset(['pending_points', 'available_points', 'total_points'])
+            self.env['karmabot.notification.service'].notify_balance(users)
+        return lots, points, len(users)
+
+    def _maturation_report(self, now):
+        self.env.cr.execute("""
+            SELECT COUNT(*), COALESCE(SUM(points), 0), COUNT(DISTINCT user_id)
+            FROM karmabot_loyalty_transaction
+            WHERE status = 'pending' AND mature_date <= %s AND transaction_type IN ('earn', 'bonus')
+        """, (now,))
+        return self.env.cr.fetchone()
+
+    # === Сгорание по FIFO ===
+
+    def _settle_lots(self, user_from, user_to, cutoff):
+        """Пересчитать остатки открытых партий пользователей диапазона во временную таблицу.
+
+        Списания не хранятся как партии, поэтому израсходованное определяется по
+        балансу: сумма открытых остатков минус available_points. Оно распределяется
+        по партиям от старых к новым накопленной суммой.
+        """
+        cr = self.env.cr
+        cr.execute("DROP TABLE IF EXISTS karmabot_points_settlement")
+        cr.execute("""
+            CREATE TEMP TABLE karmabot_points_settlement AS
+            WITH open_lots AS (
+                SELECT t.id, t.user_id, t.transaction_date,
+                       COALESCE(t.remaining_points, t.points) AS remaining,
+                       SUM(COALESCE(t.remaining_points, t.points)) OVER (
+                           PARTITION BY t.user_id ORDER BY t.transaction_date, t.id
+                       ) AS running_total,
+                       SUM(COALESCE(t.remaining_points, t.points)) OVER (PARTITION BY t.user_id) AS open_total
+                FROM karmabot_loyalty_transaction t
+                WHERE t.user_id > %(user_from)s AND t.user_id <= %(user_to)s
+                  AND t.transaction_type IN ('earn', 'bonus') AND t.status = 'completed'
+                  AND (t.remaining_points IS NULL OR t.remaining_points > 0)
+            )
+            SELECT l.id, l.user_id, l.transaction_date,
+                   LEAST(l.remaining, GREATEST(l.running_total - GREATEST(l.open_total - u.available_points, 0), 0))
+                       AS remaining,
+                   l.transaction_date < %(cutoff)s AS expiring
+            FROM open_lots l
+            JOIN karmabot_user u ON u.id = l.user_id
+        """, {'user_from': user_from, 'user_to': user_to, 'cutoff': cutoff})
+
+    def _expire_chunk(self, user_from, user_to, cutoff, now, dry_run=False):
+        """Рассчитать и (если не dry_run) применить сгорание для диапазона пользователей"""
+        cr = self.env.cr
+        if not dry_run:
+            # Блокируем балансы диапазона, чтобы расчет не разошелся с параллельными списаниями
+            cr.execute("""
+                SELECT id FROM karmabot_user WHERE id > %s AND id <= %s ORDER BY id FOR UPDATE
+            """, (user_from, user_to))
+        self._settle_lots(user_from, user_to, cutoff)
+
+        cr.execute("""
+            SELECT COUNT(*) FILTER (WHERE expiring AND remaining > 0),
+                   COALESCE(SUM(remaining) FILTER (WHERE expiring), 0),
+                   COUNT(DISTINCT user_id) FILTER (WHERE expiring AND remaining > 0)
+            FROM karmabot_points_settlement
+        """)
+        report = cr.fetchone()
+
+        if not dry_run:
+            # Истекшие остатки уходят в ноль, остальные партии получают пересчитанный остаток
+            cr.execute("""
+                UPDATE karmabot_loyalty_transaction t
+                SET remaining_points = CASE WHEN s.expiring THEN 0 ELSE s.remaining END
+                FROM karmabot_points_settlement s
+                WHERE t.id = s.id AND t.transaction_date = s.transaction_date
+                  AND t.remaining_points IS DISTINCT FROM CASE WHEN s.expiring THEN 0 ELSE s.remaining END
+            """)
+            cr.execute("""
+                WITH expired AS (
+                    SELECT user_id, SUM(remaining) AS points
+                    FROM karmabot_points_settlement
+                    WHERE expiring AND remaining > 0
+                    GROUP BY user_id
+                ), balances AS (
+                    UPDATE karmabot_user u
+                    SET available_points = GREATEST(u.available_points - e.points, 0)
+                    FROM expired e
+                    WHERE u.id = e.user_id
+                )
+                INSERT INTO karmabot_loyalty_transaction
+                    (user_id, transaction_type, points, reason, transaction_date, status,
+                     create_date, write_date)
+                SELECT user_id, 'expire', points, 'Points expired', %(now)s, 'completed', %(now)s, %(now)s
+                FROM expired
+            """, {'now': now})
+        cr.execute("DROP TABLE karmabot_points_settlement")
+        return report
+
+    # === Пакетный запуск ===
+
+    @api.model
+    def run_points_lifecycle(self, dry_run=False, chunk_size=5000, max_seconds=None, commit=False):
+        """Созревание pending-баллов и сгорание устаревших партий по FIFO.
+
+        Пользователи обрабатываются диапазонами id; после каждого диапазона
+        сохраняется отметка, и прерванный запуск продолжит с нее. В режиме
+        dry_run ничего не меняется и возвращается отчет о том, что было бы сделано.
+        """
+        self.env.flush_all()
+        params = self.env['ir.config_parameter'].sudo()
+        now = fields.Datetime.now()
+        started = time.monotonic()
+        report = {
+            'dry_run': dry_run,
+            'matured_lots': 0, 'matured_points': 0, 'matured_users': 0,
+            'expired_lots': 0, 'expired_points': 0, 'expired_users': 0,
+            'completed': True,
+        }
+
+        def out_of_time():
+            return max_seconds and time.monotonic() - started > max_seconds
+
+        # Созревание
+        if dry_run:
+            report['matured_lots'], report['matured_points'], report['matured_users'] = self._maturation_report(now)
+        else:
+            while True:
+                lots, points, users = self._mature_chunk(now, chunk_size)
+                report['matured_lots'] += lots
+                report['matured_points'] += points
+                report['matured_users'] += users
+                if commit:
+                    self.env.cr.commit()
+                if lots < chunk_size:
+                    break
+                if out_of_time():
+                    report['completed'] = False
+                    break
+
+        # Сгорание
+        expiry_days = self.env['karmabot.setting'].get('points_expiry_days')
+        if expiry_days > 0 and report['completed']:
+            cutoff = now - timedelta(days=expiry_days)
+            self.env.cr.execute("SELECT COALESCE(MAX(id), 0) FROM karmabot_user")
+            max_user_id = self.env.cr.fetchone()[0]
+            user_from = 0 if dry_run else int(params.get_param(EXPIRY_CHECKPOINT_PARAM, 0))
+
+            while user_from < max_user_id:
+                user_to = user_from + chunk_size
+                lots, points, users = self._expire_chunk(user_from, user_to, cutoff, now, dry_run=dry_run)
+                report['expired_lots'] += lots
+                report['expired_points'] += points
+                report['expired_users'] += users
+                user_from = user_to
+                if not dry_run:
+                    params.set_param(EXPIRY_CHECKPOINT_PARAM, user_from if user_from < max_user_id else 0)
+                    if commit:
+                        self.env.cr.commit()
+                if out_of_time() and user_from < max_user_id:
+                    report['completed'] = False
+                    break
+
+        if not dry_run:
+            self.invalidate_model()
+            self.env['karmabot.user'].invalidate_model()
+        _logger.info(f"Points lifecycle {'dry run' if dry_run else 'run'}: {report}")
+        return report
+
+    @api.model
+    def _cron_points_lifecycle(self):
+        """Ночной запуск созревания и сгорания баллов"""
+        return self.run_points_lifecycle(max_seconds=3 * 3600, commit=True)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+import base64
+import hashlib
+import io
+import logging
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import qrcode
+    import qrcode.image.svg
+except ImportError:
+    qrcode = None
+    _logger.warning("python-qrcode is not installed, QR images for partner cards are disabled")
+
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+# Меняется при изменении параметров рендеринга, чтобы не отдавать старые картинки
+QR_RENDER_VERSION = '1'
+
+
+class KarmaBotQRCode(models.Model):
+    _name = 'karmabot.qr.code'
+    _description = 'KarmaBot QR Code Image'
+
+    checksum = fields.Char(string='Checksum', required=True, index=True, readonly=True)
+    image_format = fields.Selection([
+        ('png', 'PNG'),
+        ('svg', 'SVG')
+    ], string='Format', required=True, readonly=True)
+    payload = fields.Char(string='Payload', required=True, readonly=True)
+    content = fields.Binary(string='Image', attachment=True, readonly=True)
+
+    _sql_constraints = [
+        ('checksum_unique', 'unique(checksum)', 'QR image checksum must be unique'),
+    ]
+
+    @api.model
+    def _compute_checksum(self, payload, image_format):
+        """Вычислить адрес содержимого QR-изображения"""
+        key = f"{QR_RENDER_VERSION}:{image_format}:{payload}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @api.model
+    def _render(self, payload, image_format):
+        """Сгенерировать изображение QR-кода"""
+        if qrcode is None:
+            raise UserError(_('python-qrcode is required to generate QR codes'))
+
+        qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=10, border=4)
+        qr.add_data(payload)
+        qr.make(fit=True)
+
+        stream = io.BytesIO()
+        if image_format == 'svg':
+            qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(stream)
+        else:
+            qr.make_image().save(stream)
+        return stream.getvalue()
+
+    @api.model
+    def get_or_create_many(self, payloads, image_format='png'):
+        """Получить QR-изображения для набора данных, создав только недостающие"""
+        checksums = {payload: self._compute_checksum(payload, image_format) for payload in set(payloads)}
+        existing = self.search([('checksum', 'in', list(checksums.values()))])
+        by_checksum = {qr.checksum: qr for qr in existing}
+
+        missing = [payload for payload, checksum in checksums.items() if checksum not in by_checksum]
+        if missing:
+            created = self.create([{
+                'checksum': checksums[payload],
+                'image_format': image_format,
+                'payload': payload,
+                'content': base64.b64encode(self._render(payload, image_format)),
+            } for payload in missing])
+            by_checksum.update({qr.checksum: qr for qr in created})
+            _logger.info(f"Generated {len(created)} QR images ({image_format})")
+
+        return {payload: by_checksum[checksum] for payload, checksum in checksums.items()}
+
+    def get_url(self):
+        """Получить неизменяемый URL изображения"""
+        return f"/karmabot/qr/{self.image_format}/{self.checksum}"
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Доли бонуса для уровней 1, 2, 3 ... реферальной цепочки
+REFERRAL_BONUS_RATES = (0.10, 0.05, 0.02)
+
+
+class KarmaBotReferral(models.Model):
+    _name = 'karmabot.referral'
+    _description = 'KarmaBot Referral'
+    _order = 'create_date desc'
+
+    # Основные поля
+    referrer_id = fields.Many2one('karmabot.user', string='Referrer', required=True, index=True, ondelete='cascade')
+    referred_id = fields.Many2one('karmabot.user', string='Referred User', required=True, ondelete='cascade')
+
+    _sql_constraints = [
+        ('referred_unique', 'unique(referred_id)', 'User can only be referred once'),
+    ]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        for edge in records:
+            edge._check_no_cycle()
+            edge._link_closure()
+        return records
+
+    def unlink(self):
+        for edge in self:
+            edge._unlink_closure()
+        return super().unlink()
+
+    def _check_no_cycle(self):
+        """Проверить, что ребро не создает цикл в графе рефералов"""
+        if self.referrer_id == self.referred_id:
+            raise ValidationError(_('User cannot refer themselves'))
+        self.env.cr.execute("""
+            SELECT 1 FROM karmabot_referral_closure
+            WHERE ancestor_id = %s AND descendant_id = %s
+            LIMIT 1
+        """, (self.referred_id.id, self.referrer_id.id))
+        if self.env.cr.fetchone():
+            raise ValidationError(_('Referral cycle detected'))
+
+    def _link_closure(self):
+        """Добавить пути через новое ребро в таблицу замыкания"""
+        params = {'referrer': self.referrer_id.id, 'referred': self.referred_id.id}
+        self.env.cr.execute("""
+            WITH up AS (
+                SELECT %(referrer)s AS ancestor_id, 0 AS depth
+                UNION ALL
+                SELECT ancestor_id, depth FROM karmabot_referral_closure
+                WHERE descendant_id = %(referrer)s
+            ), down AS (
+                SELECT %(referred)s AS descendant_id, 0 AS depth
+                UNION ALL
+                SELECT descendant_id, depth FROM karmabot_referral_closure
+                WHERE ancestor_id = %(referred)s
+            )
+            INSERT INTO karmabot_referral_closure (ancestor_id, descendant_id, depth)
+            SELECT up.ancestor_id, down.descendant_id, up.depth + down.depth + 1
+            FROM up CROSS JOIN down
+        """, params)
+        self.env.cr.execute("""
+            UPDATE karmabot_user SET total_referrals = total_referrals + 1
+            WHERE id = %(referrer)s
+        """, params)
+        self.env['karmabot.user'].invalidate_model(['total_referrals'])
+
+    def _unlink_closure(self):
+        """Удалить пути через ребро из таблицы замыкания"""
+        params = {'referrer': self.referrer_id.id, 'referred': self.referred_id.id}
+        self.env.cr.execute("""
+            DELETE FROM karmabot_referral_closure c
+            WHERE c.ancestor_id IN (
+                SELECT %(referrer)s
+                UNION ALL
+                SELECT ancestor_id FROM karmabot_referral_closure WHERE descendant_id = %(referrer)s
+            )
+            AND c.descendant_id IN (
+                SELECT %(referred)s
+                UNION ALL
+                SELECT descendant_id FROM karmabot_referral_closure WHERE ancestor_id = %(referred)s
+            )
+        """, params)
+        self.env.cr.execute("""
+            UPDATE karmabot_user SET total_referrals = GREATEST(total_referrals - 1, 0)
+            WHERE id = %(referrer)s
+        """, params)
+        self.env['karmabot.user'].invalidate_model(['total_referrals'])
+
+    @api.model
+    def get_downline_counts(self, user_id, max_depth=3):
+        """Получить количество рефералов по уровням"""
+        self.env.cr.execute("""
+            SELECT depth, COUNT(*) FROM karmabot_referral_closure
+            WHERE ancestor_id = %s AND depth <= %s
+            GROUP BY depth
+        """, (user_id, max_depth))
+        counts = dict(self.env.cr.fetchall())
+        return {depth: counts.get(depth, 0) for depth in range(1, max_depth + 1)}
+
+    @api.model
+    def get_top_referrers(self, limit=10, max_depth=1):
+        """Получить список лучших рефереров"""
+        self.env.cr.execute("""
+            SELECT ancestor_id, COUNT(*) AS total FROM karmabot_referral_closure
+            WHERE depth <= %s
+            GROUP BY ancestor_id
+            ORDER BY total DESC, ancestor_id
+            LIMIT %s
+        """, (max_depth, limit))
+        return [{'user_id': user_id, 'referrals': total} for user_id, total in self.env.cr.fetchall()]
+
+    @api.model
+    def get_level_bonuses(self, user_id, points, rates=REFERRAL_BONUS_RATES):
+        """Вычислить бонусы вышестоящих рефереров за баллы пользователя"""
+        if not rates or points <= 0:
+            return []
+        self.env.cr.execute("""
+            SELECT ancestor_id, depth FROM karmabot_referral_closure
+            WHERE descendant_id = %s AND depth <= %s
+            ORDER BY depth
+        """, (user_id, len(rates)))
+        bonuses = []
+        for ancestor_id, depth in self.env.cr.fetchall():
+            bonus = int(points * rates[depth - 1])
+            if bonus > 0:
+                bonuses.append({'user_id': ancestor_id, 'depth': depth, 'points': bonus})
+        return bonuses
+
+
+class KarmaBotReferralClosure(models.Model):
+    _name = 'karmabot.referral.closure'
+    _description = 'KarmaBot Referral Closure'
+    _log_access = False
+
+    ancestor_id = fields.Many2one('karmabot.user', string='Ancestor', required=True, ondelete='cascade')
+    descendant_id = fields.Many2one('karmabot.user', string='Descendant', required=True, ondelete='cascade')
+    depth = fields.Integer(string='Depth', required=True)
+
+    _sql_constraints = [
+        ('path_unique', 'unique(ancestor_id, descendant_id)', 'Referral path must be unique'),
+    ]
+
+    def init(self):
+        # Индексы под выборки по уровням вниз и вверх по цепочке
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_referral_closure_ancestor_depth_idx
+            ON karmabot_referral_closure (ancestor_id, depth, descendant_id)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_referral_closure_descendant_depth_idx
+            ON karmabot_referral_closure (descendant_id, depth, ancestor_id)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_referral_closure_depth_ancestor_idx
+            ON karmabot_referral_closure (depth, ancestor_id)
+        """)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api, _
+from odoo.sql_db import ConnectionPool, Cursor
+from odoo.tools import config
+import contextlib
+import logging
+import psycopg2
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+REPLICA_LAG_CHECK_INTERVAL = 5
+REPLICA_RETRY_INTERVAL = 30
+
+# Пул соединений с репликой и последнее состояние реплики по базам:
+# (время проверки, отставание в секундах или None, если реплика недоступна)
+_replica_pool = None
+_replica_states = {}
+_replica_lock = threading.Lock()
+
+
+def _replica_dsn(dbname):
+    host = config.get('karmabot_replica_host')
+    if not host:
+        return None
+    return {
+        'host': host,
+        'port': int(config.get('karmabot_replica_port') or config['db_port'] or 5432),
+        'user': config['db_user'],
+        'password': config['db_password'],
+        'database': dbname,
+        'sslmode': config['db_sslmode'],
+    }
+
+
+def _get_replica_pool():
+    global _replica_pool
+    with _replica_lock:
+        if _replica_pool is None:
+            _replica_pool = ConnectionPool(int(config.get('karmabot_replica_maxconn') or config['db_maxconn']))
+        return _replica_pool
+
+
+def _replica_lag(cr):
+    """Отставание реплики в секундах; догнавшая WAL реплика считается актуальной"""
+    cr.execute("""
+        SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+               END
+    """)
+    return float(cr.fetchone()[0])
+
+
+class KarmaBotReplicaService(models.AbstractModel):
+    _name = 'karmabot.replica.service'
+    _description = 'KarmaBot Read Replica Routing'
+
+    def _replica_cursor(self, max_lag):
+        """Курсор реплики или None, если читать нужно с основной базы"""
+        dbname = self.env.cr.dbname
+        dsn = _replica_dsn(dbname)
+        if not dsn:
+            return None
+        now = time.monotonic()
+        state = _replica_states.get(dbname)
+        if state and state[1] is None and now - state[0] < REPLICA_RETRY_INTERVAL:
+            return None
+
+        cr = None
+        try:
+            cr = Cursor(_get_replica_pool(), dbname, dsn)
+            cr.execute("SET TRANSACTION READ ONLY")
+            if not state or state[1] is None or now - state[0] >= REPLICA_LAG_CHECK_INTERVAL:
+                state = _replica_states[dbname] = (now, _replica_lag(cr))
+        except Exception as e:
+            _logger.warning(f"Read replica of {dbname} is unavailable, using primary: {e}")
+            _replica_states[dbname] = (now, None)
+            if cr:
+                cr.close()
+            return None
+
+        if state[1] > max_lag:
+            cr.close()
+            return None
+        return cr
+
+    @api.model
+    @contextlib.contextmanager
+    def read_env(self, max_lag=None):
+        """Окружение для только читающих запросов на реплике.
+
+        Если реплика не настроена, недоступна или отстает больше max_lag секунд
+        (по умолчанию - настройка replica_max_lag), выдается текущее окружение.
+        Курсор реплики закрывается при выходе из блока, поэтому наружу стоит
+        отдавать простые данные, а не записи.
+        """
+        if max_lag is None:
+            max_lag = self.env['karmabot.setting'].get('replica_max_lag')
+        cr = self._replica_cursor(max_lag)
+        if cr is None:
+            yield self.env
+            return
+        try:
+            yield self.env(cr=cr)
+        except psycopg2.OperationalError:
+            # Связь с репликой потеряна: следующие запросы пойдут на основную базу
+            _replica_states[self.env.cr.dbname] = (time.monotonic(), None)
+            raise
+        finally:
+            cr.close()
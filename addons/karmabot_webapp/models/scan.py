@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, tools, _
+from odoo.tools import config
+import hashlib
+import hmac
+import logging
+import os
+
+from ..tools.scan_signature import NonceRegistry, issue_scan_token, verify_scan_token
+from ..tools.velocity import VelocityEngine, VelocitySnapshots, parse_velocity_rules
+
+_logger = logging.getLogger(__name__)
+
+# Реестры nonce по базам данных, живут в памяти воркера
+_nonce_registries = {}
+
+# Счетчики частоты сканов по базам данных: (строка правил, движок, снимки)
+_velocity_engines = {}
+
+
+class KarmaBotScanService(models.AbstractModel):
+    _name = 'karmabot.scan.service'
+    _description = 'KarmaBot QR Scan Service'
+
+    @tools.ormcache()
+    def _get_scan_key(self):
+        """Ключ подписи сканов, производный от секрета базы данных"""
+        secret = self.env['ir.config_parameter'].sudo().get_param('database.secret')
+        return hmac.new(secret.encode(), b'karmabot-scan', hashlib.sha256).digest()
+
+    def _get_nonce_registry(self):
+        dbname = self.env.cr.dbname
+        registry = _nonce_registries.get(dbname)
+        if registry is None:
+            log_dir = os.path.join(config['data_dir'], 'karmabot_scan_nonces', dbname)
+            registry = _nonce_registries[dbname] = NonceRegistry(log_dir)
+        return registry
+
+    def _get_velocity_engine(self):
+        """Движок антифрод-правил; при смене правил счетчики переносятся"""
+        dbname = self.env.cr.dbname
+        rules_value = self.env['karmabot.setting'].get('scan_velocity_rules')
+        current = _velocity_engines.get(dbname)
+        if current and current[0] == rules_value:
+            return current[1], current[2]
+
+        engine = VelocityEngine(parse_velocity_rules(rules_value))
+        if current:
+            engine.load(current[1].dump())
+            snapshots = current[2]
+        else:
+            snapshots = VelocitySnapshots(os.path.join(config['data_dir'], 'karmabot_velocity', dbname))
+            snapshots.restore(engine)
+        _velocity_engines[dbname] = (rules_value, engine, snapshots)
+        return engine, snapshots
+
+    def _velocity_scan(self, payload, user):
+        return {'user_id': user.id, 'partner_id': payload.partner_id, 'card_id': payload.card_id}
+
+    def _check_velocity(self, payload, user):
+        """Проверить скан по скользящим окнам, не учитывая его; вернуть нарушенные правила"""
+        engine, _snapshots = self._get_velocity_engine()
+        return engine.check(self._velocity_scan(payload, user))
+
+    def _record_accepted_scan(self, payload, user):
+        """После коммита запомнить nonce в памяти воркера и учесть скан в скользящих окнах.
+
+        До коммита повторы отсекает общая таблица nonce, поэтому откат транзакции
+        (в том числе при повторе запроса после ошибки сериализации) не сжигает
+        токен и не расходует лимиты.
+        """
+        registry = self._get_nonce_registry()
+        engine, snapshots = self._get_velocity_engine()
+        scan = self._velocity_scan(payload, user)
+
+        @self.env.cr.postcommit.add
+        def _record():
+            registry.register(payload.nonce, payload.expiry)
+            engine.record(scan)
+            snapshots.maybe_save(engine)
+
+    @api.model
+    def issue_token(self, card, ttl=300):
+        """Выпустить токен скана для карты"""
+        return issue_scan_token(self._get_scan_key(), card.id, card.partner_id.id, ttl=ttl)
+
+    @api.model
+    def verify_token(self, token):
+        """Проверить подпись токена и отсеять известные повторы без обращения к базе.
+
+        Nonce здесь только проверяется: credit_scan занимает его в базе, а в
+        памяти воркера он запоминается после коммита начисления.
+        """
+        payload = verify_scan_token(self._get_scan_key(), token)
+        if not payload:
+            return None, 'invalid_token'
+        if self._get_nonce_registry().is_used(payload.nonce, payload.expiry):
+            return None, 'already_scanned'
+        return payload, None
+
+    @api.model
+    def process_scan(self, token, user):
+        """Проверить скан и начислить баллы пользователю"""
+        payload, error = self.verify_token(token)
+        if error:
+            return {'success': False, 'error': error}
+        return self.credit_scan(payload, user)
+
+    @api.model
+    def credit_scan(self, payload, user):
+        """Начислить баллы по проверенному скану"""
+        # Антифрод-правила проверяются в памяти до обращения к базе
+        violated = self._check_velocity(payload, user)
+        if violated:
+            self.env['karmabot.audit.event'].log_event('scan_blocked', user_id=user.id, res_id=payload.card_id,
+                                                       message=', '.join(violated))
+            return {'success': False, 'error': 'velocity_limit'}
+
+        if self._get_nonce_registry().is_used(payload.nonce, payload.expiry):
+            return {'success': False, 'error': 'already_scanned'}
+        # Общая таблица nonce защищает от повторов между воркерами и откатывается вместе с транзакцией
+        if not self.env['karmabot.scan.nonce']._claim(payload.nonce.hex(), payload.expiry):
+            return {'success': False, 'error': 'already_scanned'}
+        # В окна попадают только принятые сканы: повторы одного токена не расходуют лимиты
+        self._record_accepted_scan(payload, user)
+
+        points = self.env['karmabot.setting'].get('scan_points')
+        Transaction = self.env['karmabot.loyalty.transaction']
+        maturation_days = Transaction.get_maturation_days()
+        now = fields.Datetime.now()
+        Transaction.create({
+            'user_id': user.id,
+            'transaction_type': 'earn',
+            'points': points,
+            'reason': 'QR scan',
+            'partner_id': payload.partner_id,
+            'card_id': payload.card_id,
+            'scan_nonce': payload.nonce.hex(),
+            'status': 'pending' if maturation_days else 'completed',
+            # Срок созревания есть только у отложенных начислений: по нему их учитывает статистика партнеров
+            'mature_date': fields.Datetime.add(now, days=maturation_days) if maturation_days else False,
+        })
+
+        user.total_scans += 1
+        if maturation_days:
+            # Баллы станут доступны после созревания ночным заданием
+            user.pending_points += points
+            user.update_activity()
+            self.env['karmabot.notification.service'].notify_balance(user)
+        else:
+            user.add_points(points, reason='QR scan')
+        return {'success': True, 'points': points, 'available_points': user.available_points,
+                'pending_points': user.pending_points}
+
+
+class KarmaBotScanNonce(models.Model):
+    _name = 'karmabot.scan.nonce'
+    _description = 'KarmaBot Used Scan Nonce'
+    _log_access = False
+
+    nonce = fields.Char(string='Nonce', required=True, readonly=True)
+    expiry = fields.Datetime(string='Expires At', required=True, readonly=True, index=True)
+
+    _sql_constraints = [
+        ('nonce_unique', 'unique(nonce)', 'QR scan has already been processed'),
+    ]
+
+    @api.model
+    def _claim(self, nonce, expiry):
+        """Зарегистрировать nonce; вернуть False, если его уже использовали"""
+        self.env.cr.execute("""
+            INSERT INTO karmabot_scan_nonce (nonce, expiry)
+            VALUES (%s, TO_TIMESTAMP(%s) AT TIME ZONE 'UTC')
+            ON CONFLICT (nonce) DO NOTHING
+            RETURNING id
+        """, (nonce, expiry))
+        return bool(self.env.cr.fetchone())
+
+    @api.model
+    def _cron_cleanup_expired(self):
+        """Удалить nonce с истекшим сроком действия"""
+        self.env.cr.execute("""
+            DELETE FROM karmabot_scan_nonce WHERE expiry < (NOW() AT TIME ZONE 'UTC')
+        """)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, tools, _
+import logging
+import psycopg2
+
+_logger = logging.getLogger(__name__)
+
+SEARCH_MIN_TRIGRAM_LENGTH = 3
+SEARCH_PAGE_SIZE = 20
+SEARCH_CANDIDATES = 200
+AUTOCOMPLETE_LIMIT = 10
+
+# Таблица -> колонки с триграммными индексами
+TRIGRAM_COLUMNS = {
+    'karmabot_user': ['display_name', 'telegram_username', 'phone', 'email'],
+    'karmabot_partner_card': ['name', 'card_number'],
+}
+# Таблица -> колонка для префиксного автодополнения по btree-индексу
+PREFIX_COLUMNS = {
+    'karmabot_user': 'display_name',
+    'karmabot_partner_card': 'name',
+}
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class KarmaBotSearchService(models.AbstractModel):
+    _name = 'karmabot.search.service'
+    _description = 'KarmaBot Fuzzy Search'
+
+    def _ensure_trigram_extension(self):
+        """Подключить pg_trgm; без прав на CREATE EXTENSION поиск работает без индексов"""
+        cr = self.env.cr
+        cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cr.fetchone():
+            return True
+        try:
+            with cr.savepoint():
+                cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            self.env.registry.clear_cache()
+            return True
+        except psycopg2.Error as e:
+            _logger.warning(f"pg_trgm is not available, fuzzy search will not use indexes: {e}")
+            return False
+
+    @tools.ormcache()
+    def _has_trigram(self):
+        self.env.cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return bool(self.env.cr.fetchone())
+
+    def _create_search_indexes(self, table):
+        """Создать триграммные GiST-индексы и префиксный индекс таблицы.
+
+        GiST, в отличие от GIN, отдает строки в порядке расстояния <->, поэтому
+        выборка кандидатов останавливается на LIMIT, а не читает все совпадения.
+        """
+        cr = self.env.cr
+        if self._ensure_trigram_extension():
+            for column in TRIGRAM_COLUMNS[table]:
+                cr.execute(f"DROP INDEX IF EXISTS {table}_{column}_trgm_idx")
+                cr.execute(f"""
+                    CREATE INDEX IF NOT EXISTS {table}_{column}_trgm_gist_idx
+                    ON {table} USING gist ({column} gist_trgm_ops)
+                """)
+        column = PREFIX_COLUMNS[table]
+        cr.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table}_{column}_prefix_idx
+            ON {table} (lower({column}) text_pattern_ops)
+        """)
+
+    def _normalize_query(self, query):
+        return ' '.join((query or '').split())[:100]
+
+    def _ranked_search(self, table, select, extra_where, query, limit, offset):
+        """Поиск по триграммным колонкам таблицы с ранжированием: префикс, затем сходство.
+
+        Сначала каждая колонка отдает ограниченное число ближайших кандидатов по
+        индексу (префиксу или расстоянию <->), и только они ранжируются similarity().
+        """
+        columns = TRIGRAM_COLUMNS[table]
+        prefix_column = PREFIX_COLUMNS[table]
+        has_trigram = self._has_trigram()
+        candidates = [f"""
+            SELECT id FROM {table}
+            WHERE lower({prefix_column}) LIKE %(prefix)s {extra_where}
+            ORDER BY lower({prefix_column}), id
+            LIMIT %(candidates)s
+        """]
+        # Короткие запросы не покрываются триграммами: только префикс по btree-индексу
+        if len(query) >= SEARCH_MIN_TRIGRAM_LENGTH:
+            for index, column in enumerate(columns):
+                match = f"{column} ILIKE %(like)s"
+                order = 'id'
+                if has_trigram:
+                    order = f"{column} <-> %(query)s"
+                    if not index:
+                        # Оператор % находит имена с опечатками
+                        match += f" OR {column} %% %(query)s"
+                candidates.append(f"""
+                    SELECT id FROM {table}
+                    WHERE ({match}) {extra_where}
+                    ORDER BY {order}
+                    LIMIT %(candidates)s
+                """)
+        if has_trigram:
+            score = 'GREATEST(%s)' % ', '.join(f"similarity(COALESCE({column}, ''), %(query)s)" for column in columns)
+        else:
+            score = '0'
+        sql_params = dict(query=query, like=f"%{_escape_like(query)}%",
+                          prefix=f"{_escape_like(query.lower())}%", limit=limit + 1, offset=offset,
+                          candidates=max(SEARCH_CANDIDATES, offset + limit + 1))
+        self.env.cr.execute(f"""
+            WITH candidates AS (
+                {' UNION '.join(f'({candidate})' for candidate in candidates)}
+            )
+            SELECT {select},
+                   lower({prefix_column}) LIKE %(prefix)s AS is_prefix,
+                   {score} AS score
+            FROM {table}
+            WHERE id IN (SELECT id FROM candidates)
+            ORDER BY is_prefix DESC, score DESC, id
+            LIMIT %(limit)s OFFSET %(offset)s
+        """, sql_params)
+        rows = self.env.cr.dictfetchall()
+        return {
+            'results': rows[:limit],
+            'has_more': len(rows) > limit,
+            'offset': offset,
+        }
+
+    @api.model
+    def search_users(self, query, limit=SEARCH_PAGE_SIZE, offset=0):
+        """Найти пользователей по имени, username, телефону или email"""
+        query = self._normalize_query(query)
+        if not query:
+            return {'results': [], 'has_more': False, 'offset': offset}
+        return self._ranked_search(
+            'karmabot_user',
+            'id, telegram_id, display_name, telegram_username, phone, email, role, available_points',
+            '', query, limit, offset)
+
+    @api.model
+    def search_cards(self, query, limit=SEARCH_PAGE_SIZE, offset=0, active_only=True):
+        """Найти карты партнеров по названию или номеру"""
+        query = self._normalize_query(query)
+        if not query:
+            return {'results': [], 'has_more': False, 'offset': offset}
+        return self._ranked_search(
+            'karmabot_partner_card',
+            'id, name, card_number, partner_id, status',
+            "AND status = 'active'" if active_only else '', query, limit, offset)
+
+    @api.model
+    def autocomplete(self, query, limit=AUTOCOMPLETE_LIMIT, include_users=False):
+        """Подсказки по префиксу названия карты (и имени пользователя для админов)"""
+        query = self._normalize_query(query).lower()
+        if not query:
+            return []
+        prefix = f"{_escape_like(query)}%"
+        self.env.cr.execute("""
+            SELECT 'card' AS type, id, name AS label
+            FROM karmabot_partner_card
+            WHERE lower(name) LIKE %s AND status = 'active'
+            ORDER BY lower(name)
+            LIMIT %s
+        """, (prefix, limit))
+        suggestions = self.env.cr.dictfetchall()
+        if include_users:
+            self.env.cr.execute("""
+                SELECT 'user' AS type, id, display_name AS label
+                FROM karmabot_user
+                WHERE lower(display_name) LIKE %s
+                ORDER BY lower(display_name)
+                LIMIT %s
+            """, (prefix, limit))
+            suggestions += self.env.cr.dictfetchall()
+        return suggestions
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import ValidationError
+import collections
+import json
+import logging
+import types
+
+_logger = logging.getLogger(__name__)
+
+SETTING_CATEGORIES = [
+    ('general', 'General'),
+    ('points', 'Points'),
+    ('security', 'Security'),
+    ('modules', 'Modules'),
+]
+
+SettingDefinition = collections.namedtuple(
+    'SettingDefinition', 'value_type default category label legacy_param validate')
+
+
+def _check_thresholds(value):
+    if not isinstance(value, tuple) or not value or any(not isinstance(item, int) for item in value) \
+            or list(value) != sorted(set(value)):
+        raise ValueError('thresholds must be strictly increasing integers')
+
+
+# Ключ -> определение. legacy_param - системный параметр, который читался до появления
+# настроек: пока значение не сохранено здесь, используется он.
+SETTING_DEFINITIONS = {
+    'scan_points': SettingDefinition(
+        'int', 10, 'points', 'Баллов за скан', 'karmabot_webapp.scan_points', None),
+    'points_maturation_days': SettingDefinition(
+        'int', 0, 'points', 'Дней до созревания баллов', 'karmabot_webapp.points_maturation_days', None),
+    'points_expiry_days': SettingDefinition(
+        'int', 0, 'points', 'Дней до сгорания баллов', 'karmabot_webapp.points_expiry_days', None),
+    'level_thresholds': SettingDefinition(
+        'json', (100, 300, 600, 1000, 1500), 'points', 'Пороги уровней', None, _check_thresholds),
+    'scan_velocity_rules': SettingDefinition(
+        'char', '', 'security', 'Антифрод-правила сканов', 'karmabot_webapp.scan_velocity_rules', None),
+    'rate_limits': SettingDefinition(
+        'char', '', 'security', 'Лимиты запросов', None, None),
+    'replica_max_lag': SettingDefinition(
+        'int', 30, 'general', 'Допустимое отставание реплики, с', None, None),
+    'feature_search': SettingDefinition(
+        'bool', True, 'modules', 'Поиск заведений', None, None),
+    'feature_nearby': SettingDefinition(
+        'bool', True, 'modules', 'Заведения рядом', None, None),
+    'feature_referrals': SettingDefinition(
+        'bool', True, 'modules', 'Реферальная программа', None, None),
+}
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return types.MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    return value
+
+
+def parse_setting(definition, raw):
+    """Преобразовать строковое значение к типу настройки"""
+    if definition.value_type == 'bool':
+        if raw.strip().lower() not in ('1', '0', 'true', 'false'):
+            raise ValueError(raw)
+        value = raw.strip().lower() in ('1', 'true')
+    elif definition.value_type == 'int':
+        value = int(raw)
+    elif definition.value_type == 'float':
+        value = float(raw)
+    elif definition.value_type == 'json':
+        value = _freeze(json.loads(raw))
+    else:
+        value = raw
+    if definition.validate:
+        definition.validate(value)
+    return value
+
+
+def format_setting(definition, value):
+    """Строковое представление значения для хранения"""
+    if definition.value_type == 'bool':
+        return '1' if value in (True, 1, '1', 'true', 'True', 'on') else '0'
+    if definition.value_type == 'json':
+        return value if isinstance(value, str) else json.dumps(value, default=dict)
+    return str(value)
+
+
+class KarmaBotSetting(models.Model):
+    _name = 'karmabot.setting'
+    _description = 'KarmaBot Setting'
+    _order = 'key'
+
+    key = fields.Char(string='Key', required=True, readonly=True)
+    value = fields.Text(string='Value')
+    value_type = fields.Char(string='Type', compute='_compute_definition')
+    category = fields.Selection(SETTING_CATEGORIES, string='Category', compute='_compute_definition')
+
+    _sql_constraints = [
+        ('key_unique', 'unique(key)', 'Setting key must be unique'),
+    ]
+
+    @api.depends('key')
+    def _compute_definition(self):
+        for setting in self:
+            definition = SETTING_DEFINITIONS.get(setting.key)
+            setting.value_type = definition and definition.value_type
+            setting.category = definition and definition.category
+
+    @api.constrains('key', 'value')
+    def _check_value(self):
+        for setting in self:
+            definition = SETTING_DEFINITIONS.get(setting.key)
+            if not definition:
+                raise ValidationError(_('Unknown setting %s') % setting.key)
+            if setting.value:
+                try:
+                    parse_setting(definition, setting.value)
+                except ValueError:
+                    raise ValidationError(_('Invalid value for setting %s') % setting.key)
+
+    # Любое изменение сбрасывает снимок во всех воркерах через сигнал кэша реестра
+    @api.model_create_multi
+    def create(self, vals_list):
+        settings = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return settings
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
+
+    # === Снимок ===
+
+    @api.model
+    @tools.ormcache()
+    def _get_snapshot(self):
+        """Неизменяемый снимок типизированных значений, один на реестр"""
+        self.env.cr.execute("SELECT key, value FROM karmabot_setting")
+        stored = dict(self.env.cr.fetchall())
+        params = self.env['ir.config_parameter'].sudo()
+        values = {}
+        for key, definition in SETTING_DEFINITIONS.items():
+            raw = stored.get(key)
+            if raw is None and definition.legacy_param:
+                raw = params.get_param(definition.legacy_param)
+            value = definition.default
+            if raw not in (None, ''):
+                try:
+                    value = parse_setting(definition, raw)
+                except ValueError:
+                    _logger.warning(f"Ignoring invalid value {raw!r} of setting {key}")
+            values[key] = value
+        return types.MappingProxyType(values)
+
+    @api.model
+    def get(self, key):
+        """Значение настройки без обращения к базе после построения снимка"""
+        return self._get_snapshot()[key]
+
+    @api.model
+    def is_enabled(self, feature):
+        return self._get_snapshot()[f"feature_{feature}"]
+
+    @api.model
+    def get_settings(self, category=None):
+        """Настройки с подписями и текущими значениями для страниц администрирования"""
+        snapshot = self._get_snapshot()
+        return [{
+            'key': key,
+            'label': definition.label,
+            'value_type': definition.value_type,
+            'category': definition.category,
+            'value': format_setting(definition, snapshot[key]),
+            'enabled': snapshot[key] if definition.value_type == 'bool' else None,
+        } for key, definition in SETTING_DEFINITIONS.items()
+            if not category or definition.category == category]
+
+    @api.model
+    def set_values(self, values):
+        """Сохранить значения {ключ: значение}; неизвестные ключи отклоняются"""
+        unknown = set(values) - set(SETTING_DEFINITIONS)
+        if unknown:
+            raise ValidationError(_('Unknown settings: %s') % ', '.join(sorted(unknown)))
+        existing = {setting.key: setting for setting in self.search([('key', 'in', list(values))])}
+        to_create = []
+        for key, value in values.items():
+            raw = format_setting(SETTING_DEFINITIONS[key], value)
+            if key in existing:
+                if existing[key].value != raw:
+                    existing[key].write({'value': raw})
+            else:
+                to_create.append({'key': key, 'value': raw})
+        if to_create:
+            self.create(to_create)
+        return True
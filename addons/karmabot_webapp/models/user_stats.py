@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from datetime import date, timedelta
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+STATS_MONTHS = 24
+STATS_PARTNERS = 20
+EARN_TYPES = ('earn', 'bonus')
+SPEND_TYPES = ('spend', 'penalty', 'expire')
+
+
+def empty_stats():
+    return {
+        'months': {},       # 'YYYY-MM' -> [заработано, потрачено, сканов]
+        'partners': {},     # partner_id -> [название, сканов]
+        'streak': 0,
+        'best_streak': 0,
+        'last_day': None,
+    }
+
+
+def apply_transaction(stats, transaction_type, points, day, partner_id=None, partner_name=None):
+    """Учесть одну транзакцию в снимке статистики"""
+    month = stats['months'].setdefault(day.strftime('%Y-%m'), [0, 0, 0])
+    if transaction_type in EARN_TYPES:
+        month[0] += points
+    elif transaction_type in SPEND_TYPES:
+        month[1] += points
+
+    if not partner_id:
+        return
+    month[2] += 1
+    partner = stats['partners'].setdefault(str(partner_id), [partner_name or '', 0])
+    partner[1] += 1
+
+    # Серия дней подряд со сканами; транзакции задним числом серию не меняют
+    last_day = stats['last_day'] and date.fromisoformat(stats['last_day'])
+    if last_day is None or day > last_day:
+        stats['streak'] = stats['streak'] + 1 if last_day == day - timedelta(days=1) else 1
+        stats['best_streak'] = max(stats['best_streak'], stats['streak'])
+        stats['last_day'] = day.isoformat()
+
+
+def trim_stats(stats):
+    """Оставить последние месяцы и самых частых партнеров"""
+    if len(stats['months']) > STATS_MONTHS:
+        stats['months'] = dict(sorted(stats['months'].items())[-STATS_MONTHS:])
+    if len(stats['partners']) > STATS_PARTNERS:
+        stats['partners'] = dict(sorted(stats['partners'].items(), key=lambda item: item[1][1])[-STATS_PARTNERS:])
+    return stats
+
+
+class KarmaBotUserStats(models.Model):
+    _name = 'karmabot.user.stats'
+    _description = 'KarmaBot User Statistics Snapshot'
+    _log_access = False
+
+    user_id = fields.Many2one('karmabot.user', string='User', required=True, ondelete='cascade', index=True)
+    data = fields.Json(string='Statistics', readonly=True)
+    rebuilt_at = fields.Datetime(string='Rebuilt At', readonly=True)
+
+    _sql_constraints = [
+        ('user_unique', 'unique(user_id)', 'Only one statistics snapshot per user'),
+    ]
+
+    @api.model
+    def get_stats(self, user_id):
+        """Снимок статистики пользователя одним чтением строки"""
+        self.env.cr.execute("SELECT data FROM karmabot_user_stats WHERE user_id = %s", (user_id,))
+        row = self.env.cr.fetchone()
+        stats = row and row[0] or empty_stats()
+        # Снимок меняется только с новыми транзакциями: серия, которая не
+        # продолжилась ни сегодня, ни вчера, уже прервана, рекорд остается
+        last_day = stats['last_day'] and date.fromisoformat(stats['last_day'])
+        if not last_day or last_day < fields.Datetime.now().date() - timedelta(days=1):
+            stats['streak'] = 0
+        stats['months_list'] = [
+            {'month': month, 'earned': values[0], 'spent': values[1], 'scans': values[2]}
+            for month, values in sorted(stats['months'].items(), reverse=True)
+        ]
+        stats['partners_list'] = [
+            {'partner_id': int(partner_id), 'name': values[0], 'scans': values[1]}
+            for partner_id, values in sorted(stats['partners'].items(), key=lambda item: item[1][1], reverse=True)
+        ]
+        return stats
+
+    # === Инкрементальное обновление ===
+
+    def _apply_transactions(self, transactions):
+        """Добавить новые транзакции в снимки их пользователей"""
+        transactions = transactions.filtered(lambda txn: txn.status != 'cancelled')
+        if not transactions:
+            return
+        user_ids = list(set(transactions.user_id.ids))
+        cr = self.env.cr
+        cr.execute("""
+            INSERT INTO karmabot_user_stats (user_id, data)
+            SELECT user_id, %s::jsonb FROM unnest(%s::int[]) user_id
+            ON CONFLICT (user_id) DO NOTHING
+        """, (json.dumps(empty_stats()), user_ids))
+        # Блокировка строк снимков защищает от потери параллельных обновлений
+        cr.execute("""
+            SELECT user_id, data FROM karmabot_user_stats WHERE user_id = ANY(%s) ORDER BY user_id FOR UPDATE
+        """, (user_ids,))
+        snapshots = dict(cr.fetchall())
+
+        for txn in transactions:
+            apply_transaction(snapshots[txn.user_id.id], txn.transaction_type, txn.points,
+                              txn.transaction_date.date(), txn.partner_id.id, txn.partner_id.name)
+
+        cr.execute("""
+            UPDATE karmabot_user_stats s
+            SET data = v.data
+            FROM unnest(%s::int[], %s::jsonb[]) AS v(user_id, data)
+            WHERE s.user_id = v.user_id
+        """, (list(snapshots), [json.dumps(trim_stats(stats)) for stats in snapshots.values()]))
+        self.invalidate_model(['data'])
+
+    # === Полная пересборка ===
+
+    def _rebuild_range(self, user_from, user_to):
+        """Пересчитать снимки пользователей диапазона id из транзакций"""
+        cr = self.env.cr
+        params = {'user_from': user_from, 'user_to': user_to, 'earn': list(EARN_TYPES), 'spend': list(SPEND_TYPES)}
+        snapshots = {}
+
+        cr.execute("""
+            SELECT user_id, to_char(date_trunc('month', transaction_date), 'YYYY-MM'),
+                   COALESCE(SUM(points) FILTER (WHERE transaction_type = ANY(%(earn)s)), 0),
+                   COALESCE(SUM(points) FILTER (WHERE transaction_type = ANY(%(spend)s)), 0),
+                   COUNT(*) FILTER (WHERE partner_id IS NOT NULL)
+            FROM karmabot_loyalty_transaction
+            WHERE user_id > %(user_from)s AND user_id <= %(user_to)s AND status != 'cancelled'
+            GROUP BY 1, 2
+        """, params)
+        for user_id, month, earned, spent, scans in cr.fetchall():
+            snapshots.setdefault(user_id, empty_stats())['months'][month] = [earned, spent, scans]
+
+        cr.execute("""
+            SELECT user_id, partner_id, MAX(p.name), scans FROM (
+                SELECT user_id, partner_id, COUNT(*) AS scans,
+                       ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY COUNT(*) DESC) AS position
+                FROM karmabot_loyalty_transaction
+                WHERE user_id > %(user_from)s AND user_id <= %(user_to)s
+                  AND status != 'cancelled' AND partner_id IS NOT NULL
+                GROUP BY user_id, partner_id
+            ) ranked
+            JOIN res_partner p ON p.id = ranked.partner_id
+            WHERE position <= %(partners)s
+            GROUP BY user_id, partner_id, scans
+        """, dict(params, partners=STATS_PARTNERS))
+        for user_id, partner_id, name, scans in cr.fetchall():
+            snapshots.setdefault(user_id, empty_stats())['partners'][str(partner_id)] = [name, scans]
+
+        # Серии: дни подряд образуют группу с одинаковой разностью day - номер строки
+        cr.execute("""
+            WITH days AS (
+                SELECT DISTINCT user_id, transaction_date::date AS day
+                FROM karmabot_loyalty_transaction
+                WHERE user_id > %(user_from)s AND user_id <= %(user_to)s
+                  AND status != 'cancelled' AND partner_id IS NOT NULL
+            ), islands AS (
+                SELECT user_id, day,
+                       day - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day))::int AS island
+                FROM days
+            ), streaks AS (
+                SELECT user_id, island, COUNT(*) AS length, MAX(day) AS last_day
+                FROM islands
+                GROUP BY user_id, island
+            )
+            SELECT user_id, MAX(length),
+                   (ARRAY_AGG(length ORDER BY last_day DESC))[1],
+                   MAX(last_day)
+            FROM streaks
+            GROUP BY user_id
+        """, params)
+        for user_id, best_streak, streak, last_day in cr.fetchall():
+            stats = snapshots.setdefault(user_id, empty_stats())
+            stats.update(streak=streak, best_streak=best_streak, last_day=last_day.isoformat())
+
+        if snapshots:
+            cr.execute("""
+                INSERT INTO karmabot_user_stats (user_id, data, rebuilt_at)
+                SELECT user_id, data, NOW() AT TIME ZONE 'UTC'
+                FROM unnest(%s::int[], %s::jsonb[]) AS v(user_id, data)
+                ON CONFLICT (user_id) DO UPDATE SET data = EXCLUDED.data, rebuilt_at = EXCLUDED.rebuilt_at
+            """, (list(snapshots), [json.dumps(trim_stats(stats)) for stats in snapshots.values()]))
+        return len(snapshots)
+
+    @api.model
+    def rebuild_all(self, chunk_size=5000, commit=False):
+        """Пересобрать снимки всех пользователей диапазонами id"""
+        self.env.flush_all()
+        self.env.cr.execute("SELECT COALESCE(MAX(id), 0) FROM karmabot_user")
+        max_user_id = self.env.cr.fetchone()[0]
+        rebuilt = 0
+        for user_from in range(0, max_user_id, chunk_size):
+            # Строки диапазона блокируются, чтобы не перезаписать параллельные обновления
+            self.env.cr.execute("""
+                SELECT id FROM karmabot_user_stats WHERE user_id > %s AND user_id <= %s FOR UPDATE
+            """, (user_from, user_from + chunk_size))
+            rebuilt += self._rebuild_range(user_from, user_from + chunk_size)
+            if commit:
+                self.env.cr.commit()
+        self.invalidate_model()
+        _logger.info(f"Rebuilt statistics snapshots for {rebuilt} users")
+        return rebuilt
+
+    @api.model
+    def _cron_rebuild_stats(self):
+        """Ночная пересборка снимков: учитывает изменения мимо ORM (сгорание, созревание)"""
+        return self.rebuild_all(commit=True)
+
+
+class KarmaBotLoyaltyTransaction(models.Model):
+    _inherit = 'karmabot.loyalty.transaction'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        transactions = super().create(vals_list)
+        self.env['karmabot.user.stats'].sudo()._apply_transactions(transactions)
+        return transactions
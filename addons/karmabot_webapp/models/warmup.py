@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api, _
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Общий каркас страниц WebApp компилируется отдельно от вызывающих его шаблонов
+WARMUP_EXTRA_TEMPLATES = ['web.layout']
+
+
+class KarmaBotWarmupService(models.AbstractModel):
+    _name = 'karmabot.warmup.service'
+    _description = 'KarmaBot Worker Warm-up'
+
+    def _warmup_templates(self):
+        """Скомпилировать шаблоны модуля для каждого установленного языка"""
+        keys = self.env['ir.ui.view'].sudo().search([
+            ('type', '=', 'qweb'), ('key', '=like', 'karmabot_webapp.%'),
+        ]).mapped('key')
+        compiled = failed = 0
+        for lang, _name in self.env['res.lang'].get_installed():
+            qweb = self.env['ir.qweb'].with_context(lang=lang)
+            for key in WARMUP_EXTRA_TEMPLATES + keys:
+                try:
+                    qweb._compile(key)
+                    compiled += 1
+                except Exception as e:
+                    failed += 1
+                    _logger.warning(f"Cannot precompile template {key} ({lang}): {e}")
+        return compiled, failed
+
+    def _warmup_caches(self):
+        """Заполнить кэши реестра и воркера, нужные первым запросам"""
+        self.env['karmabot.setting']._get_snapshot()
+        self.env['karmabot.user']._get_telegram_secret_key()
+        self.env['karmabot.scan.service']._get_scan_key()
+        self.env['karmabot.scan.service']._get_velocity_engine()
+        self.env['karmabot.search.service']._has_trigram()
+        self.env['karmabot.partner.card']._get_geo_snapshot()
+        # Поиск по telegram_id поднимает в память страницы индекса, по которому
+        # маршруты находят пользователя
+        self.env.cr.execute("SELECT id FROM karmabot_user WHERE telegram_id = %s", ('0',))
+
+    @api.model
+    def warmup(self):
+        """Прогреть воркер; возвращает отчет с длительностью этапов в миллисекундах"""
+        started = time.monotonic()
+        report = {'dbname': self.env.cr.dbname}
+
+        self.env.cr.execute("SELECT 1")
+        report['connection_ms'] = round((time.monotonic() - started) * 1000)
+
+        # Сбой одного этапа не отменяет остальные: непрогретое заполнится первым запросом
+        step = time.monotonic()
+        try:
+            with self.env.cr.savepoint():
+                self._warmup_caches()
+        except Exception as e:
+            report['caches_error'] = str(e)
+            _logger.warning(f"KarmaBot warm-up of caches failed: {e}")
+        report['caches_ms'] = round((time.monotonic() - step) * 1000)
+
+        step = time.monotonic()
+        try:
+            with self.env.cr.savepoint():
+                report['templates'], report['failed_templates'] = self._warmup_templates()
+        except Exception as e:
+            report['templates_error'] = str(e)
+            _logger.warning(f"KarmaBot warm-up of templates failed: {e}")
+        report['templates_ms'] = round((time.monotonic() - step) * 1000)
+
+        report['total_ms'] = round((time.monotonic() - started) * 1000)
+        _logger.info(f"KarmaBot warm-up: {report}")
+        return report
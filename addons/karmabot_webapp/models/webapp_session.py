@@ -2,6 +2,7 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
+from datetime import timedelta
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -34,6 +35,17 @@ class KarmaBotWebAppSession(models.Model):
     # Дополнительные данные
     session_data = fields.Text(string='Session Data', help='JSON data for session')
     
+    def init(self):
+        # Индексы под аналитику по периоду и выборку активных сессий
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_webapp_session_start_time_idx
+            ON karmabot_webapp_session (start_time)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS karmabot_webapp_session_active_idx
+            ON karmabot_webapp_session (user_id) WHERE is_active
+        """)
+    
     @api.model
     def create_session(self, user_id, session_type, ip_address=None, user_agent=None, session_data=None):
         """Создать новую сессию WebApp"""
@@ -53,18 +65,21 @@ class KarmaBotWebAppSession(models.Model):
             'is_active': True
         })
         
-        _logger.info(f"Created new WebApp session for user {user_id}, type: {session_type}")
+        self.env['karmabot.audit.event'].log_event('session_create', user_id=user_id, res_id=session.id,
+                                                   message=session_type)
+        self.env['karmabot.activity.sketch'].sudo().record_activity(session.user_id)
         return session
     
     def update_activity(self):
         """Обновить активность сессии"""
         self.last_activity = fields.Datetime.now()
+        self.env['karmabot.activity.sketch'].sudo().record_activity(self.user_id)
     
     def end_session(self):
         """Завершить сессию"""
         self.is_active = False
         self.end_time = fields.Datetime.now()
-        _logger.info(f"Ended WebApp session {self.id}")
+        self.env['karmabot.audit.event'].log_event('session_end', user_id=self.user_id.id, res_id=self.id)
     
     @api.model
     def cleanup_inactive_sessions(self, hours=24):
@@ -114,4 +129,127 @@ class KarmaBotWebAppSession(models.Model):
             'duration': self.get_session_duration(),
             'is_active': self.is_active,
             'ip_address': self.ip_address
-        }
\ No newline at end of file
+        }
+    
+    # === Аналитика сессий ===
+    
+    def _analytics_period(self, date_from, date_to):
+        date_to = date_to or fields.Datetime.now()
+        date_from = date_from or date_to - timedelta(days=30)
+        return date_from, date_to
+    
+    @api.model
+    def get_session_stats(self, date_from=None, date_to=None, session_type=None):
+        """Длительность сессий (среднее и перцентили, в секундах) и число сессий на пользователя"""
+        date_from, date_to = self._analytics_period(date_from, date_to)
+        type_condition = "AND session_type = %(session_type)s" if session_type else ""
+        self.env.cr.execute(f"""
+            WITH sessions AS (
+                SELECT user_id,
+                       EXTRACT(EPOCH FROM COALESCE(end_time, NOW() AT TIME ZONE 'UTC') - start_time) AS duration
+                FROM karmabot_webapp_session
+                WHERE start_time >= %(date_from)s AND start_time < %(date_to)s
+                  {type_condition}
+            ), per_user AS (
+                SELECT user_id, COUNT(*) AS sessions FROM sessions GROUP BY user_id
+            )
+            SELECT
+                (SELECT COUNT(*) FROM sessions),
+                (SELECT COUNT(*) FROM per_user),
+                (SELECT AVG(duration) FROM sessions),
+                (SELECT percentile_cont(ARRAY[0.5, 0.9, 0.99]) WITHIN GROUP (ORDER BY duration) FROM sessions),
+                (SELECT AVG(sessions) FROM per_user),
+                (SELECT percentile_cont(0.9) WITHIN GROUP (ORDER BY sessions) FROM per_user),
+                (SELECT MAX(sessions) FROM per_user)
+        """, {'date_from': date_from, 'date_to': date_to, 'session_type': session_type})
+        total, users, avg_duration, percentiles, avg_per_user, p90_per_user, max_per_user = self.env.cr.fetchone()
+        percentiles = percentiles or [None, None, None]
+        return {
+            'sessions': total,
+            'users': users,
+            'avg_duration': round(avg_duration or 0),
+            'p50_duration': round(percentiles[0] or 0),
+            'p90_duration': round(percentiles[1] or 0),
+            'p99_duration': round(percentiles[2] or 0),
+            'avg_sessions_per_user': round(float(avg_per_user or 0), 2),
+            'p90_sessions_per_user': round(p90_per_user or 0, 2),
+            'max_sessions_per_user': max_per_user or 0,
+        }
+    
+    @api.model
+    def get_session_type_stats(self, date_from=None, date_to=None):
+        """Сессии, пользователи и средняя длительность по типам кабинетов"""
+        date_from, date_to = self._analytics_period(date_from, date_to)
+        self.env.cr.execute("""
+            SELECT session_type, COUNT(*), COUNT(DISTINCT user_id),
+                   AVG(EXTRACT(EPOCH FROM COALESCE(end_time, NOW() AT TIME ZONE 'UTC') - start_time)),
+                   COUNT(*) FILTER (WHERE is_active)
+            FROM karmabot_webapp_session
+            WHERE start_time >= %s AND start_time < %s
+            GROUP BY session_type
+            ORDER BY 2 DESC
+        """, (date_from, date_to))
+        return [{
+            'session_type': session_type,
+            'sessions': sessions,
+            'users': users,
+            'avg_duration': round(avg_duration or 0),
+            'active': active,
+        } for session_type, sessions, users, avg_duration, active in self.env.cr.fetchall()]
+    
+    @api.model
+    def get_concurrency_peaks(self, date_from=None, date_to=None, bucket='hour'):
+        """Пиковое число одновременных сессий по часам или дням"""
+        if bucket not in ('hour', 'day'):
+            raise ValidationError(_('Unsupported bucket: %s') % bucket)
+        date_from, date_to = self._analytics_period(date_from, date_to)
+        # Начало сессии +1, окончание -1; накопленная сумма дает число открытых сессий.
+        # При равном времени окончание считается раньше начала.
+        self.env.cr.execute("""
+            WITH sessions AS (
+                SELECT GREATEST(start_time, %(date_from)s) AS started,
+                       COALESCE(end_time, NOW() AT TIME ZONE 'UTC') AS ended
+                FROM karmabot_webapp_session
+                WHERE start_time < %(date_to)s
+                  AND (end_time IS NULL OR end_time > %(date_from)s)
+            ), events AS (
+                SELECT started AS ts, 1 AS delta FROM sessions
+                UNION ALL
+                SELECT ended, -1 FROM sessions WHERE ended < %(date_to)s
+            ), running AS (
+                SELECT ts, SUM(delta) OVER (ORDER BY ts, delta ROWS UNBOUNDED PRECEDING) AS concurrent
+                FROM events
+            )
+            SELECT date_trunc(%(bucket)s, ts) AS period, MAX(concurrent)
+            FROM running
+            GROUP BY period
+            ORDER BY period
+        """, {'date_from': date_from, 'date_to': date_to, 'bucket': bucket})
+        return [{'period': period, 'peak': int(peak)} for period, peak in self.env.cr.fetchall()]
+    
+    @api.model
+    def get_active_session_counts(self):
+        """Число активных сессий по типам без загрузки записей"""
+        self.env.cr.execute("""
+            SELECT session_type, COUNT(*) FROM karmabot_webapp_session
+            WHERE is_active
+            GROUP BY session_type
+        """)
+        return dict(self.env.cr.fetchall())
+    
+    @api.model
+    def get_session_rows(self, limit=50, active_only=True):
+        """Последние сессии компактными строками; длительность считается в SQL"""
+        self.env.cr.execute(f"""
+            SELECT s.id, s.user_id, u.display_name, s.session_type, s.start_time, s.last_activity,
+                   EXTRACT(EPOCH FROM COALESCE(s.end_time, NOW() AT TIME ZONE 'UTC') - s.start_time)::int,
+                   s.is_active, s.ip_address
+            FROM karmabot_webapp_session s
+            JOIN karmabot_user u ON u.id = s.user_id
+            {"WHERE s.is_active" if active_only else ""}
+            ORDER BY s.start_time DESC
+            LIMIT %s
+        """, (limit,))
+        keys = ('id', 'user_id', 'user_name', 'session_type', 'start_time', 'last_activity',
+                'duration', 'is_active', 'ip_address')
+        return [dict(zip(keys, row)) for row in self.env.cr.fetchall()]
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+from . import test_benchmark
+from . import test_tools
+from . import test_transaction_partition
+from . import test_points_lifecycle
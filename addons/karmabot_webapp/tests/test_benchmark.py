@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Микробенчмарки горячих методов моделей KarmaBot.
+
+Запуск (не входит в стандартный набор тестов):
+
+    odoo-bin -d bench_db -i karmabot_webapp --test-tags karmabot_benchmark --stop-after-init
+
+Переменные окружения:
+    KARMABOT_BENCH_SIZES            размеры данных, по умолчанию 100,1000,10000
+    KARMABOT_BENCH_OUTPUT           файл для результатов в JSON
+    KARMABOT_BENCH_BASELINE         JSON предыдущего прогона для сравнения
+    KARMABOT_BENCH_THRESHOLD        допустимый рост времени, по умолчанию 0.25
+    KARMABOT_BENCH_QUERY_THRESHOLD  допустимый рост числа запросов, по умолчанию 0
+"""
+
+from odoo.tests import TransactionCase, tagged
+import json
+import logging
+import os
+import time
+
+_logger = logging.getLogger(__name__)
+
+BENCH_SIZES = [int(size) for size in os.environ.get('KARMABOT_BENCH_SIZES', '100,1000,10000').split(',')]
+BENCH_REPEAT = 20
+
+
+@tagged('-standard', 'karmabot_benchmark')
+class TestKarmaBotBenchmark(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.results = {}
+        cls.baseline = {}
+        baseline_path = os.environ.get('KARMABOT_BENCH_BASELINE')
+        if baseline_path:
+            with open(baseline_path) as baseline:
+                cls.baseline = json.load(baseline)
+        cls.time_threshold = float(os.environ.get('KARMABOT_BENCH_THRESHOLD', 0.25))
+        cls.query_threshold = float(os.environ.get('KARMABOT_BENCH_QUERY_THRESHOLD', 0))
+
+    @classmethod
+    def tearDownClass(cls):
+        output_path = os.environ.get('KARMABOT_BENCH_OUTPUT')
+        if output_path:
+            with open(output_path, 'w') as output:
+                json.dump(cls.results, output, indent=2, sort_keys=True)
+        for key, result in sorted(cls.results.items()):
+            _logger.info(f"{key}: {result['ms']:.3f} ms, {result['queries']:.1f} queries")
+        super().tearDownClass()
+
+    # === Подготовка данных ===
+
+    def _populate_users(self, size):
+        """Создать пользователей одним запросом и вернуть их id.
+
+        Размер входит в telegram_id: тест заполняет данные для каждого размера
+        в одной транзакции, а telegram_id уникален.
+        """
+        self.env.cr.execute("""
+            INSERT INTO karmabot_user
+                (telegram_id, display_name, name, role, is_active, is_verified,
+                 total_points, available_points, pending_points, total_scans, total_referrals,
+                 registration_date, last_activity, create_date, write_date)
+            SELECT 'bench-' || %(size)s || '-' || n, 'Bench ' || n, 'Bench ' || n, 'user', TRUE, FALSE,
+                   1000, 1000, 0, 0, 0,
+                   NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC',
+                   NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC'
+            FROM generate_series(1, %(size)s) n
+            RETURNING id
+        """, {'size': size})
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    def _populate_sessions(self, user_ids, hours_ago=0):
+        self.env.cr.execute("""
+            INSERT INTO karmabot_webapp_session
+                (user_id, session_type, is_active, start_time, last_activity, create_date, write_date)
+            SELECT user_id, 'user_cabinet', TRUE, ts, ts, ts, ts
+            FROM unnest(%s) user_id, (SELECT (NOW() AT TIME ZONE 'UTC') - %s * INTERVAL '1 hour' AS ts) t
+        """, (user_ids, hours_ago))
+
+    def _populate_tokens(self, user_ids, hours_ago=0):
+        self.env.cr.execute("""
+            INSERT INTO karmabot_sso_token
+                (token, user_id, token_type, is_active, expires_at, create_date, write_date)
+            SELECT 'bench-' || user_id || '-' || %s, user_id, 'webapp_sso', TRUE,
+                   ts + INTERVAL '24 hours', ts, ts
+            FROM unnest(%s) user_id, (SELECT (NOW() AT TIME ZONE 'UTC') - %s * INTERVAL '1 hour' AS ts) t
+        """, (hours_ago, user_ids, hours_ago))
+
+    # === Измерение и сравнение ===
+
+    def _measure(self, name, size, func, repeat=BENCH_REPEAT):
+        """Измерить среднее время и число запросов на вызов"""
+        self.env.flush_all()
+        self.env.invalidate_all()
+        cr = self.env.cr
+        queries_before = cr.sql_log_count
+        started = time.perf_counter()
+        for i in range(repeat):
+            func(i)
+        self.env.flush_all()
+        elapsed = time.perf_counter() - started
+
+        key = f"{name}[{size}]"
+        result = {
+            'ms': elapsed * 1000 / repeat,
+            'queries': (cr.sql_log_count - queries_before) / repeat,
+        }
+        self.results[key] = result
+        self._check_regression(key, result)
+        return result
+
+    def _check_regression(self, key, result):
+        base = self.baseline.get(key)
+        if not base:
+            return
+        if result['queries'] > base['queries'] * (1 + self.query_threshold):
+            self.fail(f"{key}: query count regressed from {base['queries']:.1f} to {result['queries']:.1f}")
+        if result['ms'] > base['ms'] * (1 + self.time_threshold):
+            self.fail(f"{key}: time regressed from {base['ms']:.3f} ms to {result['ms']:.3f} ms")
+
+    # === Бенчмарки ===
+
+    def test_user_points(self):
+        KarmaBotUser = self.env['karmabot.user']
+        for size in BENCH_SIZES:
+            with self.subTest(size=size):
+                users = KarmaBotUser.browse(self._populate_users(size))
+                self._measure('add_points', size, lambda i: users[i % size].add_points(10, reason='bench'))
+                self._measure('spend_points', size, lambda i: users[i % size].spend_points(5, reason='bench'))
+
+    def test_create_session(self):
+        Session = self.env['karmabot.webapp_session']
+        for size in BENCH_SIZES:
+            with self.subTest(size=size):
+                user_ids = self._populate_users(size)
+                self._populate_sessions(user_ids)
+                self._measure('create_session', size, lambda i: Session.create_session(
+                    user_ids[i % size], 'user_cabinet', ip_address='127.0.0.1', user_agent='bench'))
+
+    def test_sso_tokens(self):
+        Token = self.env['karmabot.sso_token']
+        for size in BENCH_SIZES:
+            with self.subTest(size=size):
+                user_ids = self._populate_users(size)
+                self._populate_tokens(user_ids)
+                # Токен зависит от пользователя и секунды, поэтому каждому вызову свой пользователь
+                tokens = []
+                self._measure('generate_token', size, lambda i: tokens.append(
+                    Token.generate_token(user_ids[i % size]).token))
+                self._measure('validate_token', size, lambda i: Token.validate_token(tokens[i % len(tokens)]))
+
+    def test_cleanup(self):
+        Token = self.env['karmabot.sso_token']
+        Session = self.env['karmabot.webapp_session']
+        for size in BENCH_SIZES:
+            with self.subTest(size=size):
+                user_ids = self._populate_users(size)
+                self._populate_tokens(user_ids, hours_ago=48)
+                self._populate_sessions(user_ids, hours_ago=48)
+                self._measure('cleanup_expired_tokens', size, lambda i: Token.cleanup_expired_tokens(), repeat=1)
+                self._measure('cleanup_inactive_sessions', size,
+                              lambda i: Session.cleanup_inactive_sessions(hours=24), repeat=1)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Созревание pending-баллов и сгорание партий по FIFO."""
+
+from odoo import fields
+from odoo.tests import TransactionCase, tagged
+from datetime import timedelta
+
+from ..models.points_lifecycle import EXPIRY_CHECKPOINT_PARAM
+
+
+@tagged('post_install', '-at_install', 'karmabot')
+class TestPointsLifecycle(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Transaction = cls.env['karmabot.loyalty.transaction']
+        cls.now = fields.Datetime.now()
+        cls.partner = cls.env['res.partner'].create({'name': 'Lifecycle Partner'})
+        cls.env['karmabot.setting'].set_values({'points_expiry_days': 30})
+        cls.env['ir.config_parameter'].sudo().set_param(EXPIRY_CHECKPOINT_PARAM, 0)
+
+    def _user(self, telegram_id, **balances):
+        return self.env['karmabot.user'].create(dict(telegram_id=telegram_id, display_name=telegram_id, **balances))
+
+    def _lot(self, user, points, days_ago, **vals):
+        return self.Transaction.create(dict({
+            'user_id': user.id,
+            'transaction_type': 'earn',
+            'points': points,
+            'transaction_date': self.now - timedelta(days=days_ago),
+            'status': 'completed',
+        }, **vals))
+
+    def _fifo_user(self):
+        """Партии 50, 30 и 40 баллов от старой к новой; потрачено 60"""
+        user = self._user('lifecycle-fifo', total_points=120, available_points=60)
+        lots = self._lot(user, 50, 60) + self._lot(user, 30, 45) + self._lot(user, 40, 5)
+        return user, lots
+
+    def test_maturation(self):
+        user = self._user('lifecycle-maturation', pending_points=100)
+        matured = self._lot(user, 60, 3, status='pending', partner_id=self.partner.id,
+                            mature_date=self.now - timedelta(hours=1))
+        waiting = self._lot(user, 40, 1, status='pending', mature_date=self.now + timedelta(days=1))
+
+        report = self.Transaction.run_points_lifecycle()
+
+        self.assertTrue(report['completed'])
+        self.assertGreaterEqual(report['matured_points'], 60)
+        self.assertEqual(matured.status, 'completed')
+        self.assertEqual(waiting.status, 'pending')
+        self.assertEqual((user.pending_points, user.available_points, user.total_points), (40, 60, 60))
+        # Созревшее начисление партнера попадает в дневную статистику
+        stat = self.env['karmabot.partner.daily.stat'].search([
+            ('partner_id', '=', self.partner.id), ('transaction_type', '=', 'earn'),
+        ])
+        self.assertEqual((stat.points_sum, stat.txn_count), (60, 1))
+
+    def test_fifo_expiry(self):
+        user, (oldest, partly_spent, recent) = self._fifo_user()
+
+        self.Transaction.run_points_lifecycle()
+
+        # Потраченные 60 баллов закрывают самую старую партию и 10 баллов следующей;
+        # сгорает только неизрасходованный остаток устаревших партий
+        self.assertEqual(oldest.remaining_points, 0)
+        self.assertEqual(partly_spent.remaining_points, 0)
+        self.assertEqual(recent.remaining_points, 40)
+        self.assertEqual(user.available_points, 40)
+        expired = self.Transaction.search([('user_id', '=', user.id), ('transaction_type', '=', 'expire')])
+        self.assertEqual(expired.points, 20)
+
+    def test_dry_run(self):
+        user, lots = self._fifo_user()
+        pending = self._lot(user, 10, 2, status='pending', mature_date=self.now - timedelta(hours=1))
+        user.pending_points = 10
+
+        dry_report = self.Transaction.run_points_lifecycle(dry_run=True)
+
+        self.assertTrue(dry_report['dry_run'])
+        self.assertGreaterEqual(dry_report['expired_points'], 20)
+        self.assertGreaterEqual(dry_report['matured_points'], 10)
+        self.assertEqual((user.available_points, user.pending_points, user.total_points), (60, 10, 120))
+        self.assertEqual(pending.status, 'pending')
+        self.assertEqual(lots.mapped('remaining_points'), [0, 0, 0])
+        self.assertFalse(self.Transaction.search([('user_id', '=', user.id), ('transaction_type', '=', 'expire')]))
+
+        # Отчет dry run совпадает с тем, что затем делает настоящий запуск
+        report = self.Transaction.run_points_lifecycle()
+        for key in ('matured_lots', 'matured_points', 'expired_lots', 'expired_points'):
+            self.assertEqual(report[key], dry_report[key], key)
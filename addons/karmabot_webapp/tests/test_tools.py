@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Тесты чистых вспомогательных модулей: они не обращаются к базе."""
+
+from odoo.tests.common import BaseCase, tagged
+import datetime
+import gzip
+import json
+
+from ..tools import geo, hyperloglog, json_response
+from ..tools.velocity import VELOCITY_BUCKETS, VelocityEngine, parse_velocity_rules
+
+
+@tagged('post_install', '-at_install', 'karmabot')
+class TestVelocity(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.engine = VelocityEngine(parse_velocity_rules('user:60:2,card:60:3'))
+        self.scan = {'user_id': 1, 'partner_id': 10, 'card_id': 100}
+
+    def test_parse_rules(self):
+        rules = parse_velocity_rules('user:60:20, bogus:60:1, partner:x:1, card:30:5')
+        self.assertEqual([rule.name for rule in rules], ['user:60:20', 'card:30:5'])
+        self.assertTrue(parse_velocity_rules(''), 'empty value falls back to the default rules')
+
+    def test_hit_blocks_over_limit(self):
+        now = 1000000.0
+        self.assertEqual(self.engine.hit(self.scan, now), [])
+        self.assertEqual(self.engine.hit(self.scan, now), [])
+        self.assertEqual(self.engine.hit(self.scan, now), ['user:60:2'])
+        # Отклоненный скан не учитывается
+        self.assertEqual(self.engine.count(self.engine.rules[1], self.scan, now), 2)
+
+    def test_check_does_not_record(self):
+        now = 1000000.0
+        for _i in range(5):
+            self.assertEqual(self.engine.check(self.scan, now), [])
+        self.engine.record(self.scan, now)
+        self.engine.record(self.scan, now)
+        self.assertEqual(self.engine.check(self.scan, now), ['user:60:2'])
+
+    def test_window_slides(self):
+        now = 1000000.0
+        self.engine.hit(self.scan, now)
+        self.engine.hit(self.scan, now)
+        self.assertEqual(self.engine.check(self.scan, now + 30), ['user:60:2'])
+        self.assertEqual(self.engine.check(self.scan, now + 60 + 60 / VELOCITY_BUCKETS), [])
+
+    def test_keys_are_separate(self):
+        now = 1000000.0
+        self.engine.hit(self.scan, now)
+        self.engine.hit(self.scan, now)
+        self.assertEqual(self.engine.hit(dict(self.scan, user_id=2), now), [])
+
+    def test_dump_load(self):
+        now = 1000000.0
+        self.engine.hit(self.scan, now)
+        restored = VelocityEngine(self.engine.rules)
+        restored.load(json.loads(json.dumps(self.engine.dump())), now)
+        self.assertEqual(restored.count(self.engine.rules[0], self.scan, now), 1)
+        # Устаревшие счетчики из снимка отбрасываются
+        expired = VelocityEngine(self.engine.rules)
+        expired.load(self.engine.dump(), now + 3600)
+        self.assertEqual(expired.count(self.engine.rules[0], self.scan, now + 3600), 0)
+
+
+@tagged('post_install', '-at_install', 'karmabot')
+class TestHyperLogLog(BaseCase):
+
+    def _sketch(self, values):
+        registers = bytearray(hyperloglog.empty_registers())
+        for value in values:
+            index, rank = hyperloglog.hash_position(value)
+            registers[index] = max(registers[index], rank)
+        return bytes(registers)
+
+    def test_empty(self):
+        self.assertEqual(hyperloglog.estimate(hyperloglog.empty_registers()), 0)
+        self.assertEqual(hyperloglog.estimate(b''), 0)
+
+    def test_estimate_within_error(self):
+        for size in (100, 5000, 50000):
+            estimate = hyperloglog.estimate(self._sketch(range(size)))
+            self.assertLess(abs(estimate - size) / size, 3 * hyperloglog.HLL_ERROR, size)
+
+    def test_duplicates_do_not_count(self):
+        self.assertEqual(self._sketch(list(range(1000)) * 3), self._sketch(range(1000)))
+
+    def test_merge_is_union(self):
+        first, second = self._sketch(range(0, 3000)), self._sketch(range(2000, 5000))
+        self.assertEqual(hyperloglog.merge_registers(first, second), self._sketch(range(5000)))
+        self.assertEqual(hyperloglog.merge_registers(first, None), first)
+        self.assertEqual(hyperloglog.merge_registers(), hyperloglog.empty_registers())
+
+
+@tagged('post_install', '-at_install', 'karmabot')
+class TestGeo(BaseCase):
+
+    def test_geo_cell(self):
+        self.assertIsNone(geo.geo_cell(None, 37.6))
+        self.assertEqual(geo.geo_cell(55.751, 37.618), geo.geo_cell(55.7501, 37.6001))
+        self.assertNotEqual(geo.geo_cell(55.751, 37.618), geo.geo_cell(55.751, 37.718))
+        # Полюс и линия перемены дат не выходят за пределы сетки
+        for latitude, longitude in ((90, 180), (-90, -180), (90, -180)):
+            self.assertIn(geo.geo_cell(latitude, longitude), range(geo._LAT_CELLS * geo._LON_CELLS))
+
+    def test_cells_in_radius(self):
+        cells = geo.cells_in_radius(55.751, 37.618, 3)
+        self.assertIn(geo.geo_cell(55.751, 37.618), cells)
+        self.assertIn(geo.geo_cell(55.751 + 0.02, 37.618 - 0.04), cells)
+        self.assertEqual(len(cells), len(set(cells)))
+        # Круг у линии перемены дат захватывает ячейки по обе стороны
+        cells = geo.cells_in_radius(0, 179.99, 5)
+        self.assertIn(geo.geo_cell(0, -179.99), cells)
+
+    def test_haversine(self):
+        # Москва - Санкт-Петербург, около 634 км
+        distance, = geo.haversine_km(55.7558, 37.6173, [59.9343], [30.3351])
+        self.assertAlmostEqual(distance, 634, delta=5)
+        self.assertEqual(geo.haversine_km(10, 20, [10], [20]), [0.0])
+
+    def test_snapshot_nearby(self):
+        rows = [
+            (1, 'near', 55.7520, 37.6180),
+            (2, 'nearest', 55.7510, 37.6180),
+            (3, 'far', 55.9000, 37.6180),
+            (4, 'no coordinates', None, None),
+        ]
+        found = geo.GeoSnapshot(rows).nearby(55.751, 37.618, 2)
+        self.assertEqual([row[0] for _distance, row in found], [2, 1])
+        self.assertEqual(len(geo.GeoSnapshot(rows).nearby(55.751, 37.618, 2, limit=1)), 1)
+        self.assertEqual(geo.refine_nearby([], 0, 0, 1), [])
+
+
+@tagged('post_install', '-at_install', 'karmabot')
+class TestJsonResponse(BaseCase):
+
+    def test_dumps(self):
+        data = {
+            'date': datetime.date(2024, 5, 1),
+            'datetime': datetime.datetime(2024, 5, 1, 12, 30),
+            'tags': {'a'},
+            'name': 'Карма',
+        }
+        decoded = json_response.loads(json_response.dumps(data))
+        self.assertEqual(decoded['date'], '2024-05-01')
+        self.assertTrue(decoded['datetime'].startswith('2024-05-01T12:30'))
+        self.assertEqual(decoded['tags'], ['a'])
+        self.assertEqual(decoded['name'], 'Карма')
+        with self.assertRaises(TypeError):
+            json_response.dumps({'value': object()})
+
+    def test_project(self):
+        data = {'id': 1, 'name': 'x', 'points': 5}
+        self.assertEqual(json_response.project(data, ['id', 'points', 'missing']), {'id': 1, 'points': 5})
+        self.assertIs(json_response.project(data, None), data)
+        self.assertIs(json_response.project(data, 'id'), data)
+
+    def test_negotiate_encoding(self):
+        self.assertIsNone(json_response.negotiate_encoding(None))
+        self.assertIsNone(json_response.negotiate_encoding('identity'))
+        self.assertEqual(json_response.negotiate_encoding('gzip, deflate'), 'gzip')
+        self.assertIsNone(json_response.negotiate_encoding('gzip;q=0'))
+        self.assertEqual(json_response.negotiate_encoding('*'), 'br' if json_response.brotli else 'gzip')
+
+    def test_encode_body(self):
+        small = b'{"ok":true}'
+        self.assertEqual(json_response.encode_body(small, 'gzip'), (small, None))
+        large = json_response.dumps({'items': list(range(1000))})
+        self.assertEqual(json_response.encode_body(large, None), (large, None))
+        body, encoding = json_response.encode_body(large, 'gzip')
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(gzip.decompress(body), large)
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""Повторная инициализация партиционированной таблицы транзакций."""
+
+from odoo.tests import TransactionCase, tagged
+
+from ..models.loyalty_transaction_partition import TRANSACTION_TABLE
+
+
+@tagged('post_install', '-at_install', 'karmabot')
+class TestTransactionPartition(TransactionCase):
+
+    def _table_kind(self):
+        self.env.cr.execute("SELECT relkind FROM pg_class WHERE relname = %s", (TRANSACTION_TABLE,))
+        return self.env.cr.fetchone()[0]
+
+    def test_reinit_keeps_partitioned_table(self):
+        """Как при -u: _auto_init и init повторно выполняются на уже партиционированной таблице"""
+        Transaction = self.env['karmabot.loyalty.transaction']
+        user = self.env['karmabot.user'].create({'telegram_id': 'partition-test', 'display_name': 'Partition'})
+        before = Transaction.create({'user_id': user.id, 'transaction_type': 'earn', 'points': 5})
+        self.assertEqual(self._table_kind(), 'p')
+
+        for _i in range(2):
+            Transaction._auto_init()
+            Transaction.init()
+            self.assertEqual(self._table_kind(), 'p')
+
+        self.assertTrue(Transaction._get_partitions())
+        after = Transaction.create({'user_id': user.id, 'transaction_type': 'earn', 'points': 7})
+        self.assertEqual(set(Transaction.get_user_transactions(user.id).ids), {before.id, after.id})
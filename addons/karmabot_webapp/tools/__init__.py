@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+from . import scan_signature
+from . import telegram_auth
+from . import hyperloglog
+from . import geo
+from . import velocity
+from . import json_response
+from . import export_formats
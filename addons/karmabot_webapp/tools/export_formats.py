@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Потоковая запись выгрузок в CSV, NDJSON и XLSX.
+
+Писатели принимают заголовок и итератор пачек строк и отдают байтовые куски
+по мере чтения пачек, не накапливая выгрузку в памяти. XLSX - zip-архив,
+который можно собрать только целиком: строки пишутся xlsxwriter в режиме
+constant_memory во временный файл, и файл отдается кусками после записи.
+"""
+
+import csv
+import io
+import tempfile
+
+from .json_response import dumps
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+XLSX_MAX_ROWS = 1048575
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def csv_chunks(header, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM нужен Excel, чтобы распознать UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(header, batches):
+    for batch in batches:
+        yield b''.join(dumps(dict(zip(header, row))) + b'\n' for row in batch)
+
+
+def xlsx_chunks(header, batches):
+    with tempfile.TemporaryFile() as output:
+        workbook = xlsxwriter.Workbook(output, {
+            'constant_memory': True,
+            'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        })
+        worksheet, row_index = None, XLSX_MAX_ROWS
+        for batch in batches:
+            for row in batch:
+                # Лист ограничен миллионом строк, дальше выгрузка продолжается на следующем
+                if row_index >= XLSX_MAX_ROWS:
+                    worksheet = workbook.add_worksheet()
+                    worksheet.write_row(0, 0, header)
+                    row_index = 0
+                row_index += 1
+                worksheet.write_row(row_index, 0, row)
+        if worksheet is None:
+            workbook.add_worksheet().write_row(0, 0, header)
+        workbook.close()
+
+        output.seek(0)
+        while True:
+            chunk = output.read(FILE_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+# Формат -> (Content-Type, расширение файла, писатель)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv', csv_chunks),
+    'ndjson': ('application/x-ndjson', 'ndjson', ndjson_chunks),
+}
+if xlsxwriter:
+    EXPORT_FORMATS['xlsx'] = ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx', xlsx_chunks)
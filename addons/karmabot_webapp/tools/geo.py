@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Сеточный индекс координат для поиска ближайших партнеров.
+
+Координаты раскладываются по ячейкам GEO_CELL_DEGREES x GEO_CELL_DEGREES
+градусов, номер ячейки - одно целое число с btree-индексом. Поиск в радиусе
+перебирает только ячейки ограничивающего прямоугольника, затем уточняет
+расстояния по гаверсинусу (векторно через numpy, если он установлен).
+"""
+
+import logging
+import math
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EARTH_RADIUS_KM = 6371.0088
+GEO_CELL_DEGREES = 0.05
+GEO_MAX_RADIUS_KM = 100.0
+
+_LAT_CELLS = int(round(180 / GEO_CELL_DEGREES))
+_LON_CELLS = int(round(360 / GEO_CELL_DEGREES))
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def _lat_index(latitude):
+    return min(int((latitude + 90) // GEO_CELL_DEGREES), _LAT_CELLS - 1)
+
+
+def _lon_index(longitude):
+    return int((longitude + 180) // GEO_CELL_DEGREES) % _LON_CELLS
+
+
+def geo_cell(latitude, longitude):
+    """Номер ячейки сетки для координат"""
+    if latitude is None or longitude is None:
+        return None
+    return _lat_index(latitude) * _LON_CELLS + _lon_index(longitude)
+
+
+def cells_in_radius(latitude, longitude, radius_km):
+    """Ячейки, покрывающие круг радиуса radius_km вокруг точки"""
+    radius_km = min(radius_km, GEO_MAX_RADIUS_KM)
+    lat_delta = radius_km / _KM_PER_DEGREE
+    lat_from = _lat_index(max(latitude - lat_delta, -90))
+    lat_to = _lat_index(min(latitude + lat_delta, 90))
+
+    # Долготный размах берется по широте, ближайшей к полюсу
+    widest_lat = min(abs(latitude) + lat_delta, 89.9)
+    lon_delta = radius_km / (_KM_PER_DEGREE * math.cos(math.radians(widest_lat)))
+    lon_steps = int(math.ceil(lon_delta / GEO_CELL_DEGREES))
+    if 2 * lon_steps + 1 >= _LON_CELLS:
+        lon_indexes = range(_LON_CELLS)
+    else:
+        center = _lon_index(longitude)
+        lon_indexes = sorted({(center + step) % _LON_CELLS for step in range(-lon_steps, lon_steps + 1)})
+
+    return [lat_index * _LON_CELLS + lon_index
+            for lat_index in range(lat_from, lat_to + 1)
+            for lon_index in lon_indexes]
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Расстояния от точки до списка точек в километрах"""
+    if numpy is not None:
+        lat1 = numpy.radians(latitude)
+        lat2 = numpy.radians(numpy.asarray(latitudes, dtype=float))
+        dlat = lat2 - lat1
+        dlon = numpy.radians(numpy.asarray(longitudes, dtype=float) - longitude)
+        a = numpy.sin(dlat / 2) ** 2 + math.cos(lat1) * numpy.cos(lat2) * numpy.sin(dlon / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))).tolist()
+
+    lat1 = math.radians(latitude)
+    cos_lat1 = math.cos(lat1)
+    distances = []
+    for lat, lon in zip(latitudes, longitudes):
+        lat2 = math.radians(lat)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * math.cos(lat2) * math.sin(math.radians(lon - longitude) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+    return distances
+
+
+class GeoSnapshot:
+    """Снимок активных точек в памяти воркера, сгруппированный по ячейкам"""
+
+    def __init__(self, rows):
+        self.cells = {}
+        for row in rows:
+            self.cells.setdefault(geo_cell(row[2], row[3]), []).append(row)
+        self.size = len(rows)
+
+    def nearby(self, latitude, longitude, radius_km, limit=20):
+        """Вернуть [(расстояние, строка)] в радиусе, по возрастанию расстояния"""
+        candidates = []
+        for cell in cells_in_radius(latitude, longitude, radius_km):
+            candidates.extend(self.cells.get(cell, ()))
+        return refine_nearby(candidates, latitude, longitude, radius_km, limit)
+
+
+def refine_nearby(rows, latitude, longitude, radius_km, limit=20):
+    """Точное уточнение кандидатов: строки (id, name, latitude, longitude, ...)"""
+    if not rows:
+        return []
+    distances = haversine_km(latitude, longitude, [row[2] for row in rows], [row[3] for row in rows])
+    found = sorted((distance, row) for distance, row in zip(distances, rows) if distance <= radius_km)
+    return found[:limit]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Сериализация и сжатие ответов JSON API.
+
+При наличии orjson используется он (даты и время он сериализует сам), иначе -
+стандартный json. Ответы больше COMPRESS_MIN_SIZE сжимаются brotli или gzip
+в зависимости от заголовка Accept-Encoding клиента.
+"""
+
+import datetime
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data):
+    """Сериализовать в компактный JSON (bytes)"""
+    if orjson:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def loads(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def project(data, fields):
+    """Оставить только запрошенные клиентом поля; без списка данные не меняются"""
+    if not fields or not isinstance(fields, (list, tuple)):
+        return data
+    return {key: data[key] for key in fields if key in data}
+
+
+def negotiate_encoding(accept_encoding):
+    """Выбрать кодирование по Accept-Encoding: brotli, если доступен, затем gzip"""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _sep, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    candidates = (['br'] if brotli else []) + ['gzip']
+    candidates = [name for name in candidates if accepted.get(name, accepted.get('*', 0)) > 0]
+    return max(candidates, key=lambda name: accepted.get(name, accepted.get('*', 0)), default=None)
+
+
+def encode_body(body, accept_encoding, min_size=COMPRESS_MIN_SIZE):
+    """Сжать тело ответа, если оно достаточно большое; вернуть (тело, кодирование)"""
+    if len(body) < min_size:
+        return body, None
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY), encoding
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), encoding
+    return body, None
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Ограничение частоты запросов к публичным маршрутам WebApp.
+
+Ведра токенов хранятся в памяти воркера в OrderedDict с вытеснением давно
+неиспользуемых ключей. При наличии redis и параметра karmabot_rate_limit_redis
+в конфигурации Odoo ограничения становятся общими для всех воркеров.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Префикс маршрута -> (токенов в секунду, размер ведра) для одного telegram_id.
+# Для IP лимит умножается на IP_LIMIT_FACTOR: за одним адресом бывает много клиентов.
+DEFAULT_ROUTE_LIMITS = {
+    '/webapp/api/': (2.0, 10),
+    '/karmabot/webapp/register': (0.1, 3),
+    '/karmabot/webapp/scan': (1.0, 5),
+    '/karmabot/webapp': (5.0, 20),
+    '/karmabot/sso/': (1.0, 5),
+    '/telegram/auth': (0.2, 5),
+}
+IP_LIMIT_FACTOR = 10
+
+
+def parse_route_limits(value):
+    """Разобрать строку вида "/prefix:rate:burst,/other:rate:burst" """
+    limits = dict(DEFAULT_ROUTE_LIMITS)
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        try:
+            prefix, rate, burst = item.rsplit(':', 2)
+            limits[prefix] = (float(rate), int(burst))
+        except ValueError:
+            _logger.warning(f"Ignoring invalid rate limit definition {item!r}")
+    # Более длинные префиксы проверяются первыми
+    return sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+
+def match_route_limit(route_limits, path):
+    for prefix, limit in route_limits:
+        if path.startswith(prefix):
+            return prefix, limit
+    return None, None
+
+
+class TokenBucketLimiter:
+    """Ведра токенов в памяти процесса с LRU-вытеснением"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key, rate, burst, now=None):
+        """Списать токен для ключа; вернуть False, если ведро пусто"""
+        now = now or time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = burst
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                self._buckets.move_to_end(key)
+
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            return allowed
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RedisTokenBucketLimiter:
+    """Общие для всех воркеров ведра токенов в redis"""
+
+    SCRIPT = """
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local tokens = tonumber(bucket[1])
+        if tokens == nil then
+            tokens = burst
+        else
+            tokens = math.min(burst, tokens + (now - tonumber(bucket[2])) * rate)
+        end
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+        redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+        return allowed
+    """
+
+    def __init__(self, url, fallback):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        self.script = self.client.register_script(self.SCRIPT)
+        self.fallback = fallback
+
+    def allow(self, key, rate, burst, now=None):
+        try:
+            return bool(self.script(keys=[f"karmabot:rl:{key}"], args=[rate, burst, now or time.time()]))
+        except redis.RedisError as e:
+            _logger.warning(f"Shared rate limiter unavailable, using local buckets: {e}")
+            return self.fallback.allow(key, rate, burst)
+
+
+def make_limiter(redis_url=None, max_keys=100000):
+    """Создать ограничитель: общий в redis, если настроен, иначе локальный"""
+    local = TokenBucketLimiter(max_keys=max_keys)
+    if redis_url:
+        if redis is None:
+            _logger.warning("karmabot_rate_limit_redis is set but python redis is not installed")
+        else:
+            return RedisTokenBucketLimiter(redis_url, local)
+    return local
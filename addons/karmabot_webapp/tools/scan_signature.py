@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Подписанные данные QR-сканов и защита от повторов.
+
+Токен скана - base64url от 20 байт данных (card_id, partner_id, expiry, nonce)
+и 16 байт усеченного HMAC-SHA256. Проверка выполняется только в памяти, без
+обращения к базе данных.
+"""
+
+import base64
+import collections
+import hashlib
+import hmac
+import logging
+import os
+import struct
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+PAYLOAD_STRUCT = struct.Struct('>III8s')
+SIGNATURE_SIZE = 16
+TOKEN_SIZE = PAYLOAD_STRUCT.size + SIGNATURE_SIZE
+
+# Запись журнала nonce: срок действия + nonce
+LOG_RECORD = struct.Struct('>I8s')
+
+ScanPayload = collections.namedtuple('ScanPayload', ['card_id', 'partner_id', 'expiry', 'nonce'])
+
+
+def _sign(key, body):
+    return hmac.new(key, body, hashlib.sha256).digest()[:SIGNATURE_SIZE]
+
+
+def issue_scan_token(key, card_id, partner_id, ttl=300, now=None):
+    """Выпустить подписанный токен скана"""
+    expiry = int(now or time.time()) + ttl
+    body = PAYLOAD_STRUCT.pack(card_id, partner_id, expiry, os.urandom(8))
+    return base64.urlsafe_b64encode(body + _sign(key, body)).rstrip(b'=').decode()
+
+
+def verify_scan_token(key, token, now=None):
+    """Проверить подпись и срок действия токена, вернуть ScanPayload или None"""
+    if not token or len(token) > 64:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (ValueError, TypeError):
+        return None
+    if len(raw) != TOKEN_SIZE:
+        return None
+
+    body, signature = raw[:PAYLOAD_STRUCT.size], raw[PAYLOAD_STRUCT.size:]
+    if not hmac.compare_digest(signature, _sign(key, body)):
+        return None
+
+    payload = ScanPayload(*PAYLOAD_STRUCT.unpack(body))
+    if payload.expiry < int(now or time.time()):
+        return None
+    return payload
+
+
+class NonceRegistry:
+    """Множество использованных nonce, разбитое на временные корзины.
+
+    Nonce хранится в корзине своего срока действия, поэтому проверка смотрит
+    ровно одну корзину, а устаревшие корзины удаляются целиком. Журнал на диске
+    разбит на файлы по окнам срока действия: воркеры дописывают в них записи
+    по 12 байт, а устаревшие файлы просто удаляются, без перезаписи.
+    """
+
+    def __init__(self, log_dir=None, bucket_seconds=60, log_window_seconds=3600):
+        self.log_dir = log_dir
+        self.bucket_seconds = bucket_seconds
+        self.log_window_seconds = log_window_seconds
+        self._buckets = {}
+        self._logs = {}
+        self._lock = threading.Lock()
+        if log_dir:
+            self._load()
+
+    def _bucket(self, expiry):
+        return expiry // self.bucket_seconds
+
+    def _log_path(self, window):
+        return os.path.join(self.log_dir, f"{window}.nonces")
+
+    def _load(self):
+        now = int(time.time())
+        os.makedirs(self.log_dir, exist_ok=True)
+        for name in os.listdir(self.log_dir):
+            window, ext = os.path.splitext(name)
+            if ext != '.nonces' or not window.isdigit():
+                continue
+            path = os.path.join(self.log_dir, name)
+            if (int(window) + 1) * self.log_window_seconds <= now:
+                self._remove_log(path)
+                continue
+            with open(path, 'rb') as log:
+                data = log.read()
+            usable = len(data) - len(data) % LOG_RECORD.size
+            for expiry, nonce in LOG_RECORD.iter_unpack(data[:usable]):
+                if expiry >= now:
+                    self._buckets.setdefault(self._bucket(expiry), set()).add(nonce)
+
+    def _remove_log(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _expire(self, now):
+        oldest = self._bucket(now)
+        for bucket in [bucket for bucket in self._buckets if bucket < oldest]:
+            del self._buckets[bucket]
+
+        current_window = now // self.log_window_seconds
+        for window in [window for window in self._logs if window < current_window]:
+            self._logs.pop(window).close()
+            self._remove_log(self._log_path(window))
+
+    def _append(self, nonce, expiry):
+        window = expiry // self.log_window_seconds
+        log = self._logs.get(window)
+        if log is None:
+            log = self._logs[window] = open(self._log_path(window), 'ab', buffering=0)
+        log.write(LOG_RECORD.pack(expiry, nonce))
+
+    def is_used(self, nonce, expiry):
+        """Проверить, использован ли nonce, не регистрируя его"""
+        with self._lock:
+            return nonce in self._buckets.get(self._bucket(expiry), ())
+
+    def register(self, nonce, expiry, now=None):
+        """Зарегистрировать nonce; вернуть False, если он уже использован"""
+        now = int(now or time.time())
+        bucket = self._bucket(expiry)
+        with self._lock:
+            nonces = self._buckets.get(bucket)
+            if nonces is None:
+                self._expire(now)
+                nonces = self._buckets[bucket] = set()
+            elif nonce in nonces:
+                return False
+            nonces.add(nonce)
+
+            if self.log_dir:
+                try:
+                    self._append(nonce, expiry)
+                except OSError as e:
+                    _logger.warning(f"Cannot write scan nonce log in {self.log_dir}: {e}")
+        return True
+
+    def __len__(self):
+        return sum(len(nonces) for nonces in self._buckets.values())
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Проверка initData Telegram WebApp.
+
+Секретный ключ - HMAC-SHA256 от токена бота с ключом "WebAppData"; он
+вычисляется один раз и кэшируется вызывающей стороной. Проверка подписи
+требует одного HMAC и не обращается к базе данных.
+"""
+
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import parse_qsl
+
+
+def derive_secret_key(bot_token):
+    """Вычислить секретный ключ проверки initData по токену бота"""
+    return hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+
+
+def verify_init_data(init_data, secret_key, max_age=86400, now=None):
+    """Проверить подпись initData и вернуть данные пользователя Telegram или None"""
+    if not init_data or not secret_key:
+        return None
+    try:
+        fields = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+    except ValueError:
+        return None
+
+    received_hash = fields.pop('hash', None)
+    if not received_hash:
+        return None
+
+    data_check_string = '\n'.join(f"{key}={fields[key]}" for key in sorted(fields))
+    expected_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(received_hash, expected_hash):
+        return None
+
+    try:
+        auth_date = int(fields.get('auth_date', 0))
+        user = json.loads(fields.get('user') or '{}')
+    except ValueError:
+        return None
+    if max_age and auth_date < int(now or time.time()) - max_age:
+        return None
+    if not user.get('id'):
+        return None
+    return user
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Скользящие счетчики частоты сканов для антифрод-правил.
+
+Окно правила делится на VELOCITY_BUCKETS корзин фиксированной длины; для
+каждого ключа хранится компактный массив счетчиков и их сумма. Проверка и
+учет скана - O(1) на правило: устаревшие корзины обнуляются при сдвиге.
+
+Счетчики живут в памяти воркера. Воркер периодически сохраняет снимок в
+файл, а новый воркер подхватывает снимки завершившихся процессов, чтобы
+перезапуск не обнулял окна.
+"""
+
+import array
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+VELOCITY_BUCKETS = 12
+VELOCITY_MAX_KEYS = 200000
+VELOCITY_SNAPSHOT_INTERVAL = 30
+
+# Измерение -> поля скана, образующие ключ
+VELOCITY_DIMENSIONS = {
+    'user': ('user_id',),
+    'partner': ('partner_id',),
+    'card': ('card_id',),
+    'user_partner': ('user_id', 'partner_id'),
+}
+
+# "измерение:окно в секундах:лимит"
+DEFAULT_VELOCITY_RULES = 'user:60:20,user_partner:60:10,user:3600:200,card:60:300,partner:60:1000'
+
+
+class VelocityRule:
+
+    def __init__(self, dimension, window, limit):
+        self.dimension = dimension
+        self.window = window
+        self.limit = limit
+        self.bucket_seconds = window / VELOCITY_BUCKETS
+        self.name = f"{dimension}:{window}:{limit}"
+
+    def key(self, scan):
+        return (self.name,) + tuple(scan[field] for field in VELOCITY_DIMENSIONS[self.dimension])
+
+
+def parse_velocity_rules(value):
+    """Разобрать строку вида "user:60:20,partner:60:1000" """
+    rules = []
+    for item in filter(None, (part.strip() for part in (value or DEFAULT_VELOCITY_RULES).split(','))):
+        try:
+            dimension, window, limit = item.split(':')
+            if dimension not in VELOCITY_DIMENSIONS:
+                raise ValueError(dimension)
+            rules.append(VelocityRule(dimension, int(window), int(limit)))
+        except ValueError:
+            _logger.warning(f"Ignoring invalid velocity rule {item!r}")
+    return rules
+
+
+class VelocityEngine:
+    """Набор правил и скользящих счетчиков по ключам с LRU-вытеснением"""
+
+    def __init__(self, rules, max_keys=VELOCITY_MAX_KEYS):
+        self.rules = rules
+        self.max_keys = max_keys
+        # ключ -> [номер последней корзины, сумма, array счетчиков]
+        self._counters = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _advance(self, counter, bucket):
+        shift = bucket - counter[0]
+        if shift <= 0:
+            return
+        counts = counter[2]
+        if shift >= VELOCITY_BUCKETS:
+            for index in range(VELOCITY_BUCKETS):
+                counts[index] = 0
+            counter[1] = 0
+        else:
+            for step in range(1, shift + 1):
+                index = (counter[0] + step) % VELOCITY_BUCKETS
+                counter[1] -= counts[index]
+                counts[index] = 0
+        counter[0] = bucket
+
+    def _counter(self, key, bucket, create):
+        counter = self._counters.get(key)
+        if counter is None:
+            if not create:
+                return None
+            counter = [bucket, 0, array.array('I', bytes(4 * VELOCITY_BUCKETS))]
+            self._counters[key] = counter
+            if len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+        else:
+            self._counters.move_to_end(key)
+            self._advance(counter, bucket)
+        return counter
+
+    def _check(self, scan, now):
+        violated = []
+        for rule in self.rules:
+            counter = self._counter(rule.key(scan), int(now // rule.bucket_seconds), create=False)
+            if counter and counter[1] + 1 > rule.limit:
+                violated.append(rule.name)
+        return violated
+
+    def _record(self, scan, now):
+        for rule in self.rules:
+            bucket = int(now // rule.bucket_seconds)
+            counter = self._counter(rule.key(scan), bucket, create=True)
+            counter[1] += 1
+            counter[2][bucket % VELOCITY_BUCKETS] += 1
+
+    def check(self, scan, now=None):
+        """Вернуть имена правил, которые нарушит скан, не учитывая его"""
+        with self._lock:
+            return self._check(scan, now or time.time())
+
+    def record(self, scan, now=None):
+        """Учесть скан во всех окнах"""
+        with self._lock:
+            self._record(scan, now or time.time())
+
+    def hit(self, scan, now=None):
+        """Проверить правила для скана; если ни одно не нарушено, учесть скан.
+
+        Возвращает список имен нарушенных правил.
+        """
+        now = now or time.time()
+        with self._lock:
+            violated = self._check(scan, now)
+            if not violated:
+                self._record(scan, now)
+            return violated
+
+    def count(self, rule, scan, now=None):
+        now = now or time.time()
+        with self._lock:
+            counter = self._counter(rule.key(scan), int(now // rule.bucket_seconds), create=False)
+            return counter[1] if counter else 0
+
+    # === Снимки ===
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), counter[0], counter[2].tolist()] for key, counter in self._counters.items()]
+
+    def load(self, entries, now=None):
+        """Добавить счетчики из снимка; устаревшие корзины отбрасываются"""
+        now = now or time.time()
+        rules = {rule.name: rule for rule in self.rules}
+        with self._lock:
+            for key, bucket, counts in entries:
+                rule = rules.get(key[0])
+                if rule is None or len(counts) != VELOCITY_BUCKETS:
+                    continue
+                loaded = [bucket, sum(counts), array.array('I', counts)]
+                self._advance(loaded, int(now // rule.bucket_seconds))
+                if not loaded[1]:
+                    continue
+                counter = self._counter(tuple(key), loaded[0], create=True)
+                for index in range(VELOCITY_BUCKETS):
+                    counter[2][index] += loaded[2][index]
+                counter[1] += loaded[1]
+
+
+class VelocitySnapshots:
+    """Файлы снимков счетчиков: по одному на процесс"""
+
+    def __init__(self, snapshot_dir):
+        self.snapshot_dir = snapshot_dir
+        self.path = os.path.join(snapshot_dir, f"{os.getpid()}.json")
+        self.saved_at = time.time()
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+    def restore(self, engine, max_age=86400):
+        """Загрузить снимки завершившихся процессов и удалить их файлы"""
+        for name in os.listdir(self.snapshot_dir):
+            pid = name.split('.')[0]
+            if not pid.isdigit() or int(pid) == os.getpid() or _pid_alive(int(pid)):
+                continue
+            path = os.path.join(self.snapshot_dir, name)
+            try:
+                if os.path.getmtime(path) > time.time() - max_age:
+                    with open(path) as snapshot:
+                        engine.load(json.load(snapshot))
+                os.unlink(path)
+            except (OSError, ValueError) as e:
+                _logger.warning(f"Cannot restore velocity snapshot {path}: {e}")
+
+    def maybe_save(self, engine, interval=VELOCITY_SNAPSHOT_INTERVAL):
+        if time.time() - self.saved_at < interval:
+            return
+        self.saved_at = time.time()
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as snapshot:
+                json.dump(engine.dump(), snapshot, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            _logger.warning(f"Cannot save velocity snapshot {self.path}: {e}")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Генератор синтетических данных KarmaBot для нагрузочного тестирования.
+
+Заполняет karmabot_user, karmabot_partner_card, karmabot_loyalty_transaction,
+karmabot_webapp_session и karmabot_sso_token через COPY. Строки генерируются
+потоком, поэтому память не зависит от масштаба (1k - 10M пользователей).
+
+Подключение берется из тех же переменных, что и в start.sh (PGHOST, PGPORT,
+PGUSER, PGPASSWORD, PGDATABASE).
+
+    python3 scripts/generate_data.py --users 100000
+"""
+
+import argparse
+import datetime
+import hashlib
+import logging
+import os
+import random
+import time
+
+_logger = logging.getLogger('karmabot.generate_data')
+
+# Синтетические пользователи получают telegram_id начиная с этого значения,
+# чтобы нагрузочный тест мог выбирать их без запросов к базе
+TELEGRAM_ID_BASE = 9000000000
+
+CITIES = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань',
+          'Нижний Новгород', 'Самара', 'Ростов-на-Дону', 'Краснодар', 'Пермь']
+ROLES = [('user', 0.97), ('partner', 0.025), ('admin', 0.004), ('super_admin', 0.001)]
+TRANSACTION_TYPES = [('earn', 0.7), ('spend', 0.2), ('bonus', 0.08), ('penalty', 0.02)]
+SESSION_TYPES = ['user_cabinet', 'partner_cabinet', 'admin_cabinet', 'super_admin_cabinet']
+
+
+def _weighted(rng, choices):
+    value = rng.random()
+    for choice, weight in choices:
+        value -= weight
+        if value <= 0:
+            return choice
+    return choices[-1][0]
+
+
+def _escape(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+class RowStream:
+    """Файлоподобный объект для COPY, читающий строки из генератора"""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = b''
+
+    def read(self, size=65536):
+        while len(self._buffer) < size:
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                break
+            self._buffer += ('\t'.join(_escape(value) for value in row) + '\n').encode()
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    readline = read
+
+
+class Generator:
+
+    def __init__(self, conn, args):
+        self.conn = conn
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.now = datetime.datetime.utcnow().replace(microsecond=0)
+        self.start = self.now - datetime.timedelta(days=args.days)
+
+    def _reserve_ids(self, table, count):
+        """Зарезервировать блок id в последовательности таблицы"""
+        with self.conn.cursor() as cr:
+            cr.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+            sequence = cr.fetchone()[0]
+            cr.execute("SELECT nextval(%s)", (sequence,))
+            first_id = cr.fetchone()[0]
+            cr.execute("SELECT setval(%s, %s)", (sequence, first_id + count - 1))
+        return first_id
+
+    def _copy(self, table, columns, rows, count):
+        started = time.time()
+        with self.conn.cursor() as cr:
+            cr.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+                RowStream(rows),
+            )
+        self.conn.commit()
+        elapsed = time.time() - started
+        _logger.info("%s: %d rows in %.1fs (%.0f rows/s)", table, count, elapsed, count / max(elapsed, 0.001))
+
+    def _random_date(self):
+        return self.start + datetime.timedelta(seconds=self.rng.randrange(self.args.days * 86400))
+
+    def generate_partners(self):
+        count = self.args.partners
+        first_id = self._reserve_ids('res_partner', count)
+        self.partner_ids = (first_id, first_id + count)
+
+        def rows():
+            for i in range(count):
+                name = f"Partner {i}"
+                yield (first_id + i, name, name, True, True, 'contact', self.now, self.now)
+
+        self._copy('res_partner', ['id', 'name', 'complete_name', 'active', 'is_company', 'type',
+                                   'create_date', 'write_date'], rows(), count)
+
+    def generate_users(self):
+        count = self.args.users
+        first_id = self._reserve_ids('karmabot_user', count)
+        self.user_ids = (first_id, first_id + count)
+        partner_first = self.partner_ids[0]
+
+        def rows():
+            rng = self.rng
+            for i in range(count):
+                registered = self._random_date()
+                name = f"User {i}"
+                points = rng.randrange(2000)
+                role = _weighted(rng, ROLES)
+                partner_id = partner_first + i % self.args.partners if role == 'partner' else None
+                yield (
+                    first_id + i, str(TELEGRAM_ID_BASE + i), name, name, f"user{i}",
+                    f"+7900{i:07d}", f"user{i}@example.com", rng.choice(CITIES), role, partner_id,
+                    True, rng.random() < 0.3, points, rng.randrange(points + 1), rng.randrange(50),
+                    rng.randrange(100), rng.randrange(5), registered,
+                    registered + datetime.timedelta(seconds=rng.randrange(86400 * 30)), registered, registered,
+                )
+
+        self._copy('karmabot_user', [
+            'id', 'telegram_id', 'display_name', 'name', 'telegram_username', 'phone', 'email', 'city', 'role',
+            'partner_id', 'is_active', 'is_verified', 'total_points', 'available_points', 'pending_points', 'total_scans',
+            'total_referrals', 'registration_date', 'last_activity', 'create_date', 'write_date',
+        ], rows(), count)
+
+    def generate_cards(self):
+        count = self.args.partners * self.args.cards_per_partner
+        first_id = self._reserve_ids('karmabot_partner_card', count)
+        self.card_ids = (first_id, first_id + count)
+        partner_first = self.partner_ids[0]
+
+        def rows():
+            rng = self.rng
+            for i in range(count):
+                created = self._random_date()
+                status = 'active' if rng.random() < 0.8 else rng.choice(['pending', 'inactive', 'rejected'])
+                yield (
+                    first_id + i, f"Card {i}", partner_first + i // self.args.cards_per_partner,
+                    f"KB{i:010d}", status, f"/karmabot/webapp?card={i}", created,
+                    created if status == 'active' else None, created,
+                )
+
+        self._copy('karmabot_partner_card', [
+            'id', 'name', 'partner_id', 'card_number', 'status', 'webapp_url', 'create_date',
+            'activation_date', 'write_date',
+        ], rows(), count)
+
+    def generate_transactions(self):
+        count = self.args.users * self.args.transactions_per_user
+        user_first, user_last = self.user_ids
+        card_first, card_last = self.card_ids
+        cards_per_partner = self.args.cards_per_partner
+        partner_first = self.partner_ids[0]
+
+        def rows():
+            rng = self.rng
+            for _i in range(count):
+                card_id = rng.randrange(card_first, card_last)
+                created = self._random_date()
+                yield (
+                    rng.randrange(user_first, user_last), _weighted(rng, TRANSACTION_TYPES), rng.randrange(1, 200),
+                    'synthetic', partner_first + (card_id - card_first) // cards_per_partner, card_id,
+                    created, 'completed', created, created,
+                )
+
+        self._copy('karmabot_loyalty_transaction', [
+            'user_id', 'transaction_type', 'points', 'reason', 'partner_id', 'card_id', 'transaction_date',
+            'status', 'create_date', 'write_date',
+        ], rows(), count)
+
+    def generate_sessions(self):
+        count = self.args.users * self.args.sessions_per_user
+        user_first, user_last = self.user_ids
+
+        def rows():
+            rng = self.rng
+            for _i in range(count):
+                started = self._random_date()
+                last_activity = started + datetime.timedelta(seconds=rng.randrange(3600))
+                active = last_activity > self.now - datetime.timedelta(hours=1)
+                yield (
+                    rng.randrange(user_first, user_last), rng.choice(SESSION_TYPES),
+                    f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}", 'Telegram WebApp',
+                    active, started, last_activity, None if active else last_activity, started, started,
+                )
+
+        self._copy('karmabot_webapp_session', [
+            'user_id', 'session_type', 'ip_address', 'user_agent', 'is_active', 'start_time', 'last_activity',
+            'end_time', 'create_date', 'write_date',
+        ], rows(), count)
+
+    def generate_tokens(self):
+        count = self.args.users * self.args.tokens_per_user
+        user_first, user_last = self.user_ids
+
+        def rows():
+            rng = self.rng
+            for i in range(count):
+                user_id = rng.randrange(user_first, user_last)
+                created = self._random_date()
+                timestamp = int(created.timestamp())
+                token_hash = hashlib.sha256(f"{user_id}:{timestamp}:{i}".encode()).hexdigest()[:32]
+                expires_at = created + datetime.timedelta(hours=24)
+                yield (
+                    f"{user_id}:{timestamp}:{token_hash}", user_id, 'webapp_sso', expires_at > self.now,
+                    expires_at, created, created,
+                )
+
+        self._copy('karmabot_sso_token', [
+            'token', 'user_id', 'token_type', 'is_active', 'expires_at', 'create_date', 'write_date',
+        ], rows(), count)
+
+    def run(self):
+        self.generate_partners()
+        self.generate_users()
+        self.generate_cards()
+        self.generate_transactions()
+        self.generate_sessions()
+        self.generate_tokens()
+
+        self.conn.autocommit = True
+        with self.conn.cursor() as cr:
+            for table in ('res_partner', 'karmabot_user', 'karmabot_partner_card', 'karmabot_loyalty_transaction',
+                          'karmabot_webapp_session', 'karmabot_sso_token'):
+                cr.execute(f"ANALYZE {table}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--partners', type=int, default=0, help='default: 1%% of users')
+    parser.add_argument('--cards-per-partner', type=int, default=2)
+    parser.add_argument('--transactions-per-user', type=int, default=20)
+    parser.add_argument('--sessions-per-user', type=int, default=5)
+    parser.add_argument('--tokens-per-user', type=int, default=3)
+    parser.add_argument('--days', type=int, default=365, help='history length')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dsn', default='', help='libpq connection string, overrides PG* variables')
+    args = parser.parse_args()
+    args.partners = args.partners or max(args.users // 100, 1)
+
+    import psycopg2
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    conn = psycopg2.connect(args.dsn or f"dbname={os.environ.get('PGDATABASE', 'odoo')}")
+    try:
+        Generator(conn, args).run()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
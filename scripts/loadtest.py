@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Нагрузочный тест маршрутов KarmaBot WebApp.
+
+Воспроизводит смесь запросов (heartbeat, user-info, история, страницы
+кабинета) от синтетических пользователей, созданных generate_data.py, и
+выводит пропускную способность и перцентили задержки по каждому маршруту.
+
+    python3 scripts/loadtest.py --url http://localhost:8069 --users 100000 --duration 60
+"""
+
+import argparse
+import collections
+import http.client
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+from generate_data import TELEGRAM_ID_BASE
+
+# Маршрут -> (вес в смеси, метод, путь)
+TRAFFIC_MIX = {
+    'heartbeat': (50, 'json', '/webapp/api/heartbeat'),
+    'user-info': (20, 'json', '/webapp/api/user-info'),
+    'history': (10, 'http', '/karmabot/webapp/history'),
+    'cabinet': (10, 'http', '/karmabot/webapp'),
+    'statistics': (5, 'http', '/karmabot/webapp/statistics'),
+    'referrals': (5, 'http', '/karmabot/webapp/referrals'),
+}
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    index = min(int(round(percent / 100.0 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+class Worker(threading.Thread):
+
+    def __init__(self, args, routes, weights, deadline, results, lock, seed):
+        super().__init__(daemon=True)
+        self.args = args
+        self.routes = routes
+        self.weights = weights
+        self.deadline = deadline
+        self.results = results
+        self.lock = lock
+        self.rng = random.Random(seed)
+        url = urllib.parse.urlsplit(args.url)
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(url.hostname, url.port, timeout=args.timeout)
+
+    def _request(self, kind, path, telegram_id):
+        if kind == 'json':
+            token = f"{telegram_id}:{int(time.time())}:loadtest"
+            body = json.dumps({'jsonrpc': '2.0', 'method': 'call', 'params': {'sso_token': token}})
+            self.connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+        else:
+            self.connection.request('GET', f"{path}?{urllib.parse.urlencode({'user_id': telegram_id})}")
+        response = self.connection.getresponse()
+        response.read()
+        return response.status
+
+    def run(self):
+        local = collections.defaultdict(list)
+        errors = collections.Counter()
+        while time.time() < self.deadline:
+            route = self.rng.choices(self.routes, self.weights)[0]
+            _weight, kind, path = TRAFFIC_MIX[route]
+            telegram_id = TELEGRAM_ID_BASE + self.rng.randrange(self.args.users)
+            started = time.perf_counter()
+            try:
+                status = self._request(kind, path, telegram_id)
+            except (OSError, http.client.HTTPException):
+                status = None
+                self.connection.close()
+            local[route].append(time.perf_counter() - started)
+            if status != 200:
+                errors[route] += 1
+
+        with self.lock:
+            for route, latencies in local.items():
+                self.results['latencies'][route].extend(latencies)
+            self.results['errors'].update(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8069')
+    parser.add_argument('--users', type=int, default=10000, help='number of synthetic users to pick from')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=int, default=30, help='seconds')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--routes', default=','.join(TRAFFIC_MIX), help='comma separated subset of routes')
+    parser.add_argument('--json', dest='json_output', help='write the report to this file as JSON')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    routes = [route for route in args.routes.split(',') if route in TRAFFIC_MIX]
+    weights = [TRAFFIC_MIX[route][0] for route in routes]
+    results = {'latencies': collections.defaultdict(list), 'errors': collections.Counter()}
+    lock = threading.Lock()
+
+    started = time.time()
+    deadline = started + args.duration
+    workers = [Worker(args, routes, weights, deadline, results, lock, args.seed + i) for i in range(args.concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - started
+
+    report = {}
+    print(f"{'route':<12} {'requests':>9} {'rps':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+    for route in routes:
+        latencies = sorted(results['latencies'].get(route, []))
+        row = {
+            'requests': len(latencies),
+            'rps': len(latencies) / elapsed,
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p90_ms': _percentile(latencies, 90) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+            'errors': results['errors'][route],
+        }
+        report[route] = row
+        print(f"{route:<12} {row['requests']:>9} {row['rps']:>8.1f} {row['p50_ms']:>8.1f} {row['p90_ms']:>8.1f} "
+              f"{row['p99_ms']:>8.1f} {row['max_ms']:>8.1f} {row['errors']:>7}")
+
+    if args.json_output:
+        with open(args.json_output, 'w') as output:
+            json.dump({'duration': elapsed, 'concurrency': args.concurrency, 'routes': report}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,10 @@ db_port = $PGPORT
 db_user = $PGUSER
 db_password = $PGPASSWORD
 db_name = $PGDATABASE
+# Необязательная реплика для чтения; пустой хост - все запросы идут в основную базу
+karmabot_replica_host = $PGREPLICA_HOST
+karmabot_replica_port = ${PGREPLICA_PORT:-$PGPORT}
+karmabot_replica_maxconn = ${PGREPLICA_MAXCONN:-16}
 EOF
 
 # Запустить Odoo